@@ -0,0 +1,135 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from lru import CacheLRU
+import metricas
+
+logger = logging.getLogger("bot")
+
+# === Configuración ===
+# Ráfaga = mensajes seguidos permitidos; por minuto = ritmo sostenido. 0 desactiva el límite.
+# Solo cuentan los mensajes que van al modelo (no los del parser local ni los de la cache).
+ADMISION_CHAT_RAFAGA = float(os.getenv("ADMISION_CHAT_RAFAGA", "6"))
+ADMISION_CHAT_POR_MINUTO = float(os.getenv("ADMISION_CHAT_POR_MINUTO", "20"))
+ADMISION_GRUPO_RAFAGA = float(os.getenv("ADMISION_GRUPO_RAFAGA", "15"))
+ADMISION_GRUPO_POR_MINUTO = float(os.getenv("ADMISION_GRUPO_POR_MINUTO", "60"))
+ADMISION_MAX_CLAVES = int(os.getenv("ADMISION_MAX_CLAVES", "50000"))
+LLM_CONCURRENCIA = int(os.getenv("LLM_CONCURRENCIA", "8"))        # llamadas al modelo en vuelo; 0 = sin límite
+LLM_ESPERA_MAX = float(os.getenv("LLM_ESPERA_MAX", "10"))         # s esperando turno antes de desistir
+
+class Saturado(Exception):
+    """
+    No hubo turno para llamar al modelo dentro de LLM_ESPERA_MAX.
+    """
+
+class _Cubeta:
+    """
+    Token bucket sin deuda: tomar() consume un token si hay y si no, rechaza.
+    """
+
+    def __init__(self, tasa: float, capacidad: float):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.tokens = capacidad
+        self.ultimo = time.monotonic()
+
+    def tomar(self) -> bool:
+        ahora = time.monotonic()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class _Limite:
+    """
+    Una cubeta por clave (chat_id o group_code). Las cubetas inactivas expiran
+    cuando ya se habrían llenado, así que olvidarlas no cambia nada.
+    """
+
+    def __init__(self, rafaga: float, por_minuto: float, max_claves: int):
+        self.rafaga = rafaga
+        self.tasa = por_minuto / 60
+        self.activo = rafaga > 0 and por_minuto > 0
+        self.cubetas = CacheLRU(max_claves, rafaga / self.tasa if self.activo else 0)
+
+    def cubeta(self, clave) -> _Cubeta:
+        cubeta = self.cubetas.get(clave)
+        if cubeta is None:
+            cubeta = _Cubeta(self.tasa, self.rafaga)
+        self.cubetas.set(clave, cubeta)  # renueva la expiración
+        return cubeta
+
+# === Control de admisión ===
+class Admision:
+    """
+    Protege el presupuesto del modelo ante ráfagas: límite de mensajes que
+    van al modelo por chat y por grupo (token buckets en memoria, por proceso)
+    y un tope global de llamadas al modelo en vuelo. Un chat o grupo ruidoso
+    agota solo su cubeta; el resto sigue con la latencia normal.
+    """
+
+    def __init__(self, por_chat=None, por_grupo=None, concurrencia: int = LLM_CONCURRENCIA,
+                 espera_max: float = LLM_ESPERA_MAX, max_claves: int = ADMISION_MAX_CLAVES):
+        self.por_chat = _Limite(*(por_chat or (ADMISION_CHAT_RAFAGA, ADMISION_CHAT_POR_MINUTO)), max_claves)
+        self.por_grupo = _Limite(*(por_grupo or (ADMISION_GRUPO_RAFAGA, ADMISION_GRUPO_POR_MINUTO)), max_claves)
+        self.concurrencia = concurrencia
+        self.espera_max = espera_max
+        self._semaforo = None
+        self._en_vuelo = 0
+        self.estadisticas = {"rechazos_chat": 0, "rechazos_grupo": 0, "rechazos_llm": 0, "esperas_llm": 0}
+
+    def _rechazar(self, motivo: str, clave):
+        self.estadisticas[f"rechazos_{motivo}"] += 1
+        metricas.contar("bot_admision_rechazos_total", motivo=motivo)
+        logger.info(f"🚦 Rechazado por límite de {motivo} ({clave})")
+
+    def limitar(self, chat_id, group_code=None):
+        """
+        None si el mensaje puede ir al modelo; si no, el motivo del rechazo
+        ("chat" o "grupo"). Se llama una vez por mensaje, ya deduplicado.
+        """
+        for motivo, limite, clave in (("chat", self.por_chat, chat_id), ("grupo", self.por_grupo, group_code)):
+            if clave is None or not limite.activo:
+                continue
+            if not limite.cubeta(clave).tomar():
+                self._rechazar(motivo, clave)
+                return motivo
+        return None
+
+    @asynccontextmanager
+    async def turno_llm(self):
+        """
+        Reserva un lugar entre las llamadas al modelo en vuelo; espera hasta
+        `espera_max` y si no lo consigue lanza Saturado.
+        """
+        if not self.concurrencia:
+            yield
+            return
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.concurrencia)  # dentro del loop que lo usa
+        if self._semaforo.locked():
+            self.estadisticas["esperas_llm"] += 1
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), self.espera_max)
+        except asyncio.TimeoutError:
+            self._rechazar("llm", f"{self._en_vuelo} en vuelo")
+            raise Saturado(f"{self._en_vuelo} llamadas al modelo en vuelo")
+        self._en_vuelo += 1
+        try:
+            yield
+        finally:
+            self._en_vuelo -= 1
+            self._semaforo.release()
+
+    def resumen(self) -> dict:
+        return {
+            **self.estadisticas,
+            "llm_en_vuelo": self._en_vuelo,
+            "llm_concurrencia": self.concurrencia,
+            "chats": len(self.por_chat.cubetas),
+            "grupos": len(self.por_grupo.cubetas),
+        }
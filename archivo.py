@@ -0,0 +1,189 @@
+import time
+import logging
+from datetime import datetime, timezone
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from materializados import dia_local
+
+logger = logging.getLogger("bot")
+
+ESTADO_ID = "archivo"
+DUPLICADO = 11000
+
+# === Meses locales ===
+def mes_de(fecha_utc: datetime, zona) -> datetime:
+    """
+    Primer día (naive) del mes local al que pertenece una fecha guardada en UTC.
+    """
+    return dia_local(fecha_utc, zona).replace(day=1)
+
+def mes_siguiente(mes: datetime) -> datetime:
+    return datetime(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+def restar_meses(mes: datetime, n: int) -> datetime:
+    total = mes.year * 12 + mes.month - 1 - n
+    return datetime(total // 12, total % 12 + 1, 1)
+
+def rango_utc(mes: datetime, zona) -> tuple:
+    """
+    (inicio, fin_exclusivo) en UTC naive del mes local `mes`, para filtrar `fecha`.
+    """
+    def utc(d):
+        return d.replace(tzinfo=zona).astimezone(timezone.utc).replace(tzinfo=None)
+    return utc(mes), utc(mes_siguiente(mes))
+
+# === Archivo de movimientos ===
+class Archivador:
+    """
+    Mueve los movimientos de meses cerrados a una colección fría (comprimida
+    con zstd si se crea aquí) y deja en `mensuales` los totales por clave,
+    mes, categoría y tipo. `saldos` y `resumen_diario` no se tocan: los saldos,
+    el reporte general y los reportes por periodo dan lo mismo antes y
+    después; la verificación suma los mensuales a lo que queda en movimientos.
+
+    Cada lote se copia primero (idempotente por _id) y luego se borra del
+    origen, así un corte a mitad no pierde filas: volver a correrlo termina el
+    mes. El mes en curso queda en la colección `estado` hasta que sus totales
+    se recalculan. Un movimiento archivado no se puede eliminar por ID hasta
+    restaurar su mes.
+    """
+
+    def __init__(self, movimientos, archivo, mensuales, estado, eliminados, campos, zona, lote: int = 1000, pausa: float = 0):
+        self.movimientos = movimientos
+        self.archivo = archivo
+        self.mensuales = mensuales
+        self.estado = estado
+        self.eliminados = eliminados
+        self.campos = list(campos)
+        self.zona = zona
+        self.lote = lote
+        self.pausa = pausa
+
+    def preparar(self):
+        db = self.archivo.database
+        if self.archivo.name in db.list_collection_names():
+            return
+        try:
+            db.create_collection(self.archivo.name, storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}})
+        except CollectionInvalid:
+            pass
+
+    # --- Copiar y borrar ---
+    def borrados_por_usuario(self, ids: list) -> list:
+        """
+        De `ids`, los que el usuario eliminó (tienen marca en eliminados).
+        """
+        return [e["movimiento_id"] for e in self.eliminados.find({"movimiento_id": {"$in": ids}}, {"movimiento_id": 1})]
+
+    def _copiar(self, destino, docs):
+        """
+        insert_many que ignora los _id ya presentes (reintento tras un corte).
+        """
+        try:
+            destino.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(err["code"] != DUPLICADO for err in e.details["writeErrors"]):
+                raise
+
+    def _mover(self, origen, destino, filtro: dict) -> int:
+        movidos = 0
+        while True:
+            docs = list(origen.find(filtro).limit(self.lote))
+            if not docs:
+                return movidos
+            ids = [d["_id"] for d in docs]
+            self._copiar(destino, docs)
+            borrados = origen.delete_many({"_id": {"$in": ids}}).deleted_count
+            if origen is self.movimientos and borrados < len(ids):
+                # El usuario eliminó alguno entre la copia y el borrado: no debe quedar archivado
+                perdidos = self.borrados_por_usuario(ids)
+                if perdidos:
+                    self.archivo.delete_many({"_id": {"$in": perdidos}})
+            movidos += borrados
+            if self.pausa:
+                time.sleep(self.pausa)
+
+    # --- Totales mensuales ---
+    def resumir(self, mes: datetime, filtro: dict = None) -> int:
+        """
+        Recalcula desde el archivo los totales de `mes` (de todas las claves o
+        solo de `filtro`) y borra los que ya no tienen filas.
+        """
+        filtro = filtro or {}
+        inicio, fin = rango_utc(mes, self.zona)
+        pipeline = [
+            {"$match": {**filtro, "fecha": {"$gte": inicio, "$lt": fin}, "tipo": {"$in": ["ingreso", "gasto"]}}},
+            {"$group": {
+                "_id": {**{c: f"${c}" for c in self.campos}, "categoria": "$categoria", "tipo": "$tipo"},
+                "total": {"$sum": "$monto"},
+                "n": {"$sum": 1},
+            }},
+        ]
+        ops, vigentes = [], []
+        for r in self.archivo.aggregate(pipeline, allowDiskUse=True):
+            clave = {**{c: r["_id"].get(c) for c in self.campos}, "mes": mes,
+                     "categoria": r["_id"]["categoria"], "tipo": r["_id"]["tipo"]}
+            ops.append(ReplaceOne(clave, {**clave, "total": r["total"], "n": r["n"]}, upsert=True))
+            vigentes.append(clave)
+        if ops:
+            self.mensuales.bulk_write(ops, ordered=False)
+        sobrantes = {**filtro, "mes": mes}
+        if vigentes:
+            sobrantes["$nor"] = vigentes
+        self.mensuales.delete_many(sobrantes)
+        return len(ops)
+
+    # --- Archivar y restaurar ---
+    def archivar_mes(self, mes: datetime) -> int:
+        inicio, fin = rango_utc(mes, self.zona)
+        self.estado.update_one({"_id": ESTADO_ID}, {"$set": {"mes": mes, "desde": datetime.utcnow()}}, upsert=True)
+        movidos = self._mover(self.movimientos, self.archivo, {"fecha": {"$gte": inicio, "$lt": fin}})
+        self.resumir(mes)
+        self.estado.update_one({"_id": ESTADO_ID}, {"$unset": {"mes": ""}, "$set": {"ultimo": mes}})
+        logger.info(f"🗄️ {mes:%Y-%m}: {movidos} movimientos archivados.")
+        return movidos
+
+    def pendientes(self, corte: datetime) -> list:
+        """
+        Meses locales anteriores a `corte` que aún tienen movimientos, del más antiguo al más nuevo.
+        """
+        meses = []
+        inicio_corte, _ = rango_utc(corte, self.zona)
+        filtro = {"fecha": {"$lt": inicio_corte}}
+        while True:
+            doc = self.movimientos.find_one(filtro, {"fecha": 1}, sort=[("fecha", 1)])
+            if doc is None:
+                return meses
+            mes = mes_de(doc["fecha"], self.zona)
+            meses.append(mes)
+            filtro["fecha"]["$gte"] = rango_utc(mes, self.zona)[1]
+
+    def archivar(self, meses_vivos: int, hoy: datetime = None) -> dict:
+        """
+        Archiva todo mes local que cerró hace más de `meses_vivos` meses.
+        Retoma primero el mes que haya quedado a medias.
+        """
+        t0 = time.perf_counter()
+        self.preparar()
+        hoy = hoy or datetime.utcnow()
+        corte = restar_meses(mes_de(hoy, self.zona), meses_vivos)
+        estado = self.estado.find_one({"_id": ESTADO_ID}) or {}
+        meses = self.pendientes(corte)
+        if estado.get("mes") and estado["mes"] not in meses:
+            meses.insert(0, estado["mes"])
+        movidos = sum(self.archivar_mes(mes) for mes in meses)
+        duracion = time.perf_counter() - t0
+        return {"corte": corte, "meses": len(meses), "movimientos": movidos, "segundos": round(duracion, 1),
+                "por_segundo": round(movidos / duracion, 1) if duracion else 0}
+
+    def restaurar(self, mes: datetime, filtro: dict = None) -> int:
+        """
+        Devuelve a movimientos las filas archivadas de `mes` (todas o solo las
+        de `filtro`, p. ej. un grupo) y ajusta sus totales mensuales.
+        """
+        filtro = filtro or {}
+        inicio, fin = rango_utc(mes, self.zona)
+        movidos = self._mover(self.archivo, self.movimientos, {**filtro, "fecha": {"$gte": inicio, "$lt": fin}})
+        self.resumir(mes, filtro)
+        logger.info(f"📤 {mes:%Y-%m}: {movidos} movimientos restaurados.")
+        return movidos
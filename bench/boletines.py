@@ -0,0 +1,140 @@
+"""
+Benchmark del boletín semanal/mensual de main-multisala.py contra un Telegram falso.
+
+Siembra N grupos con sus miembros y resúmenes diarios del periodo, corta la
+primera corrida a mitad (como un deploy o un crash) y la retoma. Reporta el
+tiempo de la agregación, el total y mensajes/s de cada corrida, y verifica
+con lo que recibió el Telegram falso que ningún chat recibió el boletín dos
+veces.
+
+Uso:
+    pip install -r bench/requirements.txt
+    MONGO_URI=mongodb://localhost:27017 python bench/boletines.py --grupos 10000
+    python bench/boletines.py --mongo memoria --grupos 500     # requiere mongomock
+    python bench/boletines.py --grupos 10000 --ritmo-real      # 30 mensajes/s como Telegram
+
+Usa una base aparte (telegram_gastos_boletines por defecto) que se borra al empezar.
+"""
+import os
+import sys
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pymongo
+import falsos
+import esquema
+import recursos
+from polling import cargar_entrypoint
+from webhook import puerto_libre, servir
+
+TOKEN = "bench"
+CATEGORIAS = ["salud", "limpieza", "alimentacion", "transporte", "salidas", "ropa", "plantas", "vacaciones"]
+
+def sembrar(m, n_grupos: int, miembros: int, inicio: datetime, fin: datetime, lote: int = 5000):
+    dias = [inicio + timedelta(days=i) for i in range((fin - inicio).days)]
+    grupos, usuarios, resumenes = [], [], []
+    for i in range(n_grupos):
+        code = f"B{i:06d}"
+        chats = [1_000_000 + i * miembros + j for j in range(miembros)]
+        grupos.append({"code": code, "name": f"Grupo {i}", "owner_chat_id": chats[0], "members": chats})
+        usuarios += [{"chat_id": c, "group_code": code} for c in chats]
+        for cat in random.sample(CATEGORIAS, 3):
+            for dia in random.sample(dias, min(3, len(dias))):
+                resumenes.append({"group_code": code, "dia": dia, "categoria": cat,
+                                  "tipo": random.choice(["gasto", "gasto", "ingreso"]), "total": random.randint(5, 300), "n": 1})
+    usuarios.append({"chat_id": 999, "group_code": None})  # sin grupo: no recibe nada
+    for coleccion, docs in ((m.grupos, grupos), (m.usuarios, usuarios), (m.resumen_diario, resumenes)):
+        for i in range(0, len(docs), lote):
+            coleccion.insert_many(docs[i:i + lote], ordered=False)
+    return len(usuarios) - 1
+
+def linea(nombre: str, r: dict):
+    print(f"{nombre}: {r['enviados']} enviados a {r['grupos']} grupos en {r['segundos']} s "
+          f"({r['mensajes_por_segundo']}/s) · agregación {r['agregacion_s']} s · "
+          f"{r['omitidos']} ya reservados · {r['fallidos']} fallidos")
+
+async def correr(args):
+    p_tg = puerto_libre()
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{p_tg}",
+        "MONGO_DB": args.db,
+        "BOLETINES_CONCURRENCIA": str(args.concurrencia),
+        "BOLETINES_LOTE": str(args.lote),
+    })
+    if not args.ritmo_real:
+        os.environ.setdefault("ENVIO_TASA_GLOBAL", "100000")
+    if args.mongo == "memoria":
+        import mongomock
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ["MONGO_URI"] = "mongodb://memoria"
+    else:
+        os.environ["MONGO_URI"] = args.mongo
+        os.environ.setdefault("MONGO_TLS", "1" if args.mongo.startswith("mongodb+srv") else "0")
+        pymongo.MongoClient(args.mongo).drop_database(args.db)
+
+    m = cargar_entrypoint("main-multisala")
+    esquema.crear_indices(recursos.get_mongo()[args.db], m.INDICES)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    hoy = datetime.now(m.ZONA).date()
+    inicio, fin, _ = m.rango_periodo(m.PERIODOS_BOLETIN[args.periodo], hoy)
+    print(f"🌱 Sembrando {args.grupos} grupos de {args.miembros} miembros...", file=sys.stderr)
+    destinatarios = await recursos.en_mongo(sembrar, m, args.grupos, args.miembros, inicio, fin)
+
+    recibidos = Counter()
+    tg = falsos.crear_telegram(TOKEN, lambda chat_id, texto: recibidos.update([chat_id]), args.latencia_telegram)
+    server, tarea = await servir(tg, p_tg)
+    try:
+        corrida = asyncio.create_task(m.boletines.enviar(args.periodo, hoy))
+        if args.cortar:
+            # Se corta la primera corrida cuando va por la fracción pedida
+            while not corrida.done() and sum(recibidos.values()) < destinatarios * args.cortar:
+                await asyncio.sleep(0.01)
+            corrida.cancel()
+            try:
+                await corrida
+            except asyncio.CancelledError:
+                print(f"✂️  Primera corrida cortada con {sum(recibidos.values())} entregados", file=sys.stderr)
+            r = await m.boletines.enviar(args.periodo, hoy)
+            linea("Reanudación", r)
+        else:
+            linea("Corrida", await corrida)
+        r = await m.boletines.enviar(args.periodo, hoy)
+        linea("Repetición", r)
+    finally:
+        server.should_exit = True
+        await tarea
+        await recursos.cerrar()
+
+    duplicados = sum(1 for n in recibidos.values() if n > 1)
+    print(f"\n{destinatarios} destinatarios · {len(recibidos)} recibieron el boletín · "
+          f"{destinatarios - len(recibidos)} sin recibir (en vuelo al cortar) · {duplicados} duplicados")
+    if duplicados:
+        sys.exit(1)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mongo", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"), help="URI o 'memoria'")
+    ap.add_argument("--db", default="telegram_gastos_boletines")
+    ap.add_argument("--grupos", type=int, default=10_000)
+    ap.add_argument("--miembros", type=int, default=3, help="miembros por grupo")
+    ap.add_argument("--periodo", choices=["semana", "mes"], default="semana")
+    ap.add_argument("--concurrencia", type=int, default=50, help="envíos en vuelo")
+    ap.add_argument("--lote", type=int, default=500, help="destinatarios reservados por lote")
+    ap.add_argument("--latencia-telegram", type=float, default=20, help="ms por sendMessage")
+    ap.add_argument("--cortar", type=float, default=0.5, help="fracción enviada al cortar la primera corrida (0 = no cortar)")
+    ap.add_argument("--ritmo-real", action="store_true", help="respetar ENVIO_TASA_GLOBAL (30/s por defecto)")
+    ap.add_argument("--semilla", type=int, default=42)
+    args = ap.parse_args()
+    random.seed(args.semilla)
+    asyncio.run(correr(args))
+
+if __name__ == "__main__":
+    main()
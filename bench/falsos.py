@@ -0,0 +1,138 @@
+"""
+Servidores falsos para el benchmark: API de bots de Telegram y endpoint de
+chat-completions de OpenRouter, con latencia y tasa de error configurables.
+"""
+import re
+import json
+import random
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+SINONIMOS = {
+    "taxi": "transporte", "bus": "transporte", "pasaje": "transporte", "gasolina": "transporte",
+    "almuerzo": "alimentacion", "mercado": "alimentacion", "cena": "alimentacion",
+    "farmacia": "salud", "doctor": "salud", "cine": "salidas", "polo": "ropa",
+    "detergente": "limpieza", "maceta": "plantas", "gasfitero": "arreglos casa", "hotel": "vacaciones",
+}
+CATEGORIAS = ["salud", "skincare", "limpieza", "alimentacion", "transporte", "salidas", "ropa", "plantas", "arreglos casa", "vacaciones"]
+
+def _latencia(media_ms: float) -> float:
+    # Exponencial: cola larga como en un proveedor real
+    return random.expovariate(1 / media_ms) / 1000 if media_ms > 0 else 0
+
+def interpretar_falso(texto: str) -> dict:
+    """
+    Respuesta determinista parecida a la del modelo para los mensajes sintéticos.
+    """
+    t = texto.lower()
+    if "reporte" in t:
+        r = {"tipo": "reporte", "monto": 0, "categoria": next((c for c in CATEGORIAS if c in t), "")}
+        if "mes" in t:
+            r["periodo"] = "mes"
+        return r
+    if "info" in t or "ayuda" in t:
+        return {"tipo": "info", "monto": 0, "categoria": ""}
+    if "eliminar" in t or "borra" in t:
+        return {"tipo": "eliminar", "monto": 0, "categoria": ""}
+    partes = re.split(r",\s+|\s+y\s+", t)
+    if len(partes) > 1 and all(re.search(r"\d", p) for p in partes):
+        movimientos = [interpretar_falso(p) for p in partes]
+        for m in movimientos[1:]:
+            m["tipo"] = movimientos[0]["tipo"]
+        return {"tipo": "varios", "movimientos": movimientos}
+    montos = [float(x) for x in re.findall(r"\d+(?:\.\d+)?", t)]
+    categoria = next((c for c in CATEGORIAS if c in t), "")
+    categoria = categoria or next((v for k, v in SINONIMOS.items() if k in t), "")
+    tipo = "ingreso" if any(v in t for v in ("ahorr", "recib", "guard")) else "gasto"
+    return {"tipo": tipo, "monto": montos[0] if montos else 0, "categoria": categoria}
+
+def texto_de_prompt(contenido: str) -> str:
+    m = re.search(r'Mensaje del usuario: "(.*)"', contenido, re.DOTALL)
+    return m.group(1) if m else contenido
+
+def textos_de_lote(contenido: str):
+    """
+    Mensajes numerados de un prompt por lotes, o None si es un prompt individual.
+    """
+    if "\nMensajes:\n" not in contenido:
+        return None
+    return re.findall(r'^\d+\. "(.*)"$', contenido.split("\nMensajes:\n", 1)[1], re.MULTILINE)
+
+def crear_openrouter(latencia_ms: float = 800, tasa_error: float = 0.0) -> FastAPI:
+    app = FastAPI()
+    app.state.llamadas = 0
+    app.state.lotes = 0
+
+    @app.post("/api/v1/chat/completions")
+    async def completions(req: Request):
+        body = await req.json()
+        app.state.llamadas += 1
+        await asyncio.sleep(_latencia(latencia_ms))
+        if random.random() < tasa_error:
+            return JSONResponse(status_code=503, content={"error": {"message": "sobrecargado"}})
+        contenido = body["messages"][-1]["content"]
+        lote = textos_de_lote(contenido)
+        if lote is not None:
+            app.state.lotes += 1
+            respuesta = {"resultados": [interpretar_falso(t) for t in lote]}
+        else:
+            respuesta = interpretar_falso(texto_de_prompt(contenido))
+        # El mensaje de sistema es un prefijo fijo: cuenta como cacheado, como en un proveedor real
+        sistema = sum(len(m["content"]) for m in body["messages"] if m["role"] == "system")
+        return {
+            "model": body.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": json.dumps(respuesta)}}],
+            "usage": {
+                "prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 4,
+                "completion_tokens": len(json.dumps(respuesta)) // 4,
+                "prompt_tokens_details": {"cached_tokens": sistema // 4},
+            },
+        }
+
+    return app
+
+def crear_telegram(token: str, al_enviar, latencia_ms: float = 50, tasa_error: float = 0.0) -> FastAPI:
+    """
+    `al_enviar(chat_id, texto)` se llama por cada sendMessage aceptado.
+    """
+    app = FastAPI()
+    app.state.enviados = 0
+    app.state.updates = []  # pendientes para getUpdates (modo polling)
+    app.state.hay_updates = asyncio.Event()
+
+    def encolar_update(update: dict):
+        app.state.updates.append(update)
+        app.state.hay_updates.set()
+
+    app.state.encolar_update = encolar_update
+
+    @app.post(f"/bot{token}/deleteWebhook")
+    async def delete_webhook():
+        return {"ok": True, "result": True}
+
+    @app.post(f"/bot{token}/getUpdates")
+    async def get_updates(req: Request):
+        body = await req.json()
+        if body.get("offset") is not None:
+            # Como Telegram: pedir un offset confirma (y descarta) los anteriores
+            app.state.updates = [u for u in app.state.updates if u["update_id"] >= body["offset"]]
+        if not app.state.updates and body.get("timeout"):
+            app.state.hay_updates.clear()
+            try:
+                await asyncio.wait_for(app.state.hay_updates.wait(), body["timeout"])
+            except asyncio.TimeoutError:
+                pass
+        return {"ok": True, "result": app.state.updates[: body.get("limit", 100)]}
+
+    @app.post(f"/bot{token}/sendMessage")
+    async def send_message(req: Request):
+        body = await req.json()
+        await asyncio.sleep(_latencia(latencia_ms))
+        if random.random() < tasa_error:
+            return JSONResponse(status_code=429, content={"ok": False, "error_code": 429, "parameters": {"retry_after": 1}})
+        app.state.enviados += 1
+        al_enviar(body["chat_id"], body["text"])
+        return {"ok": True, "result": {"message_id": app.state.enviados, "chat": {"id": body["chat_id"]}}}
+
+    return app
@@ -0,0 +1,442 @@
+"""
+Cobertura de índices: siembra un dataset realista en un MongoDB local, ejecuta
+las funciones del bot que leen y escriben en Mongo, captura cada comando que
+emiten (con un CommandListener) y corre explain() sobre cada forma distinta de
+consulta. Falla si alguna hace COLLSCAN, ordena en memoria o examina más
+documentos por documento devuelto que el umbral.
+
+Uso:
+    MONGO_URI=mongodb://localhost:27017 python bench/planes.py
+    python bench/planes.py --app main-multisala --movimientos 500000 --grupos 2000
+    python bench/planes.py --markdown > planes.md      # tabla para pegar en el PR
+
+Sale con código 1 si alguna consulta no pasa. Usa bases aparte
+(telegram_gastos_planes_*) que se borran al terminar salvo con --conservar.
+Bajo pytest lo corre tests/test_planes.py (se salta si no hay mongod).
+"""
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bson import ObjectId
+from pymongo import monitoring
+from archivo import mes_de, restar_meses
+from exportacion import INTERNOS
+
+CATEGORIAS = ["salud", "limpieza", "alimentacion", "transporte", "salidas", "ropa", "plantas", "vacaciones"]
+EXPLICABLES = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Campos del comando capturado que explain no acepta
+SIN_EXPLAIN = {
+    "lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction",
+    "writeConcern", "readConcern", "apiVersion", "apiStrict", "apiDeprecationErrors",
+}
+# Recorridos completos aceptados: colecciones acotadas por diseño, (app, colección) -> motivo
+ACOTADAS = {("main", "saldos"): "una fila por categoría"}
+CLAVE = "planes"
+
+# === Captura de comandos ===
+class Capturador(monitoring.CommandListener):
+    """
+    Guarda los comandos explicables emitidos mientras `activo`, con el nombre
+    del paso del bot que los originó.
+    """
+
+    def __init__(self):
+        self.activo = False
+        self.origen = None
+        self.comandos = []  # (origen, base, nombre, comando)
+
+    def started(self, event):
+        if self.activo and event.command_name in EXPLICABLES:
+            self.comandos.append((self.origen, event.database_name, event.command_name, dict(event.command)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def forma(valor):
+    """
+    Estructura de un filtro o pipeline sin los valores concretos.
+    """
+    if isinstance(valor, dict):
+        return {k: forma(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [forma(v) for v in valor] if valor and isinstance(valor[0], dict) else "<lista>"
+    if isinstance(valor, str) and valor.startswith("$"):
+        return valor  # referencia a campo en un pipeline
+    return f"<{type(valor).__name__}>"
+
+def sentencias(nombre: str, comando: dict):
+    """
+    Divide el comando en sentencias explicables: [(comando_para_explain, forma)].
+    """
+    base = {k: v for k, v in comando.items() if k not in SIN_EXPLAIN}
+    if nombre in ("update", "delete"):
+        campo = "updates" if nombre == "update" else "deletes"
+        for s in base[campo]:
+            forma_s = {"q": forma(s["q"]), "upsert": bool(s.get("upsert")), "multi": bool(s.get("multi") or s.get("limit") == 0)}
+            yield {**base, campo: [s]}, forma_s
+        return
+    if nombre == "find":
+        yield base, {k: forma(base[k]) for k in ("filter", "sort") if k in base} | {"limit": "limit" in base}
+    elif nombre == "aggregate":
+        yield base, forma(base["pipeline"])
+    elif nombre == "findAndModify":
+        yield base, {k: forma(base[k]) for k in ("query", "sort") if k in base} | {"remove": bool(base.get("remove"))}
+    else:
+        yield base, forma(base.get("query", {}))
+
+# === Análisis de planes ===
+def _etapas(plan) -> list:
+    """
+    Etapas del plan ganador en orden (de la raíz hacia las hojas).
+    """
+    etapas = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            nombre = plan["stage"]
+            if plan.get("indexName"):
+                nombre += f"({plan['indexName']})"
+            etapas.append(nombre)
+        for clave, valor in plan.items():
+            if clave in ("inputStage", "inputStages", "queryPlan", "outerStage", "innerStage", "thenStage", "elseStage"):
+                etapas += _etapas(valor)
+    elif isinstance(plan, list):
+        for p in plan:
+            etapas += _etapas(p)
+    return etapas
+
+def _partes(explicacion: dict):
+    """
+    (plan ganador, executionStats, etapas de pipeline posteriores) de un explain
+    de find, escritura o aggregate (formato clásico con $cursor o SBE).
+    """
+    posteriores = explicacion.get("stages", [])
+    if "queryPlanner" in explicacion:
+        return explicacion["queryPlanner"]["winningPlan"], explicacion.get("executionStats", {}), posteriores
+    for i, etapa in enumerate(posteriores):
+        if "$cursor" in etapa:
+            cursor = etapa["$cursor"]
+            return cursor["queryPlanner"]["winningPlan"], cursor.get("executionStats", {}), posteriores[i + 1:]
+    return {}, {}, posteriores
+
+def _filtro_vacio(nombre: str, comando: dict) -> bool:
+    if nombre == "find":
+        return not comando.get("filter")
+    if nombre == "aggregate":
+        primera = comando["pipeline"][0] if comando["pipeline"] else {}
+        return "$match" not in primera or not primera["$match"]
+    return False
+
+def evaluar(app: str, coleccion: str, nombre: str, comando: dict, explicacion: dict, umbral: float) -> dict:
+    plan, stats, posteriores = _partes(explicacion)
+    etapas = _etapas(plan)
+    examinados = stats.get("totalDocsExamined", 0)
+    devueltos = stats.get("nReturned", 0)
+    ratio = examinados / max(1, devueltos)
+    problemas, aviso = [], None
+    if any(e.startswith("COLLSCAN") for e in etapas):
+        if _filtro_vacio(nombre, comando):
+            aviso = "lectura completa"
+        elif (app, coleccion) in ACOTADAS:
+            aviso = ACOTADAS[(app, coleccion)]
+        else:
+            problemas.append("COLLSCAN")
+    if "SORT" in etapas or any("$sort" in e for e in posteriores):
+        problemas.append("orden en memoria")
+    if ratio > umbral and not aviso:
+        problemas.append(f"examinados/devueltos {ratio:.1f} > {umbral:g}")
+    return {
+        "plan": " → ".join(etapas) or "?",
+        "examinados": examinados,
+        "claves": stats.get("totalKeysExamined", 0),
+        "devueltos": devueltos,
+        "ratio": round(ratio, 2),
+        "problemas": problemas,
+        "aviso": aviso,
+    }
+
+# === Datos de prueba ===
+def sembrar(db, multigrupo: bool, movimientos: int, n_grupos: int, dias: int):
+    """
+    Movimientos repartidos en `dias` con grupos de tamaño desigual (unos pocos
+    grupos concentran la mayoría), más eliminados, updates, usuarios y grupos.
+    Los saldos y resúmenes se derivan de los movimientos.
+    """
+    ahora = datetime.utcnow()
+    codigos = [f"G{i:05d}" for i in range(n_grupos if multigrupo else 1)]
+    pesos = [1 / (i + 1) for i in range(len(codigos))]
+    miembros = {c: [10_000 + i * 4 + j for j in range(random.randint(1, 4))] for i, c in enumerate(codigos)}
+
+    restantes = movimientos
+    while restantes:
+        n = min(10_000, restantes)
+        docs = []
+        for grupo in random.choices(codigos, pesos, k=n):
+            doc = {
+                "chat_id": random.choice(miembros[grupo]),
+                "tipo": random.choice(["gasto", "gasto", "gasto", "ingreso"]),
+                "monto": random.randint(1, 500),
+                "categoria": random.choice(CATEGORIAS),
+                "mensaje_original": "planes",
+                "fecha": ahora - timedelta(seconds=random.randint(0, dias * 86400)),
+            }
+            if multigrupo:
+                doc["group_code"] = grupo
+            docs.append(doc)
+        db["movimientos"].insert_many(docs, ordered=False)
+        restantes -= n
+
+    db["eliminados"].insert_many([
+        {"movimiento_id": ObjectId(), "chat_id": 10_000, "fecha": ahora - timedelta(days=random.randint(0, 80)),
+         **({"group_code": random.choices(codigos, pesos)[0]} if multigrupo else {})}
+        for _ in range(max(1, movimientos // 100))
+    ])
+    db["updates"].insert_many([
+        {"_id": i, "estado": "hecho", "resultado": {"respuesta": "ok"}, "fecha": ahora} for i in range(min(movimientos, 20_000))
+    ])
+    if multigrupo:
+        db["grupos"].insert_many([
+            {"code": c, "name": f"Grupo {c}", "owner_chat_id": miembros[c][0], "members": miembros[c], "created_at": ahora}
+            for c in codigos
+        ])
+        db["usuarios"].insert_many([
+            {"chat_id": chat_id, "group_code": c, "pending": None, "created_at": ahora}
+            for c in codigos for chat_id in miembros[c]
+        ])
+    return codigos[0], miembros[codigos[0]][0]
+
+# === Ejercicio de las consultas del bot ===
+def revisar_export(origen: str, filas: list):
+    """
+    Falla si un export deja ver las marcas internas de la importación.
+    """
+    for fila in filas:
+        fugas = sorted(set(INTERNOS) & set(fila))
+        assert not fugas, f"{origen}: el export muestra {', '.join(fugas)}"
+
+class EnviadorNulo:
+    """
+    Telegram que acepta todo: el chequeo mira las consultas, no los envíos.
+    """
+
+    async def enviar(self, chat_id, texto) -> bool:
+        return True
+
+def ejercitar(m, cap: Capturador, db, multigrupo: bool, grupo: str, chat_id: int, dias: int):
+    from fastapi.testclient import TestClient
+
+    def paso(origen, fn, *args, **kwargs):
+        cap.origen = origen
+        resultado = fn(*args, **kwargs)
+        return asyncio.run(resultado) if asyncio.iscoroutine(resultado) else resultado
+
+    desde = (datetime.utcnow() - timedelta(days=min(90, dias))).strftime("%Y-%m-%d")
+    hasta = datetime.utcnow().strftime("%Y-%m-%d")
+    g = (grupo,) if multigrupo else ()
+    kg = {"group_code": grupo} if multigrupo else {}
+    cap.activo = True
+
+    if multigrupo:
+        paso("obtener_contexto", m.obtener_contexto, chat_id)
+        paso("crear_usuario", m.crear_usuario, 1)
+        paso("set_pending", m.set_pending, 1, "await_group_name")
+        paso("clear_pending", m.clear_pending, 1)
+        code = paso("crear_grupo/_codigo_grupo_unico", m.crear_grupo, "Planes", 1)
+        paso("crear_usuario", m.crear_usuario, 2)
+        paso("unir_a_grupo", m.unir_a_grupo, code, 2)
+        paso("obtener_nombre_grupo", m.obtener_nombre_grupo, {"group_code": grupo})
+
+    doc_id = paso("guardar_movimiento", m.guardar_movimiento, chat_id, "gasto", 25, "transporte", "planes", *g)
+    items = [{"tipo": "gasto", "monto": 20, "categoria": "transporte"}, {"tipo": "ingreso", "monto": 5, "categoria": "salud"}]
+    paso("guardar_movimientos", m.guardar_movimientos, chat_id, items, "planes", *g)
+    paso("eliminar_movimiento_por_id", m.eliminar_movimiento_por_id, str(doc_id), chat_id, *g)
+    if multigrupo:
+        paso("obtener_saldo", m.obtener_saldo, "transporte", grupo)
+        paso("obtener_saldos", m.obtener_saldos, ["transporte", "salud"], grupo)
+        paso("obtener_reporte_general", m.obtener_reporte_general, grupo)
+        paso("obtener_reporte_periodo", m.obtener_reporte_periodo, grupo, "mes")
+        paso("obtener_reporte_periodo", m.obtener_reporte_periodo, grupo, "semana", categoria="salud")
+    else:
+        paso("obtener_saldo", m.obtener_saldo, "transporte", chat_id)
+        paso("obtener_saldos", m.obtener_saldos, ["transporte", "salud"], chat_id)
+        paso("obtener_reporte_general", m.obtener_reporte_general, chat_id)
+        paso("obtener_reporte_periodo", m.obtener_reporte_periodo, "mes")
+        paso("obtener_reporte_periodo", m.obtener_reporte_periodo, "semana", categoria="salud")
+
+    paso("registro_updates", m.registro_updates.reclamar, 10**9)
+    paso("registro_updates", m.registro_updates.completar, 10**9, {"respuesta": "ok"})
+    paso("registro_updates", m.registro_updates.liberar, 10**9)
+    pendiente = {"update_id": 10**9 + 1, "message": {"chat": {"id": chat_id}, "text": "hola"}}
+    paso("registro_updates", m.registro_updates.guardar_pendientes, [pendiente])
+    paso("registro_updates", m.registro_updates.reclamar, 10**9 + 1, True)
+    paso("registro_updates", m.registro_updates.liberar, 10**9 + 1)
+    paso("registro_updates", m.registro_updates.pendientes, set(), 100)
+    paso("cache_interpretaciones", m.cache_interpretaciones.guardar, "pagué 30 por el taxi", {"tipo": "gasto", "monto": 30, "categoria": "transporte"})
+    m.cache_interpretaciones.memoria.invalidar(m.cache_interpretaciones._clave("pagué 30 por el taxi")[0])
+    paso("cache_interpretaciones", m.cache_interpretaciones.buscar, "pagué 45 por el taxi")
+
+    # Archivo: el mes más viejo se archiva entero y se restaura (solo el grupo en multi-grupo)
+    meses = paso("archivador.pendientes", m.archivador.pendientes, restar_meses(mes_de(datetime.utcnow(), m.ZONA), 1))
+    if meses:
+        paso("archivador.archivar_mes", m.archivador.archivar_mes, meses[0])
+        ids = [d["_id"] for d in db["movimientos_archivo"].find({}, {"_id": 1}).limit(100)]
+        paso("archivador.borrados_por_usuario", m.archivador.borrados_por_usuario, ids)
+        paso("archivador.restaurar", m.archivador.restaurar, meses[0], kg or None)
+
+    if multigrupo:
+        # Boletín semanal: totales de todos los grupos, reservas en envios y lectura de usuarios
+        m.boletines.enviador = EnviadorNulo()
+        paso("boletines.enviar", m.boletines.enviar, "semana", datetime.now(m.ZONA).date())
+
+    ultimo = db["movimientos"].find_one(kg, sort=[("_id", 1)], skip=100)
+    marca = str(ultimo["_id"]) if ultimo else None
+    exportes = [
+        {}, {"desde": desde, "hasta": hasta}, {"after": marca, "limit": 500},
+        {"desde": desde, "hasta": hasta, "after": marca, "limit": 500},
+        {"resumen": "dia", "desde": desde, "hasta": hasta}, {"resumen": "mes"},
+    ]
+    if multigrupo:
+        exportes += [{"group": grupo, **e} for e in exportes]
+    importacion = "\n".join(
+        json.dumps({"fecha": f"{hasta}T08:{i % 60:02d}:00", "tipo": "gasto", "monto": i + 1, "categoria": CATEGORIAS[i % 8]})
+        for i in range(50)
+    )
+    with TestClient(m.app) as cliente:
+        # Dos veces: la segunda encuentra todas las filas por import_key
+        for _ in range(2):
+            cap.origen = "importar_data"
+            cliente.post("/importar", params={"clave": CLAVE, "format": "ndjson", **({"group": grupo} if multigrupo else {})},
+                         content=importacion).raise_for_status()
+        # Un lote cortado deja import_lote en sus filas hasta que se repara
+        hace_una_hora = datetime.utcnow() - timedelta(hours=1)
+        db["movimientos"].insert_one({
+            "_id": ObjectId.from_datetime(hace_una_hora), **kg, "chat_id": chat_id, "tipo": "gasto", "monto": 1,
+            "categoria": "salud", "mensaje_original": "(importado)", "fecha": hace_una_hora,
+            "import_key": "planes:1", "import_lote": ObjectId(),
+        })
+        for params in exportes:
+            cap.origen = "exportar_data " + " ".join(sorted(k for k in params if params[k]))
+            r = cliente.get("/exportar", params={"clave": CLAVE, "format": "ndjson", **params})
+            r.raise_for_status()
+            revisar_export(cap.origen, [json.loads(l) for l in r.text.splitlines() if l])
+        reciente = str(ObjectId.from_datetime(hace_una_hora - timedelta(minutes=1)))
+        for params in ({}, {"marca": marca}, {"marca": reciente}) + (({"group": grupo}, {"group": grupo, "marca": marca}) if multigrupo else ()):
+            cap.origen = "exportar_cambios " + " ".join(sorted(params))
+            r = cliente.get("/exportar/cambios", params={"clave": CLAVE, **params})
+            r.raise_for_status()
+            revisar_export(cap.origen, r.json()["cambios"])
+        # Sin boletín en curso: las secciones vacías de /estadisticas no deben romper /metrics
+        for ruta in ("/estadisticas", "/metrics"):
+            cap.origen = ruta
+            cliente.get(ruta, params={"clave": CLAVE}).raise_for_status()
+    cap.activo = False
+
+# === Reporte ===
+def reporte_texto(filas: list):
+    for f in filas:
+        estado = "❌ " + "; ".join(f["problemas"]) if f["problemas"] else ("⚠️ " + f["aviso"] if f["aviso"] else "✅")
+        print(f"{estado}\n   {f['app']} · {f['coleccion']}.{f['comando']} {json.dumps(f['forma'], ensure_ascii=False)}")
+        print(f"   plan: {f['plan']}  docs={f['examinados']} claves={f['claves']} devueltos={f['devueltos']} ratio={f['ratio']}")
+        print(f"   origen: {', '.join(f['origenes'])}")
+
+def reporte_markdown(filas: list):
+    print("| Estado | App | Consulta | Origen | Plan | Docs | Claves | Devueltos |")
+    print("|---|---|---|---|---|---|---|---|")
+    for f in filas:
+        estado = "❌ " + "; ".join(f["problemas"]) if f["problemas"] else ("⚠️ " + f["aviso"] if f["aviso"] else "✅")
+        consulta = f"`{f['coleccion']}.{f['comando']} {json.dumps(f['forma'], ensure_ascii=False)}`".replace("|", "\\|")
+        print(f"| {estado} | {f['app']} | {consulta} | {', '.join(f['origenes'])} | {f['plan']} "
+              f"| {f['examinados']} | {f['claves']} | {f['devueltos']} |")
+
+def analizar(app: str, cap: Capturador, cliente, umbral: float) -> list:
+    filas = {}
+    for origen, base, nombre, comando in cap.comandos:
+        coleccion = comando[nombre]
+        for sentencia, forma_s in sentencias(nombre, comando):
+            clave = (coleccion, nombre, json.dumps(forma_s, sort_keys=True))
+            if clave in filas:
+                if origen not in filas[clave]["origenes"]:
+                    filas[clave]["origenes"].append(origen)
+                continue
+            explicacion = cliente[base].command({"explain": sentencia, "verbosity": "executionStats"})
+            filas[clave] = {
+                "app": app, "coleccion": coleccion, "comando": nombre, "forma": forma_s, "origenes": [origen],
+                **evaluar(app, coleccion, nombre, sentencia, explicacion, umbral),
+            }
+    return sorted(filas.values(), key=lambda f: (not f["problemas"], f["coleccion"], f["comando"]))
+
+def revisar(app: str, cap: Capturador, nombre_db: str, movimientos: int, grupos: int, dias: int, umbral: float, conservar: bool = False) -> list:
+    """
+    Siembra `nombre_db`, ejercita la app y devuelve el análisis de cada forma
+    de consulta. `cap` ya debe estar registrado y MONGO_URI en el entorno.
+    """
+    import esquema
+    import recursos
+    from polling import cargar_entrypoint
+    from materializados import verificar_saldos, verificar_resumenes
+
+    multigrupo = app == "main-multisala"
+    os.environ["MONGO_DB"] = nombre_db
+    m = cargar_entrypoint(app)
+    cliente = recursos.get_mongo()
+    cliente.drop_database(nombre_db)
+    db = cliente[nombre_db]
+    print(f"🌱 {app}: sembrando {movimientos} movimientos en {nombre_db}...", file=sys.stderr)
+    grupo, chat_id = sembrar(db, multigrupo, movimientos, grupos, dias)
+    campos = ["group_code"] if multigrupo else []
+    verificar_saldos(m.movimientos, m.saldos, campos + ["categoria"], corregir=True)
+    verificar_resumenes(m.movimientos, m.resumen_diario, campos, m.ZONA_HORARIA, corregir=True)
+    esquema.crear_indices(db, m.INDICES)
+
+    cap.comandos = []
+    ejercitar(m, cap, db, multigrupo, grupo, chat_id, dias)
+    filas = analizar(app, cap, recursos.get_mongo(), umbral)
+    if not conservar:
+        recursos.get_mongo().drop_database(nombre_db)
+    return filas
+
+def main():
+    ap = argparse.ArgumentParser(description="Cobertura de índices con explain()")
+    ap.add_argument("--app", choices=["main", "main-multisala", "ambas"], default="ambas")
+    ap.add_argument("--mongo", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    ap.add_argument("--db", default="telegram_gastos_planes")
+    ap.add_argument("--movimientos", type=int, default=100_000)
+    ap.add_argument("--grupos", type=int, default=500, help="grupos sembrados en modo multi-grupo")
+    ap.add_argument("--dias", type=int, default=365, help="antigüedad máxima de los movimientos")
+    ap.add_argument("--ratio", type=float, default=10, help="máximo de documentos examinados por devuelto")
+    ap.add_argument("--markdown", action="store_true", help="imprimir el reporte como tabla Markdown")
+    ap.add_argument("--conservar", action="store_true", help="no borrar las bases al terminar")
+    ap.add_argument("--semilla", type=int, default=42)
+    args = ap.parse_args()
+
+    random.seed(args.semilla)
+    os.environ.update({
+        "MONGO_URI": args.mongo, "BOT_TOKEN": CLAVE, "EXPORT_PASS": CLAVE, "INTERP_CACHE_MONGO": "1",
+        "OPENROUTER_MODELS": "planes/modelo",
+    })
+    os.environ.setdefault("MONGO_TLS", "1" if args.mongo.startswith("mongodb+srv") else "0")
+    cap = Capturador()
+    monitoring.register(cap)  # antes de crear cualquier cliente
+
+    filas = []
+    for app in (["main", "main-multisala"] if args.app == "ambas" else [args.app]):
+        nombre_db = f"{args.db}_{'multi' if app == 'main-multisala' else 'single'}"
+        filas += revisar(app, cap, nombre_db, args.movimientos, args.grupos, args.dias, args.ratio, args.conservar)
+
+    (reporte_markdown if args.markdown else reporte_texto)(filas)
+    fallidas = [f for f in filas if f["problemas"]]
+    print(f"\n{len(filas)} formas de consulta, {len(fallidas)} con problemas", file=sys.stderr)
+    sys.exit(1 if fallidas else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compara la latencia de leer un saldo con la agregación original sobre
+`movimientos` y con la lectura puntual en `saldos`, a medida que crece el
+historial de un grupo.
+
+Uso:
+    MONGO_URI=mongodb://localhost:27017 python bench/saldos.py --tamanos 100 10000 1000000
+
+Usa una base aparte (telegram_gastos_bench por defecto) que se borra al terminar.
+
+Estado: sin validar. Solo se corrió contra un Mongo simulado en memoria con
+100 y 1000 movimientos, que no dice nada de latencias reales; la comparación
+con 1M de movimientos contra un mongod real está pendiente. Hasta entonces no
+hay números que citar: la mejora esperada (lectura puntual constante frente a
+una agregación que crece con el historial) es teórica. Si MONGO_URI no
+responde, el script se niega a correr en vez de medir contra otra cosa.
+"""
+import os
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import PyMongoError
+
+CATEGORIAS = ["salud", "limpieza", "alimentacion", "transporte", "salidas", "ropa"]
+GRUPO = "BENCH1"
+
+def sembrar(movimientos, saldos, hasta: int, actual: int, lote: int = 10000):
+    inicio = datetime.utcnow() - timedelta(days=365)
+    while actual < hasta:
+        n = min(lote, hasta - actual)
+        docs = [{
+            "chat_id": 1,
+            "group_code": GRUPO,
+            "tipo": random.choice(["gasto", "gasto", "ingreso"]),
+            "monto": random.randint(1, 500),
+            "categoria": random.choice(CATEGORIAS),
+            "mensaje_original": "bench",
+            "fecha": inicio + timedelta(seconds=actual + i),
+        } for i in range(n)]
+        movimientos.insert_many(docs, ordered=False)
+        # Mismo resultado que un $inc por movimiento, agrupado por lote para sembrar rápido
+        acumulado = {}
+        for d in docs:
+            a = acumulado.setdefault(d["categoria"], {"ingreso": 0, "gasto": 0, "n": 0})
+            a[d["tipo"]] += d["monto"]
+            a["n"] += 1
+        for cat, inc in acumulado.items():
+            saldos.update_one({"group_code": GRUPO, "categoria": cat}, {"$inc": inc}, upsert=True)
+        actual += n
+    return actual
+
+def saldo_agregado(movimientos, categoria):
+    pipeline = [
+        {"$match": {"group_code": GRUPO, "categoria": categoria}},
+        {"$group": {"_id": "$tipo", "total": {"$sum": "$monto"}}},
+    ]
+    r = list(movimientos.aggregate(pipeline))
+    return sum(x["total"] for x in r if x["_id"] == "ingreso") - sum(x["total"] for x in r if x["_id"] == "gasto")
+
+def saldo_materializado(saldos, categoria):
+    d = saldos.find_one({"group_code": GRUPO, "categoria": categoria}) or {}
+    return d.get("ingreso", 0) - d.get("gasto", 0)
+
+def medir(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.95) - 1]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tamanos", type=int, nargs="+", default=[100, 1000, 10000, 100000, 1000000])
+    ap.add_argument("--repeticiones", type=int, default=50)
+    ap.add_argument("--db", default="telegram_gastos_bench")
+    args = ap.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        raise SystemExit(f"No hay un mongod en MONGO_URI ({type(e).__name__}); este benchmark necesita uno real.")
+    db = client[args.db]
+    db.drop_collection("movimientos")
+    db.drop_collection("saldos")
+    movimientos, saldos = db["movimientos"], db["saldos"]
+    movimientos.create_index([("group_code", ASCENDING), ("categoria", ASCENDING), ("tipo", ASCENDING), ("fecha", ASCENDING)])
+    saldos.create_index([("group_code", ASCENDING), ("categoria", ASCENDING)], unique=True)
+
+    print(f"{'movimientos':>12} | {'agregación p50/p95 (ms)':>24} | {'saldos p50/p95 (ms)':>20}")
+    actual = 0
+    try:
+        for tamano in sorted(args.tamanos):
+            actual = sembrar(movimientos, saldos, tamano, actual)
+            cat = "transporte"
+            assert abs(saldo_agregado(movimientos, cat) - saldo_materializado(saldos, cat)) < 1e-6
+            rep = max(3, args.repeticiones if tamano <= 100000 else args.repeticiones // 10)
+            agg = medir(lambda: saldo_agregado(movimientos, cat), rep)
+            mat = medir(lambda: saldo_materializado(saldos, cat), args.repeticiones)
+            print(f"{tamano:>12} | {agg[0]:>11.2f} / {agg[1]:>10.2f} | {mat[0]:>9.2f} / {mat[1]:>8.2f}")
+    finally:
+        client.drop_database(args.db)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Benchmark de carga del webhook contra servidores falsos de Telegram y OpenRouter.
+
+Levanta la `app` de main.py o main-multisala.py con uvicorn, reproduce sesiones
+sintéticas (onboarding, crear/unir, gastos, reportes, eliminar, exports) y
+reporta latencia p50/p95/p99, updates/s, llamadas al LLM y operaciones de Mongo
+por update. Cada corrida se guarda en bench/resultados/ y se compara con la
+anterior del mismo escenario.
+
+Uso:
+    pip install -r bench/requirements.txt
+    MONGO_URI=mongodb://localhost:27017 python bench/webhook.py --app main-multisala --usuarios 50
+    python bench/webhook.py --app main --mongo memoria      # Mongo en memoria (requiere mongomock)
+    python bench/webhook.py --app main-multisala --cola --latencia-llm 1500 --error-llm 0.05
+    python bench/webhook.py --app main --mongo memoria --polling   # ingesta con polling.py
+
+Todo corre en un solo proceso y event loop, así que los números sirven para
+comparar versiones entre sí, no como capacidad absoluta de producción.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import hashlib
+import logging
+import argparse
+import subprocess
+import statistics
+import importlib.util
+from collections import defaultdict, deque
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import httpx
+import uvicorn
+import pymongo
+from pymongo import monitoring
+import falsos
+import polling
+import esquema
+import recursos
+
+TOKEN = "bench"
+CATEGORIAS = ["salud", "limpieza", "alimentacion", "transporte", "salidas", "ropa", "plantas", "vacaciones"]
+MEZCLA = {
+    "gasto_rapido": 30, "gasto_llm": 25, "gasto_varios": 5, "ingreso": 10, "reporte": 15, "info": 5, "eliminar": 10,
+}
+
+class ContadorComandos(monitoring.CommandListener):
+    IGNORADOS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo"}
+
+    def __init__(self):
+        self.total = 0
+
+    def started(self, event):
+        if event.command_name not in self.IGNORADOS:
+            self.total += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentiles(valores) -> dict:
+    if not valores:
+        return {"p50": None, "p95": None, "p99": None, "n": 0}
+    v = sorted(valores)
+    pick = lambda q: round(v[min(len(v) - 1, int(q * len(v)))] * 1000, 2)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "media": round(statistics.mean(v) * 1000, 2), "n": len(v)}
+
+def cargar_app(nombre: str):
+    spec = importlib.util.spec_from_file_location(nombre.replace("-", "_"), os.path.join(RAIZ, f"{nombre}.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+async def servir(app, puerto: int):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=puerto, log_level="warning", lifespan="on"))
+    tarea = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, tarea
+
+class Simulacion:
+    def __init__(self, args, url_app: str):
+        self.args = args
+        self.url_app = url_app
+        self.telegram = None  # app de Telegram falsa cuando se ingesta por polling
+        self.http = httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=1000))
+        self.pendientes = defaultdict(deque)  # chat_id -> futures esperando respuesta
+        self.lat_http = []
+        self.lat_e2e = defaultdict(list)
+        self.lat_export = []
+        self.errores = 0
+        self.updates = 0
+        self._update_id = 0
+        self.codigos = {}
+        self.eventos_grupo = defaultdict(asyncio.Event)
+
+    def al_enviar(self, chat_id, texto):
+        cola = self.pendientes.get(chat_id)
+        if cola:
+            fut = cola.popleft()
+            if not fut.done():
+                fut.set_result(texto)
+
+    async def enviar(self, chat_id: int, texto: str, tipo: str) -> str | None:
+        self._update_id += 1
+        fut = asyncio.get_running_loop().create_future()
+        self.pendientes[chat_id].append(fut)
+        t0 = time.perf_counter()
+        update = {
+            "update_id": self._update_id,
+            "message": {"message_id": self._update_id, "chat": {"id": chat_id}, "text": texto},
+        }
+        try:
+            if self.telegram is not None:
+                self.telegram.state.encolar_update(update)
+            else:
+                r = await self.http.post(f"{self.url_app}/{TOKEN}", json=update)
+                self.lat_http.append(time.perf_counter() - t0)
+                r.raise_for_status()
+            respuesta = await asyncio.wait_for(fut, 120)
+        except Exception:
+            self.errores += 1
+            return None
+        self.lat_e2e[tipo].append(time.perf_counter() - t0)
+        self.updates += 1
+        return respuesta
+
+    def mensaje(self, tipo: str, ids: list) -> str:
+        n = random.randint(5, 300)
+        cat = random.choice(CATEGORIAS)
+        if tipo == "gasto_rapido":
+            return f"gasté {n} en {cat}"
+        if tipo == "gasto_llm":
+            return f"pagué {n} por el {random.choice(list(falsos.SINONIMOS))} de la semana"
+        if tipo == "gasto_varios":
+            sinonimo = random.choice(list(falsos.SINONIMOS))
+            return f"gasté {n} en {cat}, {random.randint(5, 99)} en {sinonimo} y {random.randint(5, 99)} en {random.choice(CATEGORIAS)}"
+        if tipo == "ingreso":
+            return f"ahorré {n} para {cat}"
+        if tipo == "reporte":
+            return random.choice(["reporte general", f"reporte de {cat}", "reporte de este mes"])
+        if tipo == "info":
+            return "info"
+        return f"eliminar {ids.pop()}" if ids else f"gasté {n} en {cat}"
+
+    async def sesion(self, indice: int, multigrupo: bool):
+        chat_id = 100000 + indice
+        grupo = indice // self.args.usuarios_por_grupo
+        if multigrupo:
+            await self.enviar(chat_id, "hola", "onboarding")
+            if indice % self.args.usuarios_por_grupo == 0:
+                r = await self.enviar(chat_id, f"crear Bench {grupo}", "crear")
+                m = re.search(r"Código: `(\w+)`", r or "")
+                self.codigos[grupo] = m.group(1) if m else None
+                self.eventos_grupo[grupo].set()
+            else:
+                await self.eventos_grupo[grupo].wait()
+                if self.codigos.get(grupo):
+                    await self.enviar(chat_id, f"unir {self.codigos[grupo]}", "unir")
+
+        ids = []
+        tipos, pesos = zip(*MEZCLA.items())
+        for _ in range(self.args.mensajes):
+            tipo = random.choices(tipos, pesos)[0]
+            r = await self.enviar(chat_id, self.mensaje(tipo, ids), tipo)
+            m = re.search(r"ID: `([0-9a-f]{24})`", r or "")
+            if m:
+                ids.append(m.group(1))
+            if self.args.pausa:
+                await asyncio.sleep(random.expovariate(1 / self.args.pausa))
+
+    async def exportar_periodicamente(self, fin: asyncio.Event):
+        while not fin.is_set() and self.args.exportar_cada > 0:
+            await asyncio.sleep(self.args.exportar_cada)
+            t0 = time.perf_counter()
+            try:
+                r = await self.http.get(f"{self.url_app}/exportar", params={"clave": TOKEN, "format": "ndjson"})
+                r.raise_for_status()
+                self.lat_export.append(time.perf_counter() - t0)
+            except Exception:
+                self.errores += 1
+
+def escenario(args) -> str:
+    claves = ["app", "usuarios", "mensajes", "usuarios_por_grupo", "latencia_llm", "error_llm",
+              "latencia_telegram", "error_telegram", "cola", "mongo_tipo", "pausa", "lote_ms"]
+    valores = {k: getattr(args, k) for k in claves}
+    if args.polling:
+        # Solo cuando se usa, para no cambiar la huella de los escenarios anteriores
+        valores["polling"] = True
+    base = json.dumps(valores, sort_keys=True)
+    return hashlib.sha1(base.encode()).hexdigest()[:10]
+
+def comparar(actual: dict, carpeta: str):
+    previos = sorted(
+        f for f in os.listdir(carpeta)
+        if f.endswith(".json") and f != actual["archivo"] and actual["escenario"] in f
+    )
+    if not previos:
+        return
+    with open(os.path.join(carpeta, previos[-1])) as fh:
+        previo = json.load(fh)
+    print(f"\nComparado con {previos[-1]} ({previo.get('version')}):")
+    for clave in ("p50", "p95", "p99"):
+        a, b = actual["e2e_total"][clave], previo["e2e_total"][clave]
+        if a and b:
+            print(f"  e2e {clave}: {b:.1f} → {a:.1f} ms ({(a - b) / b * 100:+.1f}%)")
+    a, b = actual["updates_por_segundo"], previo["updates_por_segundo"]
+    print(f"  updates/s: {b:.1f} → {a:.1f} ({(a - b) / b * 100:+.1f}%)")
+
+async def correr(args):
+    p_app, p_tg, p_llm = puerto_libre(), puerto_libre(), puerto_libre()
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "EXPORT_PASS": TOKEN,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{p_tg}",
+        "OPENROUTER_URL": f"http://127.0.0.1:{p_llm}/api/v1/chat/completions",
+        "MONGO_DB": args.db,
+        "WEBHOOK_COLA": "1" if args.cola else "0",
+        "OPENROUTER_LOTE_MS": str(args.lote_ms),
+    })
+    if not args.ritmo_real:
+        os.environ.setdefault("ENVIO_INTERVALO_CHAT", "0")
+        os.environ.setdefault("ENVIO_INTERVALO_GRUPO", "0")
+    # Sin límites de admisión: se mide el camino completo de cada mensaje, no sus rechazos
+    for variable in ("ADMISION_CHAT_RAFAGA", "ADMISION_GRUPO_RAFAGA", "LLM_CONCURRENCIA"):
+        os.environ.setdefault(variable, "0")
+
+    contador = None
+    if args.mongo == "memoria":
+        import mongomock
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ["MONGO_URI"] = "mongodb://memoria"
+    else:
+        os.environ["MONGO_URI"] = args.mongo
+        os.environ.setdefault("MONGO_TLS", "1" if args.mongo.startswith("mongodb+srv") else "0")
+        pymongo.MongoClient(args.mongo).drop_database(args.db)
+        contador = ContadorComandos()
+        monitoring.register(contador)
+
+    modulo = cargar_app(args.app)
+    # La app no crea índices al importar: se crean como en un despliegue (`python main.py indices`)
+    esquema.crear_indices(recursos.get_mongo()[args.db], modulo.INDICES)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    sim = Simulacion(args, f"http://127.0.0.1:{p_app}")
+    llm = falsos.crear_openrouter(args.latencia_llm, args.error_llm)
+    tg = falsos.crear_telegram(TOKEN, sim.al_enviar, args.latencia_telegram, args.error_telegram)
+    servidores = [await servir(llm, p_llm), await servir(tg, p_tg), await servir(modulo.app, p_app)]
+    lector = None
+    if args.polling:
+        sim.telegram = tg
+        lector = polling.LectorUpdates(modulo.BASE_URL, modulo.atender_update, modulo.registro_updates, modulo.COLA_WORKERS, modulo.COLA_MAX)
+        tarea_lector = asyncio.create_task(lector.correr())
+
+    ops_inicio = contador.total if contador else 0
+    fin = asyncio.Event()
+    exportador = asyncio.create_task(sim.exportar_periodicamente(fin))
+    t0 = time.perf_counter()
+    multigrupo = hasattr(modulo, "crear_grupo")
+    await asyncio.gather(*(sim.sesion(i, multigrupo) for i in range(args.usuarios)))
+    duracion = time.perf_counter() - t0
+    fin.set()
+    await exportador
+    ops = (contador.total - ops_inicio) if contador else None
+    if lector:
+        lector.detener()
+        await tarea_lector
+
+    for server, tarea in reversed(servidores):
+        server.should_exit = True
+        await tarea
+    await sim.http.aclose()
+    if contador:
+        pymongo.MongoClient(args.mongo).drop_database(args.db)
+
+    todas = [v for lista in sim.lat_e2e.values() for v in lista]
+    resultado = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "version": version_git(),
+        "escenario": escenario(args),
+        "parametros": vars(args),
+        "duracion_s": round(duracion, 2),
+        "updates": sim.updates,
+        "errores": sim.errores,
+        "updates_por_segundo": round(sim.updates / duracion, 2),
+        "http": percentiles(sim.lat_http),
+        "e2e_total": percentiles(todas),
+        "e2e_por_tipo": {k: percentiles(v) for k, v in sorted(sim.lat_e2e.items())},
+        "exportar": percentiles(sim.lat_export),
+        "llm_por_update": round(llm.state.llamadas / max(1, sim.updates), 3),
+        "llm_lotes": llm.state.lotes,
+        "mongo_ops_por_update": round(ops / max(1, sim.updates), 2) if ops is not None else None,
+        "telegram_envios": tg.state.enviados,
+    }
+    return resultado
+
+def version_git() -> str:
+    try:
+        return subprocess.check_output(["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "desconocida"
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", default="main-multisala", choices=["main", "main-multisala"])
+    ap.add_argument("--usuarios", type=int, default=50, help="sesiones concurrentes (un chat cada una)")
+    ap.add_argument("--mensajes", type=int, default=20, help="mensajes por sesión tras el onboarding")
+    ap.add_argument("--usuarios-por-grupo", type=int, default=3)
+    ap.add_argument("--pausa", type=float, default=0.0, help="pausa media entre mensajes de un usuario (s)")
+    ap.add_argument("--latencia-llm", type=float, default=800, help="ms medios del OpenRouter falso")
+    ap.add_argument("--error-llm", type=float, default=0.0, help="fracción de respuestas 503 del LLM")
+    ap.add_argument("--latencia-telegram", type=float, default=50)
+    ap.add_argument("--error-telegram", type=float, default=0.0, help="fracción de 429 en sendMessage")
+    ap.add_argument("--exportar-cada", type=float, default=2.0, help="segundos entre exports (0 = sin exports)")
+    ap.add_argument("--cola", action="store_true", help="usar WEBHOOK_COLA=1")
+    ap.add_argument("--polling", action="store_true", help="ingestar con getUpdates (polling.py) en vez del webhook")
+    ap.add_argument("--lote-ms", type=float, default=0, help="OPENROUTER_LOTE_MS (0 = sin micro-lotes)")
+    ap.add_argument("--ritmo-real", action="store_true", help="mantener el ritmo por chat del enviador")
+    ap.add_argument("--mongo", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"), help="URI o 'memoria'")
+    ap.add_argument("--db", default="telegram_gastos_bench")
+    ap.add_argument("--salida", default=os.path.join(RAIZ, "bench", "resultados"))
+    ap.add_argument("--semilla", type=int, default=42)
+    args = ap.parse_args()
+    args.mongo_tipo = "memoria" if args.mongo == "memoria" else "mongodb"
+    random.seed(args.semilla)
+
+    resultado = asyncio.run(correr(args))
+    resultado["parametros"].pop("mongo", None)  # puede traer credenciales
+
+    os.makedirs(args.salida, exist_ok=True)
+    resultado["archivo"] = f"{datetime.now():%Y%m%d-%H%M%S}_{args.app}_{resultado['escenario']}.json"
+    with open(os.path.join(args.salida, resultado["archivo"]), "w") as fh:
+        json.dump(resultado, fh, indent=2, ensure_ascii=False)
+
+    print(f"{resultado['updates']} updates en {resultado['duracion_s']} s → {resultado['updates_por_segundo']} updates/s ({resultado['errores']} errores)")
+    print(f"e2e ms   p50={resultado['e2e_total']['p50']} p95={resultado['e2e_total']['p95']} p99={resultado['e2e_total']['p99']}")
+    print(f"http ms  p50={resultado['http']['p50']} p95={resultado['http']['p95']} p99={resultado['http']['p99']}")
+    for tipo, p in resultado["e2e_por_tipo"].items():
+        print(f"  {tipo:<13} p50={p['p50']} p95={p['p95']} p99={p['p99']} (n={p['n']})")
+    print(f"exportar ms p50={resultado['exportar']['p50']} p95={resultado['exportar']['p95']}")
+    print(f"LLM/update={resultado['llm_por_update']} (lotes={resultado['llm_lotes']})  Mongo ops/update={resultado['mongo_ops_por_update']}")
+    print(f"Guardado en {os.path.join(args.salida, resultado['archivo'])}")
+    comparar(resultado, args.salida)
+
+if __name__ == "__main__":
+    main()
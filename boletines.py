@@ -0,0 +1,171 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, date
+from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+from recursos import en_mongo
+from exportacion import filas_en_lotes
+from materializados import rango_periodo
+
+logger = logging.getLogger("bot")
+
+# Boletín de cada frecuencia: el último periodo cerrado
+PERIODOS_BOLETIN = {"semana": "semana_pasada", "mes": "mes_pasado"}
+RESERVADO = "reservado"
+ENVIADO = "enviado"
+
+def renderizar(nombre: str, etiqueta: str, totales: dict, pie: str = "") -> str:
+    mensaje = f"📅 *Resumen de {nombre} ({etiqueta}):*\n"
+    gasto = sum(v["gasto"] for v in totales.values())
+    ingreso = sum(v["ingreso"] for v in totales.values())
+    for cat, vals in sorted(totales.items()):
+        mensaje += f"• {cat}: gastos S/ {vals['gasto']:.2f} · ingresos S/ {vals['ingreso']:.2f}\n"
+    mensaje += f"\n💸 Total gastos: S/ {gasto:.2f}\n💰 Total ingresos: S/ {ingreso:.2f}\n"
+    return mensaje + pie
+
+# === Boletines por grupo ===
+class Boletines:
+    """
+    Envía a cada miembro de cada grupo el resumen del último periodo cerrado.
+    Los totales de todos los grupos salen de una sola agregación sobre los
+    resúmenes diarios y cada mensaje se arma una vez por grupo. Los envíos
+    pasan por el EnviadorTelegram (ritmo global y por chat) con `concurrencia`
+    en vuelo.
+
+    Cada destinatario se reserva en `envios` (_id = boletín + chat) antes de
+    enviarle, por lotes; al terminar el lote se marcan los enviados y se
+    liberan los fallidos. Si la corrida se corta, la siguiente salta todo lo
+    reservado: a lo sumo se pierden los envíos en vuelo (un lote si el proceso
+    muere sin cancelar), nunca se repite un envío.
+    """
+
+    def __init__(self, resumenes, grupos, usuarios, envios, enviador, concurrencia: int = 20, lote: int = 200, pie: str = ""):
+        self.resumenes = resumenes
+        self.grupos = grupos
+        self.usuarios = usuarios
+        self.envios = envios
+        self.enviador = enviador
+        self.concurrencia = concurrencia
+        self.lote = lote
+        self.pie = pie
+        self.en_curso = None  # resumen de la corrida activa
+
+    # --- Datos ---
+    def totales(self, inicio: datetime, fin: datetime) -> dict:
+        """
+        {group_code: {categoria: {"gasto": x, "ingreso": y}}} de todos los grupos en una agregación.
+        """
+        pipeline = [
+            {"$match": {"dia": {"$gte": inicio, "$lt": fin}}},
+            {"$group": {"_id": {"g": "$group_code", "c": "$categoria", "t": "$tipo"}, "total": {"$sum": "$total"}}},
+        ]
+        totales = {}
+        for r in self.resumenes.aggregate(pipeline, allowDiskUse=True):
+            if r["_id"].get("g") is None:
+                continue
+            vals = totales.setdefault(r["_id"]["g"], {}).setdefault(r["_id"]["c"], {"gasto": 0, "ingreso": 0})
+            vals[r["_id"]["t"]] += r["total"]
+        return totales
+
+    def _reservar(self, boletin: str, pendientes: list) -> list:
+        """
+        Reserva los destinatarios y devuelve los que quedaron a cargo de esta
+        corrida (otra en paralelo puede haberse llevado alguno).
+        """
+        docs = [
+            {"_id": f"{boletin}:{chat_id}", "boletin": boletin, "chat_id": chat_id, "group_code": code,
+             "estado": RESERVADO, "fecha": datetime.utcnow()}
+            for chat_id, code, _ in pendientes
+        ]
+        try:
+            self.envios.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            ajenos = {docs[err["index"]]["_id"] for err in e.details["writeErrors"] if err["code"] == 11000}
+            if len(ajenos) < len(e.details["writeErrors"]):
+                raise
+            return [p for p, d in zip(pendientes, docs) if d["_id"] not in ajenos]
+        return pendientes
+
+    def _cerrar(self, boletin: str, resultados: list):
+        ops = [
+            UpdateOne({"_id": f"{boletin}:{chat_id}"}, {"$set": {"estado": ENVIADO}}) if ok
+            else DeleteOne({"_id": f"{boletin}:{chat_id}"})  # la próxima corrida lo reintenta
+            for chat_id, ok in resultados
+        ]
+        if ops:
+            self.envios.bulk_write(ops, ordered=False)
+
+    # --- Envío ---
+    async def _enviar_lote(self, boletin: str, pendientes: list, r: dict):
+        propios = await en_mongo(self._reservar, boletin, pendientes)
+        r["omitidos"] += len(pendientes) - len(propios)
+        semaforo = asyncio.Semaphore(self.concurrencia)
+        en_vuelo, resultados = set(), {}
+
+        async def enviar(chat_id, texto):
+            async with semaforo:
+                en_vuelo.add(chat_id)
+                resultados[chat_id] = await self.enviador.enviar(chat_id, texto)
+                en_vuelo.discard(chat_id)
+
+        try:
+            await asyncio.gather(*(enviar(chat_id, texto) for chat_id, _, texto in propios))
+        except asyncio.CancelledError:
+            # Cortado: se cierra lo terminado y se libera lo que no llegó a salir;
+            # lo que estaba en vuelo queda reservado (no se sabe si llegó)
+            sin_salir = [(chat_id, False) for chat_id, _, _ in propios if chat_id not in resultados and chat_id not in en_vuelo]
+            await en_mongo(self._cerrar, boletin, list(resultados.items()) + sin_salir)
+            raise
+        await en_mongo(self._cerrar, boletin, list(resultados.items()))
+        for ok in resultados.values():
+            r["enviados" if ok else "fallidos"] += 1
+
+    async def enviar(self, frecuencia: str, hoy: date = None) -> dict:
+        """
+        Envía el boletín de `frecuencia` ("semana" o "mes") del último periodo
+        cerrado respecto a `hoy`. Se puede repetir: solo envía lo que falta.
+        """
+        t0 = time.perf_counter()
+        inicio, fin, etiqueta = rango_periodo(PERIODOS_BOLETIN[frecuencia], hoy or date.today())
+        boletin = f"{frecuencia}:{inicio:%Y-%m-%d}"
+        r = self.en_curso = {"boletin": boletin, "grupos": 0, "enviados": 0, "fallidos": 0, "omitidos": 0, "sin_movimientos": 0}
+
+        try:
+            totales = await en_mongo(self.totales, inicio, fin)
+            r["agregacion_s"] = round(time.perf_counter() - t0, 3)
+            nombres = {g["code"]: g.get("name") or g["code"] async for g in filas_en_lotes(self.grupos.find({}, {"code": 1, "name": 1}))}
+            hechos = {d["chat_id"] async for d in filas_en_lotes(self.envios.find({"boletin": boletin}, {"chat_id": 1}))}
+            r["omitidos"] = len(hechos)
+
+            mensajes, pendientes = {}, []
+            # Lectura completa a propósito: casi todos los usuarios tienen grupo
+            async for u in filas_en_lotes(self.usuarios.find({}, {"chat_id": 1, "group_code": 1})):
+                code = u.get("group_code")
+                if code is None:
+                    continue
+                if code not in totales:
+                    r["sin_movimientos"] += 1
+                    continue
+                if u["chat_id"] in hechos:
+                    continue
+                if code not in mensajes:
+                    r["grupos"] += 1
+                    mensajes[code] = renderizar(nombres.get(code, code), etiqueta, totales[code], self.pie)
+                pendientes.append((u["chat_id"], code, mensajes[code]))
+                if len(pendientes) >= self.lote:
+                    await self._enviar_lote(boletin, pendientes, r)
+                    pendientes = []
+            if pendientes:
+                await self._enviar_lote(boletin, pendientes, r)
+        finally:
+            self.en_curso = None
+
+        r["segundos"] = round(time.perf_counter() - t0, 2)
+        r["mensajes_por_segundo"] = round(r["enviados"] / r["segundos"], 1) if r["segundos"] else 0
+        logger.info(
+            f"🗓️ Boletín {boletin}: {r['enviados']} enviados a {r['grupos']} grupos en {r['segundos']} s "
+            f"({r['mensajes_por_segundo']}/s), {r['fallidos']} fallidos, {r['omitidos']} ya enviados; "
+            f"agregación {r['agregacion_s']} s."
+        )
+        return r
@@ -0,0 +1,108 @@
+import re
+import hashlib
+import logging
+from datetime import datetime
+from lru import CacheLRU
+from parser_local import normalizar
+from recursos import en_mongo
+
+logger = logging.getLogger("bot")
+
+RE_NUMERO = re.compile(r"\d+(?:[.,]\d+)?")
+RE_ID = re.compile(r"\b[0-9a-f]{24}\b")
+MARCA_MONTO = "<n>"
+
+def version_interpretacion(modelo: str, categorias, prompt: str) -> str:
+    """
+    Huella del modelo, las categorías y el prompt: si cambia cualquiera, las
+    entradas anteriores dejan de coincidir.
+    """
+    base = "|".join([modelo, ",".join(categorias), prompt])
+    return hashlib.sha1(base.encode()).hexdigest()[:12]
+
+def _a_numero(valor: str) -> float:
+    return float(valor.replace(",", "."))
+
+def _partes(resultado: dict) -> list:
+    """
+    Los dicts que llevan "monto": el resultado o cada uno de sus movimientos.
+    """
+    return resultado["movimientos"] if isinstance(resultado.get("movimientos"), list) else [resultado]
+
+# === Cache de interpretaciones de OpenRouter ===
+class CacheInterpretaciones:
+    """
+    Cache de resultados del modelo por texto normalizado (sin tildes,
+    mayúsculas ni espacios extra) con los montos abstraídos: "gasté 30 en taxi" y
+    "gasté 45 en taxi" comparten entrada. Opcionalmente respaldada en una
+    colección de Mongo con índice TTL para sobrevivir reinicios.
+    """
+
+    def __init__(self, version: str, max_items: int = 5000, ttl: float = 86400, coleccion=None):
+        self.version = version
+        self.memoria = CacheLRU(max_items, ttl)
+        self.coleccion = coleccion
+        self.estadisticas = {"aciertos_mongo": 0, "omitidos": 0}
+
+    def _clave(self, texto: str):
+        """
+        Devuelve (clave, montos del texto).
+        """
+        texto = RE_ID.sub("<id>", normalizar(texto))
+        montos = RE_NUMERO.findall(texto)
+        return f"{self.version}:{RE_NUMERO.sub(MARCA_MONTO, texto)}", montos
+
+    async def buscar(self, texto: str):
+        clave, montos = self._clave(texto)
+        plantilla = self.memoria.get(clave)
+        if plantilla is None and self.coleccion is not None:
+            doc = await en_mongo(self.coleccion.find_one, {"_id": clave})
+            if doc:
+                plantilla = doc["resultado"]
+                self.memoria.set(clave, plantilla)
+                self.estadisticas["aciertos_mongo"] += 1
+        if plantilla is None:
+            return None
+        resultado = dict(plantilla)
+        if "movimientos" in resultado:
+            resultado["movimientos"] = [dict(m) for m in resultado["movimientos"]]
+        pendientes = iter(montos)
+        for parte in _partes(resultado):
+            if parte.get("monto") == MARCA_MONTO:
+                monto = _a_numero(next(pendientes))
+                parte["monto"] = int(monto) if monto.is_integer() else monto
+        return resultado
+
+    async def guardar(self, texto: str, resultado: dict):
+        if "error" in resultado:
+            return
+        clave, montos = self._clave(texto)
+        plantilla = dict(resultado)
+        if "movimientos" in plantilla:
+            if not isinstance(plantilla["movimientos"], list) or not all(isinstance(m, dict) for m in plantilla["movimientos"]):
+                self.estadisticas["omitidos"] += 1
+                return
+            plantilla["movimientos"] = [dict(m) for m in plantilla["movimientos"]]
+        partes = _partes(plantilla)
+        if montos and [_a_numero(m) for m in montos] == [p.get("monto") for p in partes]:
+            # Cada número del texto es, en orden, el monto de un movimiento
+            for parte in partes:
+                parte["monto"] = MARCA_MONTO
+        elif montos:
+            # Números que no son los montos: no es reutilizable
+            self.estadisticas["omitidos"] += 1
+            return
+        self.memoria.set(clave, plantilla)
+        if self.coleccion is not None:
+            try:
+                await en_mongo(
+                    self.coleccion.update_one,
+                    {"_id": clave},
+                    {"$set": {"resultado": plantilla, "creado": datetime.utcnow()}},
+                    upsert=True,
+                )
+            except Exception:
+                logger.exception("⚠️ No se pudo guardar la interpretación en Mongo:")
+
+    def resumen(self) -> dict:
+        return {**self.memoria.resumen(), **self.estadisticas, "version": self.version}
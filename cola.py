@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("bot")
+
+# === Cola de updates con orden por chat ===
+class ColaPorChat:
+    """
+    Pool de workers en segundo plano. Cada clave (chat_id) se asigna siempre al
+    mismo worker, así los updates de un chat se procesan en orden y chats
+    distintos avanzan en paralelo.
+    """
+
+    def __init__(self, manejador, workers: int = 8, max_pendientes: int = 1000):
+        self.manejador = manejador
+        self.workers = max(1, workers)
+        self.max_pendientes = max_pendientes
+        self._colas = [asyncio.Queue() for _ in range(self.workers)]
+        self._tareas = []
+        self._pendientes = 0
+
+    def iniciar(self):
+        if not self._tareas:
+            self._tareas = [asyncio.create_task(self._worker(q)) for q in self._colas]
+
+    def pendientes(self) -> int:
+        return self._pendientes
+
+    def encolar(self, clave, item) -> bool:
+        """
+        Devuelve False si la cola está llena (el llamador decide cómo rechazar).
+        """
+        if self._pendientes >= self.max_pendientes:
+            return False
+        self._pendientes += 1
+        self._colas[hash(clave) % self.workers].put_nowait(item)
+        return True
+
+    async def _worker(self, q: asyncio.Queue):
+        while True:
+            item = await q.get()
+            try:
+                await self.manejador(item)
+            except Exception:
+                logger.exception("❌ Error procesando update en cola:")
+            finally:
+                self._pendientes -= 1
+                q.task_done()
+
+    async def detener(self, timeout: float = 10):
+        """
+        Espera a que se vacíe la cola (hasta `timeout` segundos) y luego cancela los workers.
+        """
+        if not self._tareas:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._colas)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Cola detenida con {self._pendientes} updates pendientes.")
+        for t in self._tareas:
+            t.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
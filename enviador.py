@@ -0,0 +1,139 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import httpx
+from recursos import get_http
+
+logger = logging.getLogger("bot")
+
+# === Configuración ===
+ENVIO_TASA_GLOBAL = float(os.getenv("ENVIO_TASA_GLOBAL", "30"))       # mensajes/s para todo el bot
+ENVIO_INTERVALO_CHAT = float(os.getenv("ENVIO_INTERVALO_CHAT", "1"))   # s entre mensajes a un chat privado
+ENVIO_INTERVALO_GRUPO = float(os.getenv("ENVIO_INTERVALO_GRUPO", "3")) # s entre mensajes a un grupo (~20/min)
+ENVIO_REINTENTOS = int(os.getenv("ENVIO_REINTENTOS", "3"))
+ENVIO_BACKOFF = float(os.getenv("ENVIO_BACKOFF", "0.5"))
+
+class _CubetaTokens:
+    """
+    Token bucket que permite deuda: cada reserva devuelve cuánto hay que
+    esperar, sin locks (no hay await entre leer y actualizar el estado).
+    """
+
+    def __init__(self, tasa: float, capacidad: float):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.tokens = capacidad
+        self.ultimo = time.monotonic()
+
+    def _reponer(self):
+        ahora = time.monotonic()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def reservar(self) -> float:
+        self._reponer()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.tasa
+
+    def pausar(self, segundos: float):
+        """
+        Nadie reserva antes de `segundos`; después se sigue al ritmo de la tasa.
+        """
+        self._reponer()
+        self.tokens = min(self.tokens, -segundos * self.tasa)
+
+def _json(response) -> dict:
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+# === Envío de mensajes a Telegram ===
+class EnviadorTelegram:
+    """
+    Envía mensajes respetando el límite global del bot y un ritmo por chat,
+    reintenta errores 5xx/red con backoff y respeta `retry_after` en los 429:
+    pausa el chat y también la cubeta global, porque el 429 suele avisar que
+    el bot entero va por encima del límite.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._global = _CubetaTokens(ENVIO_TASA_GLOBAL, ENVIO_TASA_GLOBAL)
+        self._proximo_por_chat = {}
+        self.estadisticas = {
+            "enviados": 0, "fallidos": 0, "reintentos": 0, "limitados_429": 0,
+            "espera_total": 0.0, "espera_max": 0.0, "latencia_total": 0.0, "latencia_max": 0.0,
+        }
+
+    def _reservar_turno(self, chat_id) -> float:
+        ahora = time.monotonic()
+        if len(self._proximo_por_chat) > 10000:
+            self._proximo_por_chat = {c: t for c, t in self._proximo_por_chat.items() if t > ahora}
+        intervalo = ENVIO_INTERVALO_GRUPO if isinstance(chat_id, int) and chat_id < 0 else ENVIO_INTERVALO_CHAT
+        turno = max(ahora, self._proximo_por_chat.get(chat_id, 0))
+        self._proximo_por_chat[chat_id] = turno + intervalo
+        return max(turno - ahora, self._global.reservar())
+
+    def _pausar_chat(self, chat_id, segundos: float):
+        self._proximo_por_chat[chat_id] = max(self._proximo_por_chat.get(chat_id, 0), time.monotonic() + segundos)
+
+    def _registrar(self, clave: str, valor: float):
+        self.estadisticas[f"{clave}_total"] += valor
+        self.estadisticas[f"{clave}_max"] = max(self.estadisticas[f"{clave}_max"], valor)
+
+    async def enviar(self, chat_id, texto: str, parse_mode: str | None = "Markdown") -> bool:
+        payload = {"chat_id": chat_id, "text": texto, "disable_web_page_preview": True}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        inicio = time.monotonic()
+
+        for intento in range(ENVIO_REINTENTOS + 1):
+            await asyncio.sleep(self._reservar_turno(chat_id))
+            if intento == 0:
+                self._registrar("espera", time.monotonic() - inicio)
+            else:
+                self.estadisticas["reintentos"] += 1
+
+            t0 = time.monotonic()
+            try:
+                response = await get_http().post(f"{self.base_url}/sendMessage", json=payload)
+            except httpx.HTTPError as e:
+                logger.warning(f"⚠️ Error de red enviando a {chat_id}: {e}")
+                await asyncio.sleep(ENVIO_BACKOFF * 2 ** intento * (1 + random.random()))
+                continue
+            self._registrar("latencia", time.monotonic() - t0)
+
+            if response.status_code == 200:
+                self.estadisticas["enviados"] += 1
+                return True
+            if response.status_code == 429:
+                self.estadisticas["limitados_429"] += 1
+                retry_after = _json(response).get("parameters", {}).get("retry_after", 1)
+                self._pausar_chat(chat_id, retry_after)
+                self._global.pausar(retry_after)
+                continue
+            if response.status_code >= 500:
+                await asyncio.sleep(ENVIO_BACKOFF * 2 ** intento * (1 + random.random()))
+                continue
+            descripcion = _json(response).get("description", "")
+            if response.status_code == 400 and "parse" in descripcion and "parse_mode" in payload:
+                # Markdown inválido (p. ej. un "_" suelto en el texto del usuario): reenviar como texto plano
+                payload.pop("parse_mode")
+                continue
+            logger.error(f"❌ Telegram rechazó el mensaje a {chat_id}: {response.status_code} {descripcion}")
+            break
+
+        self.estadisticas["fallidos"] += 1
+        return False
+
+    def resumen(self) -> dict:
+        e = self.estadisticas
+        hechos = max(1, e["enviados"] + e["fallidos"])
+        return {
+            **e,
+            "espera_media": e["espera_total"] / hechos,
+            "latencia_media": e["latencia_total"] / max(1, e["enviados"]),
+        }
@@ -0,0 +1,141 @@
+import logging
+from pymongo import ASCENDING
+from recursos import en_mongo
+
+logger = logging.getLogger("bot")
+
+# === Manifiesto de índices ===
+def _indice(*campos, unico: bool = False, ttl: int = None, disperso: bool = False) -> dict:
+    return {"claves": [(c, ASCENDING) for c in campos], "unique": unico, "ttl": ttl, "sparse": disperso}
+
+def manifiesto(multigrupo: bool, eliminados_ttl: int, updates_ttl: int, cache_ttl: int = None, boletines_ttl: int = None) -> dict:
+    """
+    Índices esperados por colección. En modo multi-grupo las claves llevan
+    group_code delante y se suman las colecciones de usuarios y grupos.
+    `cache_ttl` solo si la cache de interpretaciones vive en Mongo;
+    `boletines_ttl` solo donde se envían boletines por grupo.
+    """
+    g = ("group_code",) if multigrupo else ()
+    indices = {
+        # import_key solo en las filas de /importar (re-importar el mismo archivo no duplica);
+        # import_lote solo mientras su lote no sumó a los contadores
+        "movimientos": [
+            _indice(*g, "fecha"), _indice("import_key", unico=True, disperso=True), _indice("import_lote", disperso=True),
+        ],
+        "saldos": [_indice(*g, "categoria", unico=True), _indice("lotes", disperso=True)],
+        "resumen_diario": [_indice(*g, "dia", "categoria", "tipo", unico=True), _indice("lotes", disperso=True)],
+        # movimiento_id: al archivar, detectar los que el usuario borró entre copia y borrado
+        "eliminados": [_indice("fecha", ttl=eliminados_ttl), _indice("movimiento_id")],
+        # estado: barrido de los updates de polling pendientes de reintento
+        "updates": [_indice("fecha", ttl=updates_ttl), _indice("estado", "_id")],
+        "movimientos_archivo": [_indice("fecha"), _indice("import_key", unico=True, disperso=True)],
+        "resumen_mensual": [_indice(*g, "mes", "categoria", "tipo", unico=True)],
+    }
+    if multigrupo:
+        indices["movimientos"].insert(0, _indice("group_code", "categoria", "tipo", "fecha"))
+        # Cambios y paginación por grupo (keyset por _id); exportación sin grupo por fecha o día
+        indices["movimientos"] += [_indice("group_code", "_id"), _indice("fecha")]
+        indices["resumen_diario"].append(_indice("dia"))
+        indices["resumen_mensual"].append(_indice("mes"))  # recalcular un mes de todos los grupos
+        # Restaurar un grupo; exportar un grupo paginado por _id
+        indices["movimientos_archivo"] += [_indice("group_code", "fecha"), _indice("group_code", "_id")]
+        indices["eliminados"].insert(0, _indice("group_code", "_id"))
+        indices["usuarios"] = [_indice("chat_id", unico=True)]
+        indices["grupos"] = [_indice("code", unico=True)]
+    if multigrupo and boletines_ttl:
+        indices["boletines_envios"] = [_indice("boletin", "chat_id"), _indice("fecha", ttl=boletines_ttl)]
+    if cache_ttl:
+        indices["cache_interpretaciones"] = [_indice("creado", ttl=cache_ttl)]
+    return indices
+
+def _nombre(indice: dict) -> str:
+    return ", ".join(c for c, _ in indice["claves"])
+
+def _existentes(coleccion) -> dict:
+    """
+    {claves: info} de los índices actuales, sin el de _id.
+    """
+    existentes = {}
+    for nombre, info in coleccion.index_information().items():
+        if nombre == "_id_":
+            continue
+        claves = tuple((c, int(d)) for c, d in info["key"])
+        existentes[claves] = {
+            "nombre": nombre, "unique": bool(info.get("unique")), "ttl": info.get("expireAfterSeconds"),
+            "sparse": bool(info.get("sparse")),
+        }
+    return existentes
+
+# === Creación y verificación ===
+def verificar_indices(db, indices: dict) -> list:
+    """
+    Compara los índices de `db` con el manifiesto. Devuelve una lista de
+    {coleccion, indice, problema} (faltante, opciones distintas o sobrante).
+    """
+    diferencias = []
+    for nombre_coleccion, esperados in indices.items():
+        existentes = _existentes(db[nombre_coleccion])
+        for indice in esperados:
+            actual = existentes.pop(tuple(indice["claves"]), None)
+            if actual is None:
+                problema = "faltante"
+            elif any(actual[k] != indice[k] for k in ("unique", "ttl", "sparse")):
+                problema = f"opciones distintas (unique={actual['unique']}, ttl={actual['ttl']}, sparse={actual['sparse']})"
+            else:
+                continue
+            diferencias.append({"coleccion": nombre_coleccion, "indice": _nombre(indice), "problema": problema})
+        for actual in existentes.values():
+            diferencias.append({"coleccion": nombre_coleccion, "indice": actual["nombre"], "problema": "sobrante"})
+    return diferencias
+
+def crear_indices(db, indices: dict) -> list:
+    """
+    Crea los índices que faltan y ajusta el TTL de los que cambiaron
+    (collMod). Idempotente: si todo coincide no hace cambios. Los índices que
+    difieren en `unique`/`sparse` o sobran no se tocan; verificar_indices los reporta.
+    """
+    acciones = []
+    for nombre_coleccion, esperados in indices.items():
+        coleccion = db[nombre_coleccion]
+        existentes = _existentes(coleccion)
+        for indice in esperados:
+            actual = existentes.get(tuple(indice["claves"]))
+            if actual is None:
+                opciones = {k: True for k in ("unique", "sparse") if indice[k]}
+                if indice["ttl"] is not None:
+                    opciones["expireAfterSeconds"] = indice["ttl"]
+                coleccion.create_index(indice["claves"], **opciones)
+                acciones.append(f"{nombre_coleccion}: creado ({_nombre(indice)})")
+            elif actual["ttl"] != indice["ttl"] and indice["ttl"] is not None and actual["ttl"] is not None:
+                db.command("collMod", nombre_coleccion, index={"name": actual["nombre"], "expireAfterSeconds": indice["ttl"]})
+                acciones.append(f"{nombre_coleccion}: TTL {actual['ttl']} → {indice['ttl']} s ({_nombre(indice)})")
+    for accion in acciones:
+        logger.info(f"🗂️ {accion}")
+    return acciones
+
+def unicos_faltantes(db, indices: dict) -> list:
+    """
+    Índices únicos del manifiesto que faltan o no son únicos: de ellos dependen
+    los upserts de saldos/resúmenes, la idempotencia de importaciones y los
+    códigos de grupo.
+    """
+    unicos = {c: [i for i in esperados if i["unique"]] for c, esperados in indices.items()}
+    return [d for d in verificar_indices(db, {c: u for c, u in unicos.items() if u}) if d["problema"] != "sobrante"]
+
+async def asegurar_indices(db, indices: dict, crear: bool, comando: str) -> list:
+    """
+    Chequeo de arranque, fuera del camino crítico: crea lo que falte si `crear`
+    y registra un error por cada índice único que siga faltando.
+    """
+    if crear:
+        try:
+            await en_mongo(crear_indices, db, indices)
+        except Exception as e:
+            logger.error(f"❌ No se pudieron crear los índices al arrancar: {e!r}")
+    faltan = await en_mongo(unicos_faltantes, db, indices)
+    for d in faltan:
+        logger.error(
+            f"❌ Índice único {d['coleccion']} ({d['indice']}) {d['problema']}: los contadores y códigos "
+            f"pueden duplicarse. Ejecuta `{comando}`."
+        )
+    return faltan
@@ -0,0 +1,175 @@
+import io
+import csv
+import json
+import zlib
+import itertools
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from fastapi.responses import StreamingResponse
+from recursos import en_mongo
+
+FORMATOS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+# Marcas internas de la importación: nunca salen en un export
+INTERNOS = ("import_key", "import_lote")
+SIN_INTERNOS = {campo: 0 for campo in INTERNOS}
+
+# === Exportación en streaming ===
+def formatear_fila(doc: dict, con_id: bool = False) -> dict:
+    """
+    Fechas como texto y `_id` como `id` (solo si se pagina), igual que el export original.
+    """
+    _id = doc.pop("_id", None)
+    for campo in INTERNOS:
+        doc.pop(campo, None)
+    if con_id and _id is not None:
+        doc = {"id": str(_id), **doc}
+    if isinstance(doc.get("fecha"), datetime):
+        doc["fecha"] = doc["fecha"].strftime("%Y-%m-%d %H:%M:%S")
+    return doc
+
+async def filas_en_lotes(cursor, tamano: int = 1000):
+    """
+    Recorre un cursor de pymongo (o cualquier iterador) por lotes en el pool de
+    hilos de Mongo, sin cargar todo el resultado en memoria.
+    """
+    try:
+        while True:
+            lote = await en_mongo(lambda: list(itertools.islice(cursor, tamano)))
+            for doc in lote:
+                yield doc
+            if len(lote) < tamano:
+                break
+    finally:
+        if hasattr(cursor, "close"):
+            cursor.close()
+
+async def unir_flujos(flujos: list, por_id: bool = False, limite: int = None):
+    """
+    Un solo flujo a partir de varios (p. ej. movimientos y su archivo). Con
+    `por_id` mezcla flujos ya ordenados por _id sin perder el orden (para la
+    paginación por keyset) y corta en `limite`; si no, los encadena.
+    """
+    if not por_id:
+        for flujo in flujos:
+            async for doc in flujo:
+                yield doc
+        return
+    iteradores = [f.__aiter__() for f in flujos]
+    cabezas = {}
+    try:
+        for i, it in enumerate(iteradores):
+            async for doc in it:
+                cabezas[i] = doc
+                break
+        enviados = 0
+        while cabezas and (limite is None or enviados < limite):
+            i = min(cabezas, key=lambda k: cabezas[k]["_id"])
+            yield cabezas.pop(i)
+            enviados += 1
+            async for doc in iteradores[i]:
+                cabezas[i] = doc
+                break
+    finally:
+        for it in iteradores:
+            if hasattr(it, "aclose"):
+                await it.aclose()
+
+async def _serializar(filas, formato: str, columnas=None):
+    if formato == "json":
+        yield "["
+        primero = True
+        async for fila in filas:
+            yield ("" if primero else ",") + json.dumps(fila, default=str, ensure_ascii=False)
+            primero = False
+        yield "]"
+    elif formato == "ndjson":
+        async for fila in filas:
+            yield json.dumps(fila, default=str, ensure_ascii=False) + "\n"
+    else:
+        buffer = io.StringIO()
+        writer = None
+        async for fila in filas:
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=columnas or list(fila), restval="", extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow(fila)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+async def _gzip(partes):
+    comp = zlib.compressobj(wbits=31)  # formato gzip
+    async for parte in partes:
+        datos = comp.compress(parte)
+        if datos:
+            yield datos
+    yield comp.flush()
+
+async def _a_bytes(partes, tamano_bloque: int = 64 * 1024):
+    """
+    Junta las partes en bloques de ~64 KB para no enviar un chunk HTTP por fila.
+    """
+    bloque = []
+    acumulado = 0
+    async for parte in partes:
+        bloque.append(parte)
+        acumulado += len(parte)
+        if acumulado >= tamano_bloque:
+            yield "".join(bloque).encode("utf-8")
+            bloque, acumulado = [], 0
+    if bloque:
+        yield "".join(bloque).encode("utf-8")
+
+def respuesta_streaming(filas, formato: str = "json", gzip: bool = False, columnas=None, nombre: str = "export"):
+    """
+    StreamingResponse que formatea cada fila al vuelo; la memoria usada no
+    depende del tamaño del export.
+    """
+    cuerpo = _a_bytes(_serializar(filas, formato, columnas))
+    headers = {"Content-Disposition": f'inline; filename="{nombre}.{formato}"'}
+    if gzip:
+        cuerpo = _gzip(cuerpo)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(cuerpo, media_type=FORMATOS[formato], headers=headers)
+
+# === Export incremental (cambios desde una marca) ===
+def cambios_desde(movimientos, eliminados, filtro: dict, marca: str | None, limite: int, retraso: float):
+    """
+    Movimientos insertados y eliminados después de `marca` (un ObjectId), en
+    orden. Solo se consideran ids anteriores a ahora - `retraso` segundos, para
+    no saltarse inserciones que aún estén en vuelo con un _id menor.
+    Devuelve (cambios, nueva_marca, hay_mas).
+    """
+    corte = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=retraso))
+    rango = {"$lt": corte}
+    if marca:
+        desde = ObjectId(marca)
+        if desde >= corte:
+            return [], marca, False
+        rango["$gt"] = desde
+
+    insertados = list(movimientos.find({**filtro, "_id": rango}, SIN_INTERNOS).sort("_id", 1).limit(limite + 1))
+    borrados = list(eliminados.find({**filtro, "_id": rango}).sort("_id", 1).limit(limite + 1))
+    todos = sorted(
+        [("insert", d) for d in insertados] + [("delete", d) for d in borrados],
+        key=lambda par: par[1]["_id"],
+    )
+    hay_mas = len(todos) > limite
+    todos = todos[:limite]
+    nueva_marca = todos[-1][1]["_id"] if hay_mas else corte
+
+    cambios = []
+    for op, doc in todos:
+        if op == "insert":
+            cambios.append({"op": "insert", **formatear_fila(doc, con_id=True)})
+        else:
+            cambios.append({
+                "op": "delete",
+                "id": str(doc["movimiento_id"]),
+                "fecha": doc["fecha"].strftime("%Y-%m-%d %H:%M:%S"),
+            })
+    return cambios, str(nueva_marca), hay_mas
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from lru import CacheLRU
+from recursos import en_mongo
+
+logger = logging.getLogger("bot")
+
+PROCESANDO = {"estado": "procesando"}
+PENDIENTE = "pendiente"
+_escrito: ContextVar[list | None] = ContextVar("update_escrito", default=None)
+
+def marcar_escrito():
+    """
+    Avisa que el update en curso ya escribió algo que no se puede repetir
+    (insertar o borrar movimientos, crear un grupo). Se llama justo después de
+    la escritura; fuera de un update no hace nada. `en_mongo` copia el
+    contexto, así que sirve también desde el pool de hilos.
+    """
+    marca = _escrito.get()
+    if marca is not None:
+        marca[0] = True
+
+# === Deduplicación de updates de Telegram ===
+class RegistroUpdates:
+    """
+    Registra cada update_id la primera vez que llega. Un reenvío de Telegram
+    (mismo update_id) se detecta primero en memoria y si no, por la clave
+    única `_id` en Mongo, de modo que funciona entre reinicios y entre workers.
+    La colección debe tener un índice TTL sobre `fecha`.
+
+    Por polling los updates se guardan antes como `pendiente` con su cuerpo
+    (guardar_pendientes): así se puede confirmar el offset a Telegram sin
+    perderlos, y los que fallan antes de escribir vuelven a `pendiente` para
+    reintentarse (hasta `intentos` veces).
+    """
+
+    def __init__(self, coleccion, max_items: int = 10000, ttl: float = 172800, intentos: int = 5):
+        self.coleccion = coleccion
+        self.memoria = CacheLRU(max_items, ttl)
+        self.intentos = intentos
+        self.estadisticas = {"nuevos": 0, "duplicados": 0, "reintentos": 0, "descartados": 0}
+
+    async def guardar_pendientes(self, updates: list):
+        """
+        Registra como pendientes los updates recibidos por polling, en una sola
+        escritura. Los que ya estaban registrados se dejan como están.
+        """
+        if not updates:
+            return
+        ahora = datetime.utcnow()
+        docs = [{"_id": u["update_id"], "estado": PENDIENTE, "update": u, "intentos": 0, "fecha": ahora} for u in updates]
+        try:
+            await en_mongo(self.coleccion.insert_many, docs, ordered=False)
+        except BulkWriteError as e:
+            if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                raise
+
+    async def pendientes(self, excluir, limite: int) -> list:
+        """
+        Cuerpos de los updates pendientes (nuevos o por reintentar) que no están en `excluir`.
+        """
+        filtro = {"estado": PENDIENTE, "intentos": {"$lt": self.intentos}, "_id": {"$nin": list(excluir)}}
+        cursor = self.coleccion.find(filtro, {"update": 1}).sort("_id", 1).limit(limite)
+        return [d["update"] for d in await en_mongo(list, cursor)]
+
+    async def reclamar(self, update_id, pendiente: bool = False):
+        """
+        Devuelve (True, None) si hay que procesar el update, o (False, resultado)
+        si es un duplicado; `resultado` es el del primer procesamiento (o
+        {"estado": "procesando"} si aún no termina). Con `pendiente` primero
+        intenta tomar el registro que dejó guardar_pendientes.
+        """
+        previo = self.memoria.get(update_id)
+        if previo == PROCESANDO:
+            previo = None  # pudo terminar en otro worker: se relee de Mongo
+        if previo is None and pendiente:
+            tomado = await en_mongo(
+                self.coleccion.update_one, {"_id": update_id, "estado": PENDIENTE}, {"$set": {**PROCESANDO}},
+            )
+            if tomado.modified_count:
+                self.memoria.set(update_id, PROCESANDO)
+                self.estadisticas["nuevos"] += 1
+                return True, None
+        if previo is None:
+            try:
+                await en_mongo(self.coleccion.insert_one, {"_id": update_id, **PROCESANDO, "fecha": datetime.utcnow()})
+            except DuplicateKeyError:
+                doc = await en_mongo(self.coleccion.find_one, {"_id": update_id}) or {}
+                previo = doc.get("resultado") or PROCESANDO
+                self.memoria.set(update_id, previo)
+            else:
+                self.memoria.set(update_id, PROCESANDO)
+                self.estadisticas["nuevos"] += 1
+                return True, None
+        self.estadisticas["duplicados"] += 1
+        return False, previo
+
+    async def completar(self, update_id, resultado: dict):
+        self.memoria.set(update_id, resultado)
+        await en_mongo(
+            self.coleccion.update_one,
+            {"_id": update_id},
+            {"$set": {"estado": "hecho", "resultado": resultado}},
+        )
+
+    @asynccontextmanager
+    async def procesando(self, update_id):
+        """
+        Envuelve el procesamiento de un update reclamado. Si falla antes de
+        escribir, lo libera para reintentarlo (ver liberar); si ya
+        escribió (marcar_escrito), lo da por hecho con el error, porque
+        reintentarlo repetiría la escritura.
+        """
+        marca = [False]
+        token = _escrito.set(marca)
+        try:
+            yield
+        except (Exception, asyncio.CancelledError) as e:
+            if update_id is not None:
+                if marca[0]:
+                    await self.completar(update_id, {"respuesta": None, "error": type(e).__name__})
+                else:
+                    await self.liberar(update_id)
+            raise
+        finally:
+            _escrito.reset(token)
+
+    async def liberar(self, update_id):
+        """
+        Suelta un update que falló antes de escribir. Si llegó por polling
+        vuelve a `pendiente` para reintentarlo; si llegó por webhook se borra y
+        lo reintenta el reenvío de Telegram.
+        """
+        self.memoria.invalidar(update_id)
+        doc = await en_mongo(
+            self.coleccion.find_one_and_update,
+            {"_id": update_id, "update": {"$exists": True}},
+            {"$set": {"estado": PENDIENTE}, "$inc": {"intentos": 1}},
+            {"intentos": 1}, return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            await en_mongo(self.coleccion.delete_one, {"_id": update_id})
+        elif doc["intentos"] >= self.intentos:
+            self.estadisticas["descartados"] += 1
+            logger.error(f"❌ Update {update_id} descartado tras {doc['intentos']} intentos fallidos.")
+        else:
+            self.estadisticas["reintentos"] += 1
+
+    def resumen(self) -> dict:
+        return {**self.estadisticas, "memoria": len(self.memoria)}
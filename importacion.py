@@ -0,0 +1,256 @@
+import csv
+import json
+import time
+import codecs
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from dateutil import parser
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+import metricas
+from parser_local import normalizar
+from recursos import en_mongo
+from materializados import incrementar_saldos, incrementar_resumenes_dias, soltar_lote
+
+logger = logging.getLogger("bot")
+
+DUPLICADO = 11000
+MAX_ERRORES = 100  # errores por fila que se devuelven en el detalle
+LOTE_ABANDONADO = timedelta(minutes=10)  # un lote sin confirmar más viejo que esto se da por cortado
+
+# === Lectura en streaming ===
+async def lineas(trozos):
+    """
+    Líneas de texto de un cuerpo que llega en trozos de bytes (UTF-8, con o sin BOM).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    resto = ""
+    async for trozo in trozos:
+        resto += decoder.decode(trozo)
+        *completas, resto = resto.split("\n")
+        for linea in completas:
+            yield linea.rstrip("\r")
+    resto += decoder.decode(b"", final=True)
+    if resto.strip():
+        yield resto.rstrip("\r")
+
+async def filas_csv(lineas):
+    """
+    (número de fila, dict) de un CSV con cabecera. Acepta "," o ";" (Excel en
+    español) y campos entre comillas con saltos de línea.
+    """
+    columnas, separador, pendiente, numero = None, ",", "", 0
+    async for linea in lineas:
+        pendiente += linea
+        if pendiente.count('"') % 2:
+            pendiente += "\n"  # campo entre comillas que sigue en la línea siguiente
+            continue
+        texto, pendiente = pendiente, ""
+        if not texto.strip():
+            continue
+        if columnas is None:
+            separador = ";" if texto.count(";") > texto.count(",") else ","
+            columnas = [c.strip().lower() for c in next(csv.reader([texto], delimiter=separador))]
+            continue
+        numero += 1
+        yield numero, dict(zip(columnas, next(csv.reader([texto], delimiter=separador))))
+
+async def filas_ndjson(lineas):
+    """
+    (número de fila, objeto) de un NDJSON; None en las líneas que no son JSON.
+    """
+    numero = 0
+    async for linea in lineas:
+        if not linea.strip():
+            continue
+        numero += 1
+        try:
+            yield numero, json.loads(linea)
+        except ValueError:
+            yield numero, None
+
+# === Importación de movimientos ===
+class Importador:
+    """
+    Valida filas de movimientos históricos y las inserta por lotes con
+    insert_many ordenado; saldos y resúmenes diarios se actualizan con un
+    bulk_write por lote. Cada fila lleva un `import_key` (huella de su
+    contenido y de cuántas veces se repite en el archivo), así que volver a
+    importar el mismo archivo no duplica nada. Una instancia por importación.
+
+    Las filas se insertan marcadas con su `import_lote` y los contadores
+    anotan los lotes que ya sumaron; al terminar se quitan las marcas. Si el
+    proceso muere entre el insert y los contadores, la siguiente importación
+    (del mismo grupo) completa los lotes abandonados sin sumar dos veces.
+    """
+
+    def __init__(self, movimientos, saldos, resumenes, categorias, zona, clave: dict = None, archivo=None, lote: int = 1000):
+        self.movimientos = movimientos
+        self.saldos = saldos
+        self.resumenes = resumenes
+        self.zona = zona
+        self.clave = clave or {}
+        self.archivo = archivo
+        self.lote = lote
+        self._categorias = {normalizar(c): c for c in categorias}
+        # Prefijo de 8 bytes de la huella -> veces que apareció en este archivo.
+        # Es lo único que crece con el archivo (~100 bytes por fila distinta).
+        self._vistos = {}
+        self.estadisticas = {"filas": 0, "insertados": 0, "existentes": 0, "errores": 0, "reparados": 0}
+        self.errores = []
+
+    # --- Validación ---
+    def _fecha(self, valor) -> datetime:
+        if not valor:
+            raise ValueError("falta la fecha")
+        try:
+            fecha = parser.parse(str(valor))
+        except (ValueError, OverflowError):
+            raise ValueError(f"fecha inválida: {valor!r}")
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=self.zona)  # hora local del bot
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+        if fecha > datetime.utcnow() + timedelta(days=1):
+            raise ValueError(f"fecha futura: {valor!r}")
+        return fecha
+
+    def _monto(self, valor):
+        try:
+            monto = float(str(valor).strip().replace(",", ".")) if isinstance(valor, str) else float(valor)
+        except (TypeError, ValueError):
+            raise ValueError(f"monto inválido: {valor!r}")
+        if not monto > 0:
+            raise ValueError(f"monto inválido: {valor!r}")
+        return int(monto) if monto.is_integer() else monto
+
+    def validar(self, fila) -> dict:
+        """
+        Documento listo para insertar, o ValueError con el motivo.
+        """
+        if not isinstance(fila, dict):
+            raise ValueError("fila inválida (se esperaba un objeto JSON)")
+        tipo = normalizar(str(fila.get("tipo") or ""))
+        if tipo not in ("gasto", "ingreso"):
+            raise ValueError(f"tipo inválido: {fila.get('tipo')!r}")
+        categoria = self._categorias.get(normalizar(str(fila.get("categoria") or "")))
+        if categoria is None:
+            raise ValueError(f"categoría inválida: {fila.get('categoria')!r}")
+        monto = self._monto(fila.get("monto"))
+        fecha = self._fecha(fila.get("fecha"))
+        mensaje = str(fila.get("mensaje_original") or "").strip() or "(importado)"
+        chat_id = str(fila.get("chat_id") or "").strip()
+
+        contenido = "|".join(map(str, [*self.clave.values(), f"{fecha:%Y-%m-%dT%H:%M:%S}", tipo, monto, categoria, mensaje]))
+        huella = hashlib.sha1(contenido.encode()).digest()
+        corta = int.from_bytes(huella[:8], "big")
+        self._vistos[corta] = self._vistos.get(corta, 0) + 1
+        return {
+            "chat_id": int(chat_id) if chat_id.lstrip("-").isdigit() else None,
+            **self.clave,
+            "tipo": tipo,
+            "monto": monto,
+            "categoria": categoria,
+            "mensaje_original": mensaje,
+            "fecha": fecha,
+            "import_key": f"{huella.hex()}:{self._vistos[corta]}",
+        }
+
+    def _error(self, numero: int, motivo: str):
+        self.estadisticas["errores"] += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append({"fila": numero, "error": motivo})
+
+    # --- Escritura ---
+    def _materializar(self, lote: ObjectId, docs: list):
+        """
+        Suma `docs` a saldos y resúmenes (idempotente por lote) y confirma el lote.
+        """
+        incrementar_saldos(self.saldos, self.clave, docs, lote)
+        incrementar_resumenes_dias(self.resumenes, self.clave, docs, self.zona, lote)
+        self.movimientos.update_many({"import_lote": lote}, {"$unset": {"import_lote": ""}})
+        soltar_lote(self.saldos, lote)
+        soltar_lote(self.resumenes, lote)
+
+    def reparar(self) -> int:
+        """
+        Completa los lotes de importaciones cortadas entre el insert y los
+        contadores. Solo toca lotes de hace más de LOTE_ABANDONADO, para no
+        pisar una importación que sigue en curso.
+        """
+        limite = ObjectId.from_datetime(datetime.now(timezone.utc) - LOTE_ABANDONADO)
+        pendientes = {}
+        campos = {"import_lote": 1, "tipo": 1, "monto": 1, "categoria": 1, "fecha": 1}
+        for d in self.movimientos.find({**self.clave, "import_lote": {"$lt": limite}}, campos):
+            pendientes.setdefault(d["import_lote"], []).append(d)
+        for lote, docs in pendientes.items():
+            self._materializar(lote, docs)
+            logger.warning(f"🔧 Lote de importación {lote} completado: {len(docs)} movimientos sumados a los contadores.")
+        return sum(len(docs) for docs in pendientes.values())
+
+    def _insertar(self, docs: list):
+        """
+        Inserta en orden los documentos cuyo import_key aún no existe (en
+        movimientos ni en el archivo) y suma los insertados a los materializados.
+        """
+        lote = ObjectId()
+        for d in docs:
+            d["import_lote"] = lote
+        claves = [d["import_key"] for d in docs]
+        existentes = set()
+        for coleccion in (self.movimientos, self.archivo):
+            if coleccion is not None:
+                existentes |= {d["import_key"] for d in coleccion.find({"import_key": {"$in": claves}}, {"import_key": 1})}
+        nuevos = [d for d in docs if d["import_key"] not in existentes]
+        insertados = []
+        while nuevos:
+            try:
+                self.movimientos.insert_many(nuevos, ordered=True)
+            except BulkWriteError as e:
+                # Otra importación del mismo archivo en paralelo: se salta la fila repetida
+                error = e.details["writeErrors"][0]
+                if error["code"] != DUPLICADO:
+                    raise
+                insertados += nuevos[:error["index"]]
+                nuevos = nuevos[error["index"] + 1:]
+                continue
+            insertados += nuevos
+            break
+        if insertados:
+            self._materializar(lote, insertados)
+        self.estadisticas["insertados"] += len(insertados)
+        self.estadisticas["existentes"] += len(docs) - len(insertados)
+
+    async def importar(self, filas) -> dict:
+        """
+        Consume `filas` ((número, fila) de filas_csv o filas_ndjson) e inserta
+        cada `lote` filas válidas. Los lotes no dependen del tamaño del archivo;
+        solo la numeración de filas repetidas guarda una huella corta por fila.
+        """
+        t0 = time.perf_counter()
+        self.estadisticas["reparados"] = await en_mongo(self.reparar)
+        lote = []
+        async for numero, fila in filas:
+            self.estadisticas["filas"] += 1
+            try:
+                lote.append(self.validar(fila))
+            except ValueError as e:
+                self._error(numero, str(e))
+                continue
+            if len(lote) >= self.lote:
+                await en_mongo(self._insertar, lote)
+                lote = []
+        if lote:
+            await en_mongo(self._insertar, lote)
+
+        duracion = time.perf_counter() - t0
+        e = self.estadisticas
+        for resultado in ("insertados", "existentes", "errores"):
+            metricas.contar("bot_importacion_filas_total", e[resultado], resultado=resultado)
+        por_segundo = round(e["filas"] / duracion, 1) if duracion else 0
+        logger.info(
+            f"📥 Importación: {e['filas']} filas en {duracion:.1f} s ({por_segundo}/s), {e['insertados']} nuevas, "
+            f"{e['existentes']} ya importadas, {e['errores']} con errores"
+            + (f"; {e['reparados']} de un lote cortado sumadas a los contadores." if e["reparados"] else ".")
+        )
+        return {**e, "segundos": round(duracion, 2), "filas_por_segundo": por_segundo, "detalle_errores": self.errores}
@@ -0,0 +1,218 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+import httpx
+import metricas
+
+logger = logging.getLogger("bot")
+
+# === Configuración ===
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))                 # s por intento
+LLM_HEDGE_PERCENTIL = float(os.getenv("LLM_HEDGE_PERCENTIL", "0.9"))  # 0 = sin peticiones de respaldo
+LLM_HEDGE_MS = float(os.getenv("LLM_HEDGE_MS", "3000"))             # espera antes del respaldo sin historial
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "500"))
+CIRCUITO_FALLOS = int(os.getenv("CIRCUITO_FALLOS", "5"))            # fallos seguidos para abrir
+CIRCUITO_ESPERA = float(os.getenv("CIRCUITO_ESPERA", "30"))         # s abierto antes de probar de nuevo
+MUESTRAS_MIN = 20
+
+def abre_circuito(e: Exception) -> bool:
+    """
+    Solo los fallos del servicio cuentan para el circuito: red, timeout y HTTP
+    5xx/429. Un 4xx o una respuesta ilegible dependen del mensaje, no del modelo.
+    """
+    if isinstance(e, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return False
+
+class SinModelos(Exception):
+    """
+    Todos los modelos fallaron o tienen el circuito abierto.
+    """
+
+class _Circuito:
+    """
+    Se abre tras `umbral` fallos seguidos; pasado `espera` deja pasar una sola
+    petición de prueba (semiabierto) que lo cierra o lo vuelve a abrir.
+    """
+
+    def __init__(self, umbral: int, espera: float):
+        self.umbral = umbral
+        self.espera = espera
+        self.fallos = 0
+        self.abierto_hasta = 0.0
+        self.probando = False
+
+    def disponible(self) -> bool:
+        return self.fallos < self.umbral or (time.monotonic() >= self.abierto_hasta and not self.probando)
+
+    def permite(self) -> bool:
+        """
+        Como disponible(), pero reserva la petición de prueba si está semiabierto.
+        """
+        if not self.disponible():
+            return False
+        if self.fallos >= self.umbral:
+            self.probando = True
+        return True
+
+    def exito(self):
+        self.fallos = 0
+        self.probando = False
+
+    def fallo(self):
+        self.fallos += 1
+        self.probando = False
+        if self.fallos >= self.umbral:
+            self.abierto_hasta = time.monotonic() + self.espera
+
+    def cancelado(self):
+        self.probando = False
+
+    def estado(self) -> str:
+        if self.fallos < self.umbral:
+            return "cerrado"
+        return "abierto" if time.monotonic() < self.abierto_hasta or self.probando else "semiabierto"
+
+class _Modelo:
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.circuito = _Circuito(CIRCUITO_FALLOS, CIRCUITO_ESPERA)
+        self.latencias = deque(maxlen=500)
+        self.estadisticas = {"llamadas": 0, "exitos": 0, "fallos": 0, "invalidas": 0, "cancelados": 0, "respaldos": 0}
+
+    def percentil(self, p: float):
+        if not self.latencias:
+            return None
+        v = sorted(self.latencias)
+        return v[min(len(v) - 1, int(p * len(v)))]
+
+    def espera_respaldo(self) -> float:
+        if len(self.latencias) < MUESTRAS_MIN:
+            return LLM_HEDGE_MS / 1000
+        return min(LLM_TIMEOUT, max(LLM_HEDGE_MIN_MS / 1000, self.percentil(LLM_HEDGE_PERCENTIL)))
+
+    def resumen(self) -> dict:
+        p50, p95 = self.percentil(0.5), self.percentil(0.95)
+        return {
+            **self.estadisticas,
+            "circuito": self.circuito.estado(),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+# === Intérprete con varios modelos ===
+class InterpreteLLM:
+    """
+    Llama a `llamar(modelo, prompt, timeout, **opciones)` probando los modelos en
+    orden. Si el intento en curso tarda más que el percentil configurado de su
+    modelo, lanza en paralelo una petición de respaldo al siguiente (o, si no
+    hay otro, una sola vez al mismo) y se queda con la primera respuesta válida. Un fallo (HTTP, timeout o salida que
+    `parsear` no acepta) pasa al siguiente modelo de inmediato; los modelos con
+    el circuito abierto se saltan.
+    """
+
+    def __init__(self, llamar, modelos):
+        self.llamar = llamar
+        self.modelos = [_Modelo(m) for m in modelos]
+
+    async def _intentar(self, modelo: _Modelo, prompt, parsear, opciones: dict):
+        modelo.estadisticas["llamadas"] += 1
+        t0 = time.monotonic()
+        motivo = "http"
+        try:
+            respuesta = await asyncio.wait_for(self.llamar(modelo.nombre, prompt, LLM_TIMEOUT, **opciones), LLM_TIMEOUT)
+            motivo = "parse"
+            resultado = parsear(respuesta)
+        except asyncio.CancelledError:
+            modelo.estadisticas["cancelados"] += 1
+            modelo.circuito.cancelado()
+            metricas.contar("bot_llm_llamadas_total", modelo=modelo.nombre, resultado="cancelado")
+            raise
+        except Exception as e:
+            if motivo == "parse":
+                # El modelo respondió: no dice nada de su salud, solo se suelta la prueba si lo era
+                modelo.estadisticas["invalidas"] += 1
+                modelo.circuito.cancelado()
+                metricas.contar("bot_llm_respuestas_invalidas_total", modelo=modelo.nombre)
+                metricas.contar("bot_llm_llamadas_total", modelo=modelo.nombre, resultado="invalida")
+                logger.warning(f"⚠️ {modelo.nombre} respondió algo ilegible: {e!r}")
+                raise
+            if isinstance(e, asyncio.TimeoutError):
+                motivo = "timeout"
+            modelo.estadisticas["fallos"] += 1
+            if abre_circuito(e):
+                modelo.circuito.fallo()
+            else:
+                modelo.circuito.cancelado()
+            metricas.contar("bot_llm_errores_total", motivo=motivo, modelo=modelo.nombre)
+            metricas.contar("bot_llm_llamadas_total", modelo=modelo.nombre, resultado="fallo")
+            logger.warning(f"⚠️ {modelo.nombre} falló ({motivo}): {e!r}")
+            raise
+        duracion = time.monotonic() - t0
+        modelo.latencias.append(duracion)
+        modelo.estadisticas["exitos"] += 1
+        metricas.contar("bot_llm_llamadas_total", modelo=modelo.nombre, resultado="exito")
+        metricas.observar("bot_llm_segundos", duracion, modelo=modelo.nombre)
+        modelo.circuito.exito()
+        return resultado
+
+    def _siguiente(self, inicio: int, reservar: bool = True):
+        for i in range(inicio, len(self.modelos)):
+            circuito = self.modelos[i].circuito
+            if circuito.permite() if reservar else circuito.disponible():
+                return i
+        return None
+
+    async def completar(self, prompt, parsear, **opciones):
+        """
+        Devuelve `parsear(respuesta)` del primer modelo que responda bien, o
+        lanza SinModelos si no queda ninguno.
+        """
+        en_curso = {}  # tarea -> índice del modelo
+        ultimo_error = None
+        repetido = False
+
+        def lanzar(indice: int):
+            en_curso[asyncio.create_task(self._intentar(self.modelos[indice], prompt, parsear, opciones))] = indice
+
+        i = self._siguiente(0)  # posición en el orden de modelos
+        if i is not None:
+            lanzar(i)
+        try:
+            while en_curso:
+                actual = list(en_curso.values())[-1]
+                respaldo = not repetido or self._siguiente(i + 1, reservar=False) is not None
+                espera = self.modelos[actual].espera_respaldo() if respaldo and LLM_HEDGE_PERCENTIL > 0 else None
+                hechas, _ = await asyncio.wait(en_curso, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+                if not hechas:
+                    # El intento en curso va lento: respaldo con el siguiente modelo o, si no hay, con el mismo
+                    siguiente = self._siguiente(i + 1)
+                    if siguiente is None:
+                        siguiente, repetido = actual, True
+                    else:
+                        i = siguiente
+                    self.modelos[siguiente].estadisticas["respaldos"] += 1
+                    lanzar(siguiente)
+                    continue
+                for tarea in hechas:
+                    del en_curso[tarea]
+                    if tarea.exception() is None:
+                        return tarea.result()
+                    ultimo_error = tarea.exception()
+                if not en_curso:
+                    i = self._siguiente(i + 1)
+                    if i is not None:
+                        lanzar(i)
+        finally:
+            for tarea, indice in en_curso.items():
+                tarea.cancel()
+                # Una tarea cancelada antes de arrancar no llega a _intentar: se suelta aquí la prueba
+                self.modelos[indice].circuito.cancelado()
+        raise SinModelos(f"Ningún modelo disponible ({ultimo_error!r})")
+
+    def resumen(self) -> dict:
+        return {m.nombre: m.resumen() for m in self.modelos}
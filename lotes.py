@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import contextvars
+
+logger = logging.getLogger("bot")
+
+# === Micro-lotes de llamadas al modelo ===
+class AgrupadorLLM:
+    """
+    Junta los textos que llegan dentro de una ventana corta (o hasta `max_items`)
+    y los interpreta con una sola llamada `procesar_lote(textos) -> list`.
+    Si la respuesta del lote no sirve, cae a `procesar_uno(texto)` por cada
+    texto afectado, así un lote malo nunca deja un update sin respuesta.
+    """
+
+    def __init__(self, procesar_lote, procesar_uno, ventana_ms: float = 100, max_items: int = 8):
+        self.procesar_lote = procesar_lote
+        self.procesar_uno = procesar_uno
+        self.ventana = ventana_ms / 1000
+        self.max_items = max(1, max_items)
+        self._pendientes = []
+        self._temporizador = None
+        self._tareas = set()  # referencias fuertes: el loop solo guarda débiles y el GC podría cortar un lote
+        self.estadisticas = {"lotes": 0, "mensajes": 0, "lotes_fallidos": 0, "individuales": 0}
+
+    async def interpretar(self, texto: str) -> dict:
+        fut = asyncio.get_running_loop().create_future()
+        self._pendientes.append((texto, fut))
+        if len(self._pendientes) >= self.max_items:
+            self._despachar()
+        elif self._temporizador is None:
+            self._temporizador = asyncio.get_running_loop().call_later(self.ventana, self._despachar)
+        return await fut
+
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        lote, self._pendientes = self._pendientes, []
+        if lote:
+            # Contexto vacío: el tramo del lote no se atribuye solo al update que lo disparó
+            tarea = contextvars.Context().run(asyncio.create_task, self._enviar(lote))
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+
+    async def _enviar(self, lote):
+        textos = [t for t, _ in lote]
+        resultados = [None] * len(lote)
+        if len(lote) > 1:
+            self.estadisticas["lotes"] += 1
+            self.estadisticas["mensajes"] += len(lote)
+            try:
+                respuesta = await self.procesar_lote(textos)
+                if not isinstance(respuesta, list) or len(respuesta) != len(lote):
+                    raise ValueError(f"se esperaban {len(lote)} resultados")
+                resultados = [r if isinstance(r, dict) and "tipo" in r else None for r in respuesta]
+            except Exception as e:
+                self.estadisticas["lotes_fallidos"] += 1
+                logger.warning(f"⚠️ Lote de {len(lote)} mensajes inválido ({e}); se interpretan uno por uno.")
+
+        faltantes = [i for i, r in enumerate(resultados) if r is None]
+        self.estadisticas["individuales"] += len(faltantes)
+        individuales = await asyncio.gather(
+            *(self.procesar_uno(textos[i]) for i in faltantes), return_exceptions=True
+        )
+        for i, r in zip(faltantes, individuales):
+            resultados[i] = r if isinstance(r, dict) else {"error": str(r)}
+
+        for (_, fut), r in zip(lote, resultados):
+            if not fut.done():
+                fut.set_result(r)
+
+    def resumen(self) -> dict:
+        lotes = self.estadisticas["lotes"]
+        return {**self.estadisticas, "tamano_medio": self.estadisticas["mensajes"] / lotes if lotes else 0.0}
@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+
+# === Cache LRU en memoria con expiración ===
+class CacheLRU:
+    """
+    Diccionario acotado: descarta el elemento menos usado al superar `max_items`
+    y trata como ausentes las entradas con más de `ttl` segundos.
+    """
+
+    def __init__(self, max_items: int = 1000, ttl: float = 300):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self.estadisticas = {"aciertos": 0, "fallos": 0, "expulsiones": 0, "expiraciones": 0}
+
+    def __len__(self):
+        return len(self._datos)
+
+    def get(self, clave, default=None):
+        item = self._datos.get(clave)
+        if item is None:
+            self.estadisticas["fallos"] += 1
+            return default
+        valor, expira = item
+        if expira < time.monotonic():
+            del self._datos[clave]
+            self.estadisticas["expiraciones"] += 1
+            self.estadisticas["fallos"] += 1
+            return default
+        self._datos.move_to_end(clave)
+        self.estadisticas["aciertos"] += 1
+        return valor
+
+    def ver(self, clave, default=None):
+        """
+        Como get(), sin contar en las estadísticas ni cambiar el orden.
+        """
+        item = self._datos.get(clave)
+        if item is None or item[1] < time.monotonic():
+            return default
+        return item[0]
+
+    def set(self, clave, valor):
+        self._datos[clave] = (valor, time.monotonic() + self.ttl)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_items:
+            self._datos.popitem(last=False)
+            self.estadisticas["expulsiones"] += 1
+
+    def invalidar(self, clave):
+        self._datos.pop(clave, None)
+
+    def limpiar(self):
+        self._datos.clear()
+
+    def resumen(self) -> dict:
+        return {**self.estadisticas, "tamano": len(self._datos)}
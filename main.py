@@ -1,30 +1,106 @@
+import time
+T_INICIO = time.perf_counter()  # antes del resto de imports: el arranque medido los incluye
 import os
-import json
+import asyncio
 import logging
 import re
+from contextlib import asynccontextmanager
 from datetime import datetime
+from zoneinfo import ZoneInfo
 from fastapi import FastAPI, Request, Query
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from pymongo import MongoClient
+from fastapi.responses import JSONResponse, PlainTextResponse
 from bson import ObjectId
 from dateutil import parser
 from dotenv import load_dotenv
 import certifi
-import httpx
+from recursos import get_http, en_mongo, cerrar, configurar_mongo, get_mongo, Coleccion
+from cola import ColaPorChat
+from idempotencia import PROCESANDO, RegistroUpdates, marcar_escrito
+from enviador import EnviadorTelegram
+from exportacion import FORMATOS, SIN_INTERNOS, formatear_fila, filas_en_lotes, unir_flujos, respuesta_streaming, cambios_desde
+from importacion import Importador, lineas, filas_csv, filas_ndjson
+import parser_local
+import metricas
+from cache_interpretaciones import CacheInterpretaciones, version_interpretacion
+from lotes import AgrupadorLLM
+from prompts import CompiladorPrompt
+from interprete import InterpreteLLM, SinModelos
+from admision import Admision, Saturado
+from esquema import manifiesto, crear_indices, verificar_indices, asegurar_indices
+from archivo import Archivador
+from materializados import (
+    incrementar_saldo, incrementar_saldos, verificar_saldos, dia_local, incrementar_resumen,
+    incrementar_resumenes, rango_periodo, totales_periodo, verificar_resumenes, filas_resumen,
+)
 
 load_dotenv()
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque y cierre del proceso. No espera a Mongo: el cliente se crea en la
+    primera operación y los índices se revisan en segundo plano (los crea si
+    faltan, salvo INDICES_AL_ARRANCAR=0; el deploy puede correr antes
+    `python main.py indices`).
+    """
+    if cola_updates:
+        cola_updates.iniciar()
+    tarea_indices = asyncio.create_task(revisar_indices())
+    ARRANQUE["listo_ms"] = round((time.perf_counter() - T_INICIO) * 1000, 1)
+    logger.info(f"🚀 Listo en {ARRANQUE['listo_ms']:.0f} ms desde el import")
+    yield
+    tarea_indices.cancel()
+    if cola_updates:
+        await cola_updates.detener(COLA_DRAIN_SEGUNDOS)
+    await cerrar()
+
+async def revisar_indices():
+    try:
+        faltan = await asegurar_indices(get_mongo()[MONGO_DB], INDICES, INDICES_AL_ARRANCAR, "python main.py indices")
+    except Exception as e:
+        logger.error(f"❌ No se pudieron revisar los índices al arrancar: {e!r}")
+        return
+    ARRANQUE["indices_unicos_faltantes"] = len(faltan)
+
+app = FastAPI(lifespan=lifespan)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("bot")
 
 # === Variables de entorno ===
 TOKEN = os.getenv("BOT_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB = os.getenv("MONGO_DB", "telegram_gastos")
+MONGO_TLS = os.getenv("MONGO_TLS", "1") == "1"  # 0 para un mongod local sin TLS (benchmarks)
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "mistralai/mistral-7b-instruct")
-BASE_URL = f"https://api.telegram.org/bot{TOKEN}"
+# Lista ordenada de modelos (failover); por defecto solo OPENROUTER_MODEL
+OPENROUTER_MODELS = [m.strip() for m in os.getenv("OPENROUTER_MODELS", OPENROUTER_MODEL).split(",") if m.strip()]
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+BASE_URL = f"{TELEGRAM_API_URL}/bot{TOKEN}"
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 GOOGLE_SHEET_URL = os.getenv("GOOGLE_SHEET_URL")
+ZONA_HORARIA = os.getenv("ZONA_HORARIA", "America/Lima")
+ZONA = ZoneInfo(ZONA_HORARIA)
+WEBHOOK_COLA = os.getenv("WEBHOOK_COLA", "0") == "1"
+COLA_WORKERS = int(os.getenv("COLA_WORKERS", "8"))
+COLA_MAX = int(os.getenv("COLA_MAX", "1000"))
+COLA_DRAIN_SEGUNDOS = float(os.getenv("COLA_DRAIN_SEGUNDOS", "10"))
+PARSER_LOCAL = os.getenv("PARSER_LOCAL", "1") == "1"
+INTERP_CACHE_MAX = int(os.getenv("INTERP_CACHE_MAX", "5000"))
+INTERP_CACHE_TTL = int(os.getenv("INTERP_CACHE_TTL", "86400"))
+INTERP_CACHE_MONGO = os.getenv("INTERP_CACHE_MONGO", "0") == "1"
+EXPORT_LOTE = int(os.getenv("EXPORT_LOTE", "1000"))
+IMPORT_LOTE = int(os.getenv("IMPORT_LOTE", "1000"))
+ELIMINADOS_TTL_DIAS = int(os.getenv("ELIMINADOS_TTL_DIAS", "90"))
+CAMBIOS_RETRASO_SEGUNDOS = float(os.getenv("CAMBIOS_RETRASO_SEGUNDOS", "5"))
+ARCHIVO_MESES = int(os.getenv("ARCHIVO_MESES", "12"))  # meses cerrados que quedan en movimientos
+ARCHIVO_LOTE = int(os.getenv("ARCHIVO_LOTE", "1000"))
+ARCHIVO_PAUSA_MS = float(os.getenv("ARCHIVO_PAUSA_MS", "0"))  # pausa entre lotes para no competir con el tráfico
+IDEMPOTENCIA_MAX = int(os.getenv("IDEMPOTENCIA_MAX", "10000"))
+IDEMPOTENCIA_TTL = int(os.getenv("IDEMPOTENCIA_TTL", "172800"))
+INDICES_AL_ARRANCAR = os.getenv("INDICES_AL_ARRANCAR", "1") == "1"  # crear en segundo plano los índices que falten
+OPENROUTER_LOTE_MS = float(os.getenv("OPENROUTER_LOTE_MS", "0"))  # 0 = una llamada por mensaje
+OPENROUTER_LOTE_MAX = int(os.getenv("OPENROUTER_LOTE_MAX", "8"))
 
 # === Categorías válidas ===
 CATEGORIAS_VALIDAS = [
@@ -33,55 +109,125 @@ CATEGORIAS_VALIDAS = [
 ]
 
 # === MongoDB ===
-mongo_client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-db = mongo_client["telegram_gastos"]
-movimientos = db["movimientos"]
+# Sin conexión al importar: el cliente se crea en la primera operación
+configurar_mongo(
+    MONGO_URI, event_listeners=[metricas.ListenerMongo()], **({"tlsCAFile": certifi.where()} if MONGO_TLS else {})
+)
+movimientos = Coleccion(MONGO_DB, "movimientos")
+cache_llm = Coleccion(MONGO_DB, "cache_interpretaciones")
+saldos = Coleccion(MONGO_DB, "saldos")
+resumen_diario = Coleccion(MONGO_DB, "resumen_diario")
+eliminados = Coleccion(MONGO_DB, "eliminados")
+updates = Coleccion(MONGO_DB, "updates")
+movimientos_archivo = Coleccion(MONGO_DB, "movimientos_archivo")
+resumen_mensual = Coleccion(MONGO_DB, "resumen_mensual")
+mantenimiento = Coleccion(MONGO_DB, "mantenimiento")
+
+INDICES = manifiesto(
+    False, ELIMINADOS_TTL_DIAS * 86400, IDEMPOTENCIA_TTL, INTERP_CACHE_TTL if INTERP_CACHE_MONGO else None
+)
 
 # === Prompt OpenRouter ===
-def generar_prompt(texto_usuario):
-    return f"""
-Eres un asistente que interpreta mensajes financieros enviados por usuarios en lenguaje natural.
-A partir del mensaje del usuario, devuelve un JSON con tres claves: "tipo", "monto" y "categoria".
-
-Reglas:
-- "tipo" puede ser uno de los siguientes valores:
-    • "gasto": si el mensaje describe un gasto. (Ej: "gasté", "pagué", "compré"). Tambien es el valor por defecto si no se identifica otro tipo o no se da mayor detalle.
-    • "ingreso": si el mensaje describe un ingreso, ahorro o cualquier sinonimo de agregar. (Ej: "ahorré", "guardé", "recibí").
-    • "reporte": si el mensaje solicita un resumen, reporte o saldo de alguna categoría o general.
-    • "info": si el usuario pide ayuda, ejemplos o funcionamiento del bot.
-    • "eliminar": si el usuario desea borrar un movimiento por su ID.
-- "monto": número positivo extraído del texto. Si el tipo es "reporte", "info" o "eliminar", debe colocarse como 0.
-- "categoria": debe ser una de las siguientes (sin tildes ni errores ortográficos): salud, skincare, limpieza, alimentacion, transporte, salidas, ropa, plantas, arreglos casa, vacaciones. Si el texto no menciona una categoría válida o no aplica (como en "info" o "eliminar"), puede ir como cadena vacía "".
-
-Ejemplo:
-{{"tipo": "gasto", "monto": 25, "categoria": "transporte"}}
-
-Mensaje del usuario: "{texto_usuario}"
-""".strip()
+# Instrucciones compiladas una vez: el mensaje de sistema es el mismo en cada llamada
+prompts = CompiladorPrompt(CATEGORIAS_VALIDAS)
 
 # === Procesamiento con modelo ===
-def procesar_con_openrouter(texto_usuario: str):
+async def llamar_openrouter(modelo: str, mensajes: list, timeout: float = 30, lote: bool = False) -> dict:
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
         "HTTP-Referer": "https://tubot.com"
     }
     body = {
-        "model": OPENROUTER_MODEL,
-        "messages": [{"role": "user", "content": generar_prompt(texto_usuario)}]
+        "model": modelo,
+        "messages": mensajes,
+        **prompts.opciones(lote),
     }
+    response = await get_http().post(OPENROUTER_URL, headers=headers, json=body, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+interprete = InterpreteLLM(llamar_openrouter, OPENROUTER_MODELS)
+admision = Admision()
+
+async def procesar_con_openrouter(texto_usuario: str):
+    """
+    Interpreta con el primer modelo disponible; si no responde ninguno, usa la
+    interpretación aproximada local antes de rendirse.
+    """
     try:
-        response = httpx.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body, timeout=30)
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        match = re.search(r'\{.*?\}', content, re.DOTALL)
-        if match:
-            return json.loads(match.group())
+        with metricas.etapa("llm"):
+            async with admision.turno_llm():
+                return await interprete.completar(prompts.mensajes(texto_usuario), prompts.leer)
+    except (SinModelos, Saturado) as e:
+        logger.error(f"❌ OpenRouter no disponible: {e}")
+        metricas.contar("bot_interpretaciones_total", fuente="aproximada")
+        return parser_local.interpretar_aproximado(texto_usuario, CATEGORIAS_VALIDAS) or {"error": str(e)}
+
+async def procesar_lote_openrouter(textos):
+    """
+    Interpreta varios mensajes en una llamada. Si algo falla lanza la
+    excepción y el agrupador los reintenta uno por uno.
+    """
+    with metricas.etapa("llm"):
+        async with admision.turno_llm():
+            return await interprete.completar(prompts.mensajes_lote(textos), prompts.leer_lote, lote=True)
+
+agrupador_llm = (
+    AgrupadorLLM(procesar_lote_openrouter, procesar_con_openrouter, OPENROUTER_LOTE_MS, OPENROUTER_LOTE_MAX)
+    if OPENROUTER_LOTE_MS > 0 else None
+)
+
+cache_interpretaciones = CacheInterpretaciones(
+    version_interpretacion(",".join(OPENROUTER_MODELS), CATEGORIAS_VALIDAS, prompts.version),
+    INTERP_CACHE_MAX, INTERP_CACHE_TTL, cache_llm if INTERP_CACHE_MONGO else None,
+)
+
+async def interpretar(texto_usuario: str, chat_id=None):
+    """
+    Intenta primero el parser local y luego la cache; solo consulta a OpenRouter
+    si ninguno tiene una interpretación y el chat no pasó su límite.
+    """
+    if PARSER_LOCAL:
+        resultado = parser_local.interpretar_local(texto_usuario, CATEGORIAS_VALIDAS)
+        if resultado:
+            metricas.contar("bot_interpretaciones_total", fuente="local")
+            return resultado
+    with metricas.etapa("cache"):
+        resultado = await cache_interpretaciones.buscar(texto_usuario)
+    if resultado:
+        metricas.contar("bot_interpretaciones_total", fuente="cache")
+        return resultado
+    motivo = admision.limitar(chat_id)
+    if motivo:
+        return {"error": f"límite de {motivo}", "limitado": motivo}
+    metricas.contar("bot_interpretaciones_total", fuente="llm")
+    if agrupador_llm:
+        with metricas.etapa("llm_lote"):
+            resultado = await agrupador_llm.interpretar(texto_usuario)
+    else:
+        resultado = await procesar_con_openrouter(texto_usuario)
+    if not resultado.get("aproximado"):
+        await cache_interpretaciones.guardar(texto_usuario, resultado)
+    return resultado
+
+def separar_movimientos(resultado: dict):
+    """
+    (válidos, descartados) de un resultado "varios": válidos son los de tipo
+    gasto/ingreso con categoría conocida y monto positivo.
+    """
+    validos, descartados = [], 0
+    items = resultado.get("movimientos")
+    for m in items if isinstance(items, list) else []:
+        monto = m.get("monto") if isinstance(m, dict) else None
+        if (
+            isinstance(monto, (int, float)) and monto > 0
+            and m.get("tipo") in ("gasto", "ingreso") and m.get("categoria") in CATEGORIAS_VALIDAS
+        ):
+            validos.append({"tipo": m["tipo"], "monto": monto, "categoria": m["categoria"]})
         else:
-            raise ValueError("❌ No se encontró JSON válido en la respuesta.")
-    except Exception as e:
-        logger.exception("❌ Error en OpenRouter:")
-        return {"error": str(e)}
+            descartados += 1
+    return validos, descartados
 
 # === Utilidades MongoDB ===
 def guardar_movimiento(chat_id, tipo, monto, categoria, mensaje_original):
@@ -94,51 +240,104 @@ def guardar_movimiento(chat_id, tipo, monto, categoria, mensaje_original):
         "fecha": datetime.utcnow()
     }
     result = movimientos.insert_one(doc)
+    marcar_escrito()
+    incrementar_resumen(resumen_diario, {}, dia_local(doc["fecha"], ZONA), categoria, tipo, monto)
+    incrementar_saldo(saldos, {"categoria": categoria}, tipo, monto)
     return result.inserted_id
 
+def guardar_movimientos(chat_id, items, mensaje_original):
+    """
+    Varios movimientos de un mismo mensaje: un insert_many y un bulk_write por
+    colección materializada. Devuelve los IDs en el orden de `items`.
+    """
+    fecha = datetime.utcnow()
+    docs = [{"chat_id": chat_id, **m, "mensaje_original": mensaje_original, "fecha": fecha} for m in items]
+    result = movimientos.insert_many(docs)
+    marcar_escrito()
+    incrementar_resumenes(resumen_diario, {}, dia_local(fecha, ZONA), items)
+    incrementar_saldos(saldos, {}, items)
+    return result.inserted_ids
+
 def eliminar_movimiento_por_id(doc_id, chat_id):
     try:
-        result = movimientos.delete_one({"_id": ObjectId(doc_id), "chat_id": chat_id})
-        return result.deleted_count > 0
+        doc = movimientos.find_one_and_delete({"_id": ObjectId(doc_id), "chat_id": chat_id})
     except:
         return False
+    if not doc:
+        return False
+    marcar_escrito()
+    # Marca de borrado para el export incremental
+    eliminados.insert_one({"movimiento_id": doc["_id"], "chat_id": chat_id, "fecha": datetime.utcnow()})
+    incrementar_resumen(resumen_diario, {}, dia_local(doc["fecha"], ZONA), doc["categoria"], doc["tipo"], -doc["monto"], -1)
+    incrementar_saldo(saldos, {"categoria": doc["categoria"]}, doc["tipo"], -doc["monto"], -1)
+    return True
 
 def obtener_saldo(categoria, chat_id=None):
     """
-    Saldo GLOBAL por categoría (sin filtrar por chat_id).
+    Saldo GLOBAL por categoría (sin filtrar por chat_id), leído de `saldos`.
     """
-    pipeline = [
-        {"$match": {"categoria": categoria}},
-        {"$group": {"_id": "$tipo", "total": {"$sum": "$monto"}}}
-    ]
-    result = list(movimientos.aggregate(pipeline))
-    ingresos = sum(r["total"] for r in result if r["_id"] == "ingreso")
-    gastos = sum(r["total"] for r in result if r["_id"] == "gasto")
-    return ingresos - gastos
+    doc = saldos.find_one({"categoria": categoria}) or {}
+    return doc.get("ingreso", 0) - doc.get("gasto", 0)
 
-def obtener_reporte_general(chat_id=None):
+def obtener_saldos(categorias, chat_id=None) -> dict:
     """
-    Reporte GLOBAL por categorías (sin filtrar por chat_id).
+    Saldos GLOBALES de varias categorías con una sola consulta, en el orden recibido.
     """
-    pipeline = [
-        {"$group": {"_id": {"categoria": "$categoria", "tipo": "$tipo"}, "total": {"$sum": "$monto"}}}
-    ]
-    result = list(movimientos.aggregate(pipeline))
+    docs = {d["categoria"]: d for d in saldos.find({"categoria": {"$in": list(categorias)}})}
+    return {c: docs.get(c, {}).get("ingreso", 0) - docs.get(c, {}).get("gasto", 0) for c in categorias}
 
-    saldos = {}
-    for r in result:
-        cat = r["_id"]["categoria"]
-        tipo = r["_id"]["tipo"]
-        saldos.setdefault(cat, {"ingreso": 0, "gasto": 0})
-        saldos[cat][tipo] += r["total"]
+def mensaje_varios(items, ids, saldos_actuales: dict, descartados: int = 0) -> str:
+    mensaje = f"✅ {len(items)} movimientos registrados:\n"
+    for m, doc_id in zip(items, ids):
+        mensaje += f"• {m['tipo'].title()} de S/ {m['monto']:.2f} en '{m['categoria']}' · 🆔 ID: `{doc_id}`\n"
+    if descartados:
+        mensaje += f"⚠️ {descartados} sin registrar (falta monto o categoría válida).\n"
+    mensaje += "\n💰 *Saldos actuales:*\n"
+    for cat, saldo in saldos_actuales.items():
+        mensaje += f"• {cat}: S/ {saldo:.2f}\n"
+    mensaje += f"\n[📄 Ver reporte en Google Sheets]({GOOGLE_SHEET_URL})"
+    return mensaje
 
+def obtener_reporte_general(chat_id=None):
+    """
+    Reporte GLOBAL por categorías (sin filtrar por chat_id).
+    """
     mensaje = "📊 *Reporte general de categorías:*\n"
-    for cat, vals in saldos.items():
-        saldo = vals["ingreso"] - vals["gasto"]
+    for vals in saldos.find({"n": {"$gt": 0}}):
+        cat = vals["categoria"]
+        saldo = vals.get("ingreso", 0) - vals.get("gasto", 0)
         mensaje += f"• {cat if cat else '(sin categoría)'}: S/ {saldo:.2f}\n"
     mensaje += f"\n[📄 Ver reporte en Google Sheets]({GOOGLE_SHEET_URL})"
     return mensaje
 
+def obtener_reporte_periodo(periodo, desde=None, hasta=None, categoria=None):
+    """
+    Gastos e ingresos de un periodo, sumando los resúmenes diarios.
+    """
+    inicio, fin, etiqueta = rango_periodo(periodo, datetime.now(ZONA).date(), desde, hasta)
+    totales = totales_periodo(resumen_diario, {}, inicio, fin, categoria)
+
+    titulo = f"en '{categoria}'" if categoria else "por categoría"
+    mensaje = f"📅 *Movimientos {titulo} ({etiqueta}):*\n"
+    if not totales:
+        mensaje += "No hay movimientos en este periodo.\n"
+    for cat, vals in sorted(totales.items()):
+        mensaje += f"• {cat}: gastos S/ {vals['gasto']:.2f} · ingresos S/ {vals['ingreso']:.2f}\n"
+    mensaje += f"\n[📄 Ver reporte en Google Sheets]({GOOGLE_SHEET_URL})"
+    return mensaje
+
+
+# === Telegram ===
+registro_updates = RegistroUpdates(updates, IDEMPOTENCIA_MAX, IDEMPOTENCIA_TTL)
+MSG_DESPACIO = (
+    "🐢 Estás enviando muchos mensajes seguidos que necesito interpretar con el modelo.\n"
+    "*No registré este mensaje*: espera unos segundos y vuelve a enviarlo."
+)
+enviador = EnviadorTelegram(BASE_URL)
+
+async def enviar_mensaje(chat_id, texto):
+    await enviador.enviar(chat_id, texto)
+
 
 # === Rutas ===
 @app.get("/")
@@ -149,14 +348,72 @@ async def root():
 @app.post(f"/{TOKEN}")
 async def telegram_webhook(req: Request):
     body = await req.json()
+    if "message" not in body:
+        return {"ok": True}
+    nuevo, previo = await reclamar_update(body)
+    if not nuevo and previo == PROCESANDO:
+        # Reenvío mientras el original sigue en curso: sin 2xx Telegram lo vuelve a intentar
+        # y recibe el resultado cuando esté (si el original falla, lo procesa el reenvío)
+        return JSONResponse(status_code=503, content={"error": "En proceso"})
+    if not nuevo:
+        # Reenvío de Telegram: no repetir efectos, devolver el resultado original
+        return {"ok": True, "duplicado": True, "resultado": previo}
+    update_id = body.get("update_id")
+    if cola_updates:
+        # Responde de inmediato; el update se procesa en segundo plano
+        if not cola_updates.encolar(body["message"]["chat"]["id"], body):
+            if update_id is not None:
+                await registro_updates.liberar(update_id)
+            return JSONResponse(status_code=503, content={"error": "Cola llena"})
+        return {"ok": True}
+    resultado = await manejar_update(body)
+    return {"ok": True, "resultado": resultado}
+
+async def reclamar_update(body: dict, pendiente: bool = False):
+    """
+    Registra el update_id; devuelve (False, resultado previo) si es un reenvío.
+    """
+    update_id = body.get("update_id")
+    if update_id is None:
+        return True, None
+    return await registro_updates.reclamar(update_id, pendiente)
+
+async def atender_update(body: dict):
+    """
+    Deduplica y procesa un update fuera del webhook (lo usa polling.py, que
+    antes lo guardó como pendiente en el registro).
+    """
+    nuevo, previo = await reclamar_update(body, pendiente=True)
+    return await manejar_update(body) if nuevo else previo
+
+async def manejar_update(body: dict):
+    """
+    Procesa el update y guarda su resultado para responder a posibles reenvíos.
+    """
+    update_id = body.get("update_id")
+    with metricas.medir_update(update_id):
+        async with registro_updates.procesando(update_id):
+            msg = await procesar_update(body)
+        resultado = {"respuesta": msg}
+        if update_id is not None:
+            with metricas.etapa("idempotencia"):
+                await registro_updates.completar(update_id, resultado)
+    return resultado
+
+async def procesar_update(body: dict):
     chat_id = body["message"]["chat"]["id"]
     text = body["message"].get("text", "").strip()
-    resultado = procesar_con_openrouter(text)
+    resultado = await interpretar(text, chat_id)
 
-    if "error" in resultado:
+    if resultado.get("limitado"):
+        metricas.marcar_tipo("limitado")
+        msg = MSG_DESPACIO
+    elif "error" in resultado:
+        metricas.marcar_tipo("error")
         msg = "⚠️ No pude interpretar tu mensaje. Intenta de nuevo."
     else:
         tipo = resultado.get("tipo")
+        metricas.marcar_tipo(tipo)
         monto = resultado.get("monto", 0)
         categoria = resultado.get("categoria", "")
 
@@ -165,25 +422,50 @@ async def telegram_webhook(req: Request):
                 "ℹ️ *Opciones disponibles:*\n"
                 "- Registrar gasto: 'gasté 50 en transporte'\n"
                 "- Registrar ingreso: 'ahorré 20 para salud'\n"
+                "- Varios a la vez: 'gasté 20 en transporte, 35 en alimentacion y 15 en salud'\n"
                 "- Ver reporte: 'reporte de ropa' o 'reporte general'\n"
+                "- Reporte por periodo: 'reporte de este mes' o 'gastos de la semana pasada en salidas'\n"
                 "- Eliminar: 'eliminar <ID>'\n"
                 "\nCategorías válidas:\n" + "\n".join(f"- {c}" for c in CATEGORIAS_VALIDAS)
             )
         elif tipo == "eliminar":
             match = re.search(r"[0-9a-f]{24}", text)
-            if match and eliminar_movimiento_por_id(match.group(), chat_id):
+            with metricas.etapa("eliminar_movimiento"):
+                eliminado = bool(match) and await en_mongo(eliminar_movimiento_por_id, match.group(), chat_id)
+            if eliminado:
                 msg = f"🗑️ Movimiento con ID `{match.group()}` eliminado correctamente."
             else:
                 msg = "❌ No se pudo eliminar. Verifica el ID."
         elif tipo == "reporte":
-            if categoria in CATEGORIAS_VALIDAS:
-                saldo = obtener_saldo(categoria, chat_id)
+            periodo = resultado.get("periodo") or ""
+            if periodo or resultado.get("desde") or resultado.get("hasta"):
+                try:
+                    with metricas.etapa("reporte_periodo"):
+                        msg = await en_mongo(
+                            obtener_reporte_periodo, periodo, resultado.get("desde"), resultado.get("hasta"),
+                            categoria if categoria in CATEGORIAS_VALIDAS else None,
+                        )
+                except (ValueError, OverflowError):
+                    msg = "⚠️ No entendí el periodo del reporte. Prueba con 'reporte de este mes'."
+            elif categoria in CATEGORIAS_VALIDAS:
+                with metricas.etapa("obtener_saldo"):
+                    saldo = await en_mongo(obtener_saldo, categoria, chat_id)
                 msg = f"💼 *Saldo en '{categoria}':*\nS/ {saldo:.2f}\n\n[📄 Ver reporte en Google Sheets]({GOOGLE_SHEET_URL})"
             else:
-                msg = obtener_reporte_general(chat_id)
+                with metricas.etapa("reporte_general"):
+                    msg = await en_mongo(obtener_reporte_general, chat_id)
+        elif tipo == "varios" and (varios := separar_movimientos(resultado))[0]:
+            items, descartados = varios
+            with metricas.etapa("guardar_movimiento"):
+                ids = await en_mongo(guardar_movimientos, chat_id, items, text)
+            with metricas.etapa("obtener_saldo"):
+                saldos_actuales = await en_mongo(obtener_saldos, list(dict.fromkeys(m["categoria"] for m in items)), chat_id)
+            msg = mensaje_varios(items, ids, saldos_actuales, descartados)
         elif tipo in ["gasto", "ingreso"] and categoria in CATEGORIAS_VALIDAS and monto > 0:
-            doc_id = guardar_movimiento(chat_id, tipo, monto, categoria, text)
-            saldo = obtener_saldo(categoria, chat_id)
+            with metricas.etapa("guardar_movimiento"):
+                doc_id = await en_mongo(guardar_movimiento, chat_id, tipo, monto, categoria, text)
+            with metricas.etapa("obtener_saldo"):
+                saldo = await en_mongo(obtener_saldo, categoria, chat_id)
             msg = (
                 f"✅ {tipo.title()} de S/ {monto:.2f} registrado en '{categoria}'.\n"
                 f"🆔 ID: `{doc_id}`\n"
@@ -193,19 +475,61 @@ async def telegram_webhook(req: Request):
         else:
             msg = "⚠️ No pude interpretar tu mensaje o faltan datos válidos."
 
-    httpx.post(f"{BASE_URL}/sendMessage", json={
-        "chat_id": chat_id,
-        "text": msg,
-        "parse_mode": "Markdown",
-        "disable_web_page_preview": True
-    })
-    return {"ok": True}
+    if resultado.get("aproximado"):
+        msg += "\n\n⚠️ _Interpretado en modo básico porque el modelo no está disponible; revisa que sea correcto._"
+    with metricas.etapa("telegram"):
+        await enviar_mensaje(chat_id, msg)
+    return msg
+
+cola_updates = ColaPorChat(manejar_update, COLA_WORKERS, COLA_MAX) if WEBHOOK_COLA else None
+
+# === Estadísticas ===
+@app.get("/estadisticas")
+async def estadisticas(clave: str = Query(...)):
+    if clave != os.getenv("EXPORT_PASS", "0000"):
+        return JSONResponse(status_code=401, content={"error": "No autorizado"})
+    return resumen_estadisticas()
+
+@app.get("/metrics")
+async def metrics(clave: str = Query(...)):
+    """
+    Métricas en formato Prometheus (configurar `params: {clave: [...]}` en el scrape).
+    """
+    if clave != os.getenv("EXPORT_PASS", "0000"):
+        return JSONResponse(status_code=401, content={"error": "No autorizado"})
+    return PlainTextResponse(metricas.texto_prometheus(resumen_estadisticas()), media_type="text/plain; version=0.0.4")
+
+def resumen_estadisticas() -> dict:
+    return {
+        "parser_local": {**parser_local.ESTADISTICAS, "tasa_aciertos": parser_local.tasa_aciertos()},
+        "cache_interpretaciones": cache_interpretaciones.resumen(),
+        "envios": enviador.resumen(),
+        "updates": registro_updates.resumen(),
+        "lotes_llm": agrupador_llm.resumen() if agrupador_llm else {},
+        "modelos": interprete.resumen(),
+        "prompts": prompts.resumen(),
+        "admision": admision.resumen(),
+        "arranque": ARRANQUE,
+        "cola": {"pendientes": cola_updates.pendientes() if cola_updates else 0},
+    }
 
 # === Exportar ===
+COLUMNAS_EXPORT = ["chat_id", "tipo", "monto", "categoria", "mensaje_original", "fecha"]
+
 @app.get("/exportar")
-async def exportar_data(clave: str = Query(...), desde: str = None, hasta: str = None):
+async def exportar_data(
+    clave: str = Query(...), desde: str = None, hasta: str = None, resumen: str = Query(None),
+    formato: str = Query("json", alias="format"), gzip: bool = False, after: str = None, limit: int = Query(None, ge=1),
+    archivados: bool = True,
+):
+    """
+    Movimientos (o totales con `resumen`), incluidos los de meses archivados
+    salvo `archivados=false`. Con `after`/`limit` se pagina por _id.
+    """
     if clave != os.getenv("EXPORT_PASS", "0000"):
         return JSONResponse(status_code=401, content={"error": "No autorizado"})
+    if formato not in FORMATOS:
+        return JSONResponse(status_code=400, content={"error": "format debe ser csv, ndjson o json"})
 
     query = {}
     if desde or hasta:
@@ -216,8 +540,124 @@ async def exportar_data(clave: str = Query(...), desde: str = None, hasta: str =
         except:
             return JSONResponse(status_code=400, content={"error": "Fechas inválidas"})
 
-    docs = list(movimientos.find(query, {"_id": 0}))
-    for doc in docs:
-        if isinstance(doc.get("fecha"), datetime):
-            doc["fecha"] = doc["fecha"].strftime("%Y-%m-%d %H:%M:%S")
-    return JSONResponse(content=jsonable_encoder(docs))
+    if resumen:
+        # Totales por día o por mes desde los resúmenes diarios
+        if resumen not in ("dia", "mes"):
+            return JSONResponse(status_code=400, content={"error": "resumen debe ser 'dia' o 'mes'"})
+        filtro = {k: v for k, v in query.items() if k != "fecha"}
+        if "fecha" in query:
+            filtro["dia"] = query["fecha"]
+        filas = filas_en_lotes(filas_resumen(resumen_diario, filtro, resumen), EXPORT_LOTE)
+        return respuesta_streaming(filas, formato, gzip, nombre=f"resumen_{resumen}")
+
+    # Paginación por _id (keyset): after=<último id recibido>&limit=N
+    paginado = bool(after or limit)
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except:
+            return JSONResponse(status_code=400, content={"error": "after inválido"})
+
+    # Primero el archivo (meses viejos); paginado, ambos se mezclan en orden de _id
+    flujos = []
+    for coleccion in ([movimientos_archivo] if archivados else []) + [movimientos]:
+        cursor = coleccion.find(query, SIN_INTERNOS if paginado else {"_id": 0, **SIN_INTERNOS}, batch_size=EXPORT_LOTE)
+        if paginado:
+            cursor = cursor.sort("_id", 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        flujos.append(filas_en_lotes(cursor, EXPORT_LOTE))
+    filas = (formatear_fila(doc, paginado) async for doc in unir_flujos(flujos, paginado, limit))
+    columnas = (["id"] if paginado else []) + COLUMNAS_EXPORT
+    return respuesta_streaming(filas, formato, gzip, columnas, nombre="movimientos")
+
+# === Exportar cambios (sincronización incremental) ===
+@app.get("/exportar/cambios")
+async def exportar_cambios(clave: str = Query(...), marca: str = None, limit: int = Query(5000, ge=1, le=50000)):
+    """
+    Inserciones y eliminaciones desde `marca`. La respuesta trae la nueva marca
+    para la siguiente llamada y `mas=true` si quedaron cambios por traer.
+    """
+    if clave != os.getenv("EXPORT_PASS", "0000"):
+        return JSONResponse(status_code=401, content={"error": "No autorizado"})
+    if marca and not ObjectId.is_valid(marca):
+        return JSONResponse(status_code=400, content={"error": "Marca inválida"})
+    cambios, nueva_marca, hay_mas = await en_mongo(
+        cambios_desde, movimientos, eliminados, {}, marca, limit, CAMBIOS_RETRASO_SEGUNDOS,
+    )
+    return {"cambios": cambios, "marca": nueva_marca, "mas": hay_mas}
+
+# === Importar ===
+@app.post("/importar")
+async def importar_data(req: Request, clave: str = Query(...), formato: str = Query("csv", alias="format")):
+    """
+    Carga movimientos históricos desde el cuerpo de la petición (CSV con
+    cabecera o NDJSON), leído en streaming. Campos: fecha, tipo, monto,
+    categoria y opcionales mensaje_original y chat_id; las fechas sin zona se
+    toman en la hora local del bot. Repetir la importación del mismo archivo
+    no duplica movimientos.
+    """
+    if clave != os.getenv("EXPORT_PASS", "0000"):
+        return JSONResponse(status_code=401, content={"error": "No autorizado"})
+    if formato not in ("csv", "ndjson"):
+        return JSONResponse(status_code=400, content={"error": "format debe ser csv o ndjson"})
+    importador = Importador(
+        movimientos, saldos, resumen_diario, CATEGORIAS_VALIDAS, ZONA, archivo=movimientos_archivo, lote=IMPORT_LOTE,
+    )
+    leer = filas_csv if formato == "csv" else filas_ndjson
+    return await importador.importar(leer(lineas(req.stream())))
+
+# === Comandos de mantenimiento ===
+archivador = Archivador(
+    movimientos, movimientos_archivo, resumen_mensual, mantenimiento, eliminados, [], ZONA,
+    ARCHIVO_LOTE, ARCHIVO_PAUSA_MS / 1000,
+)
+
+# === Arranque ===
+ARRANQUE = {"import_ms": round((time.perf_counter() - T_INICIO) * 1000, 1)}
+
+if __name__ == "__main__":
+    import argparse
+
+    cli = argparse.ArgumentParser(description="Mantenimiento del bot de gastos")
+    sub = cli.add_subparsers(dest="comando", required=True)
+    p_saldos = sub.add_parser("saldos", help="Verifica los saldos materializados contra movimientos")
+    p_saldos.add_argument("--corregir", action="store_true", help="Reescribe los saldos con diferencias")
+    p_resumenes = sub.add_parser("resumenes", help="Verifica los resúmenes diarios contra movimientos")
+    p_resumenes.add_argument("--corregir", action="store_true", help="Reescribe los resúmenes con diferencias")
+    p_indices = sub.add_parser("indices", help="Crea los índices del manifiesto (idempotente)")
+    p_indices.add_argument("--verificar", action="store_true", help="Solo compara con el manifiesto, sin cambios")
+    p_archivar = sub.add_parser("archivar", help="Archiva los movimientos de meses cerrados (reanudable)")
+    p_archivar.add_argument("--meses", type=int, default=ARCHIVO_MESES, help="Meses cerrados que quedan sin archivar")
+    p_restaurar = sub.add_parser("restaurar", help="Devuelve a movimientos un mes archivado")
+    p_restaurar.add_argument("mes", help="AAAA-MM")
+    args = cli.parse_args()
+
+    if args.comando == "saldos":
+        diferencias = verificar_saldos(movimientos, saldos, ["categoria"], args.corregir, resumen_mensual)
+        for d in diferencias:
+            print(f"• {d['clave']}: esperado {d['esperado']} / actual {d['actual']}")
+        print(f"{len(diferencias)} saldos con diferencias" + (" (corregidos)" if args.corregir and diferencias else ""))
+    elif args.comando == "resumenes":
+        diferencias = verificar_resumenes(movimientos, resumen_diario, [], ZONA_HORARIA, args.corregir, resumen_mensual)
+        for d in diferencias:
+            print(f"• {d['clave']}: esperado {d['esperado']} / actual {d['actual']}")
+        print(f"{len(diferencias)} resúmenes con diferencias" + (" (corregidos)" if args.corregir and diferencias else ""))
+    elif args.comando == "indices":
+        db = get_mongo()[MONGO_DB]
+        if not args.verificar:
+            acciones = crear_indices(db, INDICES)
+            print(f"{len(acciones)} cambios de índices" if acciones else "Índices al día")
+        diferencias = verificar_indices(db, INDICES)
+        for d in diferencias:
+            print(f"• {d['coleccion']} ({d['indice']}): {d['problema']}")
+        print(f"{len(diferencias)} índices distintos del manifiesto")
+        if diferencias:
+            raise SystemExit(1)
+    elif args.comando == "archivar":
+        r = archivador.archivar(args.meses)
+        print(f"{r['movimientos']} movimientos de {r['meses']} meses archivados (antes de {r['corte']:%Y-%m}) "
+              f"en {r['segundos']} s ({r['por_segundo']}/s)")
+    elif args.comando == "restaurar":
+        n = archivador.restaurar(datetime.strptime(args.mes, "%Y-%m"))
+        print(f"{n} movimientos restaurados")
@@ -0,0 +1,312 @@
+import logging
+from datetime import datetime, date, time, timedelta, timezone
+from dateutil import parser
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger("bot")
+
+TOLERANCIA = 1e-6
+DUPLICADO = 11000
+
+def _aplicar_incrementos(coleccion, incrementos: dict, lote=None):
+    """
+    Un bulk_write con un $inc (upsert) por {filtro: inc}. Con `lote`, cada
+    documento anota el lote en `lotes` y no lo vuelve a sumar: repetir un lote
+    es inofensivo (el upsert de uno ya aplicado choca con el índice único y se
+    ignora). Requiere el índice único de la colección.
+    """
+    if lote is None:
+        ops = [UpdateOne(dict(f), {"$inc": inc}, upsert=True) for f, inc in incrementos.items()]
+    else:
+        ops = [
+            UpdateOne({**dict(f), "lotes": {"$ne": lote}}, {"$inc": inc, "$push": {"lotes": lote}}, upsert=True)
+            for f, inc in incrementos.items()
+        ]
+    if not ops:
+        return
+    try:
+        coleccion.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        if lote is None or any(err["code"] != DUPLICADO for err in e.details["writeErrors"]):
+            raise
+
+def soltar_lote(coleccion, lote):
+    """
+    Quita la marca de un lote ya aplicado y confirmado.
+    """
+    coleccion.update_many({"lotes": lote}, {"$pull": {"lotes": lote}})
+
+# === Saldos materializados ===
+# Un documento por clave (categoria, o group_code + categoria) con los totales
+# acumulados de ingresos y gastos y la cantidad de movimientos.
+
+def incrementar_saldo(saldos, clave: dict, tipo: str, monto, n: int = 1):
+    saldos.update_one(clave, {"$inc": {tipo: monto, "n": n}}, upsert=True)
+
+def incrementar_saldos(saldos, clave: dict, items, lote=None):
+    """
+    Como incrementar_saldo para varios movimientos ({tipo, monto, categoria})
+    a la vez: una operación por categoría en un único bulk_write. `clave` no
+    incluye la categoría; `lote` lo hace idempotente (ver _aplicar_incrementos).
+    """
+    totales = {}
+    for m in items:
+        inc = totales.setdefault(tuple({**clave, "categoria": m["categoria"]}.items()), {"n": 0})
+        inc[m["tipo"]] = inc.get(m["tipo"], 0) + m["monto"]
+        inc["n"] += 1
+    _aplicar_incrementos(saldos, totales, lote)
+
+def _saldos_desde_movimientos(movimientos, campos, mensuales=None) -> dict:
+    pipeline = [
+        {"$match": {"tipo": {"$in": ["ingreso", "gasto"]}}},
+        {"$group": {
+            "_id": {**{c: f"${c}" for c in campos}, "tipo": "$tipo"},
+            "total": {"$sum": "$monto"},
+            "n": {"$sum": 1},
+        }},
+    ]
+    esperado = {}
+    for r in movimientos.aggregate(pipeline, allowDiskUse=True):
+        clave = tuple(r["_id"].get(c) for c in campos)
+        vals = esperado.setdefault(clave, {"ingreso": 0, "gasto": 0, "n": 0})
+        vals[r["_id"]["tipo"]] += r["total"]
+        vals["n"] += r["n"]
+    # Movimientos archivados: sus totales mensuales
+    for r in (mensuales.find({}, {"_id": 0}) if mensuales is not None else []):
+        vals = esperado.setdefault(tuple(r.get(c) for c in campos), {"ingreso": 0, "gasto": 0, "n": 0})
+        vals[r["tipo"]] += r["total"]
+        vals["n"] += r["n"]
+    return esperado
+
+def verificar_saldos(movimientos, saldos, campos, corregir: bool = False, mensuales=None) -> list:
+    """
+    Recalcula los saldos desde `movimientos` (más los totales de `mensuales`,
+    si hay meses archivados) y los compara con la colección materializada.
+    Devuelve la lista de diferencias; con `corregir=True` reescribe los
+    contadores con los valores recalculados.
+    """
+    esperado = _saldos_desde_movimientos(movimientos, campos, mensuales)
+    actual = {
+        tuple(d.get(c) for c in campos): d
+        for d in saldos.find({}, {"_id": 0})
+    }
+
+    diferencias = []
+    for clave in set(esperado) | set(actual):
+        e = esperado.get(clave, {"ingreso": 0, "gasto": 0, "n": 0})
+        a = actual.get(clave, {})
+        if any(abs((a.get(k) or 0) - e[k]) > TOLERANCIA for k in ("ingreso", "gasto", "n")):
+            diferencias.append({
+                "clave": dict(zip(campos, clave)),
+                "esperado": e,
+                "actual": {k: a.get(k, 0) for k in ("ingreso", "gasto", "n")},
+            })
+
+    if corregir and diferencias:
+        ops = [
+            ReplaceOne(d["clave"], {**d["clave"], **d["esperado"]}, upsert=True)
+            for d in diferencias
+        ]
+        saldos.bulk_write(ops, ordered=False)
+        logger.info(f"🔧 {len(ops)} saldos corregidos.")
+    return diferencias
+
+# === Resúmenes diarios (rollups) ===
+# Un documento por (clave, dia, categoria, tipo) con el total y la cantidad de
+# movimientos del día en la zona horaria del bot. Los reportes por periodo
+# suman unas pocas decenas de estos documentos en vez de recorrer movimientos.
+
+ETIQUETAS_PERIODO = {
+    "hoy": "hoy",
+    "semana": "esta semana",
+    "semana_pasada": "la semana pasada",
+    "mes": "este mes",
+    "mes_pasado": "el mes pasado",
+}
+
+def dia_local(fecha_utc: datetime, zona) -> datetime:
+    """
+    Medianoche (naive) del día local al que pertenece una fecha guardada en UTC.
+    """
+    local = fecha_utc.replace(tzinfo=timezone.utc).astimezone(zona)
+    return datetime(local.year, local.month, local.day)
+
+def incrementar_resumen(resumenes, clave: dict, dia: datetime, categoria: str, tipo: str, monto, n: int = 1):
+    resumenes.update_one(
+        {**clave, "dia": dia, "categoria": categoria, "tipo": tipo},
+        {"$inc": {"total": monto, "n": n}},
+        upsert=True,
+    )
+
+def incrementar_resumenes(resumenes, clave: dict, dia: datetime, items):
+    """
+    Como incrementar_resumen para varios movimientos del mismo día, en un único bulk_write.
+    """
+    totales = {}
+    for m in items:
+        inc = totales.setdefault((m["categoria"], m["tipo"]), {"total": 0, "n": 0})
+        inc["total"] += m["monto"]
+        inc["n"] += 1
+    ops = [
+        UpdateOne({**clave, "dia": dia, "categoria": cat, "tipo": tipo}, {"$inc": inc}, upsert=True)
+        for (cat, tipo), inc in totales.items()
+    ]
+    if ops:
+        resumenes.bulk_write(ops, ordered=False)
+
+def incrementar_resumenes_dias(resumenes, clave: dict, docs, zona, lote=None):
+    """
+    Como incrementar_resumenes para movimientos de días distintos (cada uno
+    con su `fecha` UTC), en un único bulk_write. `lote` como en incrementar_saldos.
+    """
+    totales = {}
+    for m in docs:
+        filtro = {**clave, "dia": dia_local(m["fecha"], zona), "categoria": m["categoria"], "tipo": m["tipo"]}
+        inc = totales.setdefault(tuple(filtro.items()), {"total": 0, "n": 0})
+        inc["total"] += m["monto"]
+        inc["n"] += 1
+    _aplicar_incrementos(resumenes, totales, lote)
+
+def rango_periodo(periodo: str, hoy: date, desde: str = None, hasta: str = None):
+    """
+    Devuelve (inicio, fin_exclusivo, etiqueta) en días locales para un periodo
+    con nombre ("mes", "semana_pasada", ...) o un rango explícito desde/hasta.
+    """
+    if desde or hasta:
+        inicio = parser.parse(desde).date() if desde else date(2000, 1, 1)
+        fin = parser.parse(hasta).date() if hasta else hoy
+        etiqueta = f"del {inicio:%d/%m/%Y} al {fin:%d/%m/%Y}"
+        fin += timedelta(days=1)
+    else:
+        if periodo == "hoy":
+            inicio, fin = hoy, hoy + timedelta(days=1)
+        elif periodo == "semana":
+            inicio = hoy - timedelta(days=hoy.weekday())
+            fin = inicio + timedelta(days=7)
+        elif periodo == "semana_pasada":
+            fin = hoy - timedelta(days=hoy.weekday())
+            inicio = fin - timedelta(days=7)
+        elif periodo == "mes":
+            inicio = hoy.replace(day=1)
+            fin = (inicio + timedelta(days=32)).replace(day=1)
+        elif periodo == "mes_pasado":
+            fin = hoy.replace(day=1)
+            inicio = (fin - timedelta(days=1)).replace(day=1)
+        else:
+            raise ValueError(f"Periodo desconocido: {periodo}")
+        etiqueta = ETIQUETAS_PERIODO[periodo]
+    return datetime.combine(inicio, time.min), datetime.combine(fin, time.min), etiqueta
+
+def totales_periodo(resumenes, clave: dict, inicio: datetime, fin: datetime, categoria: str = None) -> dict:
+    """
+    {categoria: {"ingreso": x, "gasto": y}} sumando los resúmenes diarios del rango.
+    """
+    filtro = {**clave, "dia": {"$gte": inicio, "$lt": fin}}
+    if categoria:
+        filtro["categoria"] = categoria
+    pipeline = [
+        {"$match": filtro},
+        {"$group": {"_id": {"categoria": "$categoria", "tipo": "$tipo"}, "total": {"$sum": "$total"}}},
+    ]
+    totales = {}
+    for r in resumenes.aggregate(pipeline):
+        vals = totales.setdefault(r["_id"]["categoria"], {"ingreso": 0, "gasto": 0})
+        vals[r["_id"]["tipo"]] += r["total"]
+    return totales
+
+def verificar_resumenes(movimientos, resumenes, campos, zona_nombre: str, corregir: bool = False, mensuales=None) -> list:
+    """
+    Igual que verificar_saldos, pero para los resúmenes diarios. Los meses
+    archivados se comparan sumados por mes contra `mensuales` más las filas
+    que aún estén vivas en ese mes (p. ej. importadas después de archivarlo;
+    el próximo `archivar` las mueve), y no se corrigen (hay que restaurar el
+    mes antes).
+    """
+    pipeline = [
+        {"$match": {"tipo": {"$in": ["ingreso", "gasto"]}}},
+        {"$group": {
+            "_id": {
+                **{c: f"${c}" for c in campos},
+                "dia": {"$dateFromParts": {
+                    "year": {"$year": {"date": "$fecha", "timezone": zona_nombre}},
+                    "month": {"$month": {"date": "$fecha", "timezone": zona_nombre}},
+                    "day": {"$dayOfMonth": {"date": "$fecha", "timezone": zona_nombre}},
+                }},
+                "categoria": "$categoria",
+                "tipo": "$tipo",
+            },
+            "total": {"$sum": "$monto"},
+            "n": {"$sum": 1},
+        }},
+    ]
+    llaves = [*campos, "dia", "categoria", "tipo"]
+    esperado = {
+        tuple(r["_id"].get(c) for c in llaves): {"total": r["total"], "n": r["n"]}
+        for r in movimientos.aggregate(pipeline, allowDiskUse=True)
+    }
+    archivados = {
+        tuple(r.get(c) for c in [*campos, "mes", "categoria", "tipo"]): r
+        for r in (mensuales.find({}, {"_id": 0}) if mensuales is not None else [])
+    }
+    meses_archivados = {clave[:len(campos) + 1] for clave in archivados}  # (clave, mes)
+    k = len(campos)
+    for clave in [c for c in esperado if (*c[:k], c[k].replace(day=1)) in meses_archivados]:
+        vivo = esperado.pop(clave)
+        mensual = (*clave[:k], clave[k].replace(day=1), *clave[k + 1:])
+        previo = archivados.get(mensual, {})
+        archivados[mensual] = {c: (previo.get(c) or 0) + vivo[c] for c in ("total", "n")}
+    actual, por_mes = {}, {}
+    for d in resumenes.find({}, {"_id": 0}):
+        mes = d["dia"].replace(day=1)
+        if (*(d.get(c) for c in campos), mes) in meses_archivados:
+            clave = (*(d.get(c) for c in campos), mes, d.get("categoria"), d.get("tipo"))
+            acumulado = por_mes.setdefault(clave, {"total": 0, "n": 0})
+            acumulado["total"] += d.get("total") or 0
+            acumulado["n"] += d.get("n") or 0
+        else:
+            actual[tuple(d.get(c) for c in llaves)] = d
+
+    diferencias = _diferencias(esperado, actual, llaves)
+    archivadas = _diferencias(archivados, por_mes, [*campos, "mes", "categoria", "tipo"])
+
+    if corregir and diferencias:
+        ops = [
+            ReplaceOne(d["clave"], {**d["clave"], **d["esperado"]}, upsert=True)
+            for d in diferencias
+        ]
+        resumenes.bulk_write(ops, ordered=False)
+        logger.info(f"🔧 {len(ops)} resúmenes diarios corregidos.")
+    return diferencias + archivadas
+
+def _diferencias(esperado: dict, actual: dict, llaves) -> list:
+    diferencias = []
+    for clave in set(esperado) | set(actual):
+        e = esperado.get(clave, {})
+        a = actual.get(clave, {})
+        if any(abs((a.get(k) or 0) - (e.get(k) or 0)) > TOLERANCIA for k in ("total", "n")):
+            diferencias.append({
+                "clave": dict(zip(llaves, clave)),
+                "esperado": {k: e.get(k, 0) for k in ("total", "n")},
+                "actual": {k: a.get(k, 0) for k in ("total", "n")},
+            })
+    return diferencias
+
+def filas_resumen(resumenes, filtro: dict, por: str = "dia"):
+    """
+    Filas de resumen para /exportar, por día o agregadas por mes.
+    """
+    filas = resumenes.find(filtro, {"_id": 0, "lotes": 0}).sort("dia", 1)
+    if por == "dia":
+        for f in filas:
+            f["dia"] = f["dia"].strftime("%Y-%m-%d")
+            yield f
+        return
+    meses = {}
+    for f in filas:
+        f["mes"] = f.pop("dia").strftime("%Y-%m")
+        clave = tuple(sorted((k, v) for k, v in f.items() if k not in ("total", "n")))
+        acumulado = meses.setdefault(clave, {**f, "total": 0, "n": 0})
+        acumulado["total"] += f["total"]
+        acumulado["n"] += f["n"]
+    yield from meses.values()
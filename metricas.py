@@ -0,0 +1,170 @@
+import os
+import time
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pymongo import monitoring
+
+logger = logging.getLogger("bot")
+
+# === Configuración ===
+METRICAS_LENTO_MS = float(os.getenv("METRICAS_LENTO_MS", "0"))  # 0 = sin log de updates lentos
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+AYUDA = {
+    "bot_updates_total": ("counter", "Updates procesados por intención"),
+    "bot_update_segundos": ("histogram", "Duración total de un update por intención"),
+    "bot_etapa_segundos": ("histogram", "Duración de cada etapa del procesamiento"),
+    "bot_interpretaciones_total": ("counter", "Interpretaciones por fuente (local, cache, llm)"),
+    "bot_llm_errores_total": ("counter", "Errores de OpenRouter por modelo y motivo (http, timeout)"),
+    "bot_llm_respuestas_invalidas_total": ("counter", "Respuestas de OpenRouter que no se pudieron leer, por modelo"),
+    "bot_llm_llamadas_total": ("counter", "Peticiones a OpenRouter por modelo y resultado"),
+    "bot_llm_segundos": ("histogram", "Latencia de las respuestas válidas por modelo"),
+    "bot_llm_tokens_total": ("counter", "Tokens de OpenRouter por intención y clase (prompt, completion, cacheados)"),
+    "bot_admision_rechazos_total": ("counter", "Updates o llamadas al modelo rechazados por límite (chat, grupo, llm)"),
+    "bot_importacion_filas_total": ("counter", "Filas de /importar por resultado (insertados, existentes, errores)"),
+    "bot_mongo_operaciones_total": ("counter", "Comandos enviados a MongoDB"),
+    "bot_mongo_errores_total": ("counter", "Comandos de MongoDB fallidos"),
+    "bot_mongo_segundos": ("histogram", "Duración de los comandos de MongoDB"),
+}
+
+# === Registro en memoria ===
+_contadores = defaultdict(float)   # (nombre, etiquetas) -> valor
+_histogramas = {}                  # (nombre, etiquetas) -> [conteos por bucket..., suma, n]
+_update: ContextVar[dict | None] = ContextVar("metricas_update", default=None)
+
+def _etiquetas(etiquetas: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+def contar(nombre: str, valor: float = 1, **etiquetas):
+    _contadores[(nombre, _etiquetas(etiquetas))] += valor
+
+def observar(nombre: str, segundos: float, **etiquetas):
+    clave = (nombre, _etiquetas(etiquetas))
+    h = _histogramas.get(clave)
+    if h is None:
+        h = _histogramas[clave] = [0] * len(BUCKETS) + [0.0, 0]
+    i = bisect_left(BUCKETS, segundos)
+    if i < len(BUCKETS):
+        h[i] += 1
+    h[-2] += segundos
+    h[-1] += 1
+
+# === Tramos por update ===
+@contextmanager
+def etapa(nombre: str):
+    """
+    Mide un tramo (llm, mongo, telegram...) y lo suma al desglose del update en curso.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        observar("bot_etapa_segundos", dt, etapa=nombre)
+        datos = _update.get()
+        if datos is not None:
+            datos["etapas"][nombre] = datos["etapas"].get(nombre, 0) + dt
+
+@contextmanager
+def medir_update(update_id=None):
+    """
+    Abre el contexto de un update: al terminar registra su duración por
+    intención y, si supera METRICAS_LENTO_MS, loguea el desglose por etapa.
+    """
+    datos = {"tipo": None, "etapas": {}, "mongo": 0}
+    token = _update.set(datos)
+    t0 = time.perf_counter()
+    try:
+        yield datos
+    finally:
+        total = time.perf_counter() - t0
+        _update.reset(token)
+        tipo = datos["tipo"] or "desconocido"
+        contar("bot_updates_total", tipo=tipo)
+        observar("bot_update_segundos", total, tipo=tipo)
+        if METRICAS_LENTO_MS and total * 1000 >= METRICAS_LENTO_MS:
+            desglose = ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in datos["etapas"].items())
+            logger.warning(
+                f"🐢 Update {update_id} lento: {total * 1000:.0f} ms (tipo={tipo}, mongo={datos['mongo']} ops) {desglose}"
+            )
+
+def marcar_tipo(tipo):
+    datos = _update.get()
+    if datos is not None:
+        datos["tipo"] = tipo or "desconocido"
+
+# === MongoDB ===
+class ListenerMongo(monitoring.CommandListener):
+    """
+    Cuenta y mide los comandos de pymongo. Corre en el hilo que hace la
+    llamada; `en_mongo` copia el contexto, así que las operaciones también se
+    atribuyen al update en curso.
+    """
+    IGNORADOS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo", "saslStart", "saslContinue"}
+
+    def started(self, event):
+        if event.command_name in self.IGNORADOS:
+            return
+        contar("bot_mongo_operaciones_total", comando=event.command_name)
+        datos = _update.get()
+        if datos is not None:
+            datos["mongo"] += 1
+
+    def succeeded(self, event):
+        if event.command_name not in self.IGNORADOS:
+            observar("bot_mongo_segundos", event.duration_micros / 1e6, comando=event.command_name)
+
+    def failed(self, event):
+        if event.command_name not in self.IGNORADOS:
+            contar("bot_mongo_errores_total", comando=event.command_name)
+
+# === Formato Prometheus ===
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _formatear(nombre: str, etiquetas: tuple, valor, extra: tuple = ()) -> str:
+    todas = etiquetas + extra
+    texto = ",".join(f'{k}="{_escapar(v)}"' for k, v in todas)
+    return f"{nombre}{{{texto}}} {valor}" if texto else f"{nombre} {valor}"
+
+def _nombre_estado(*partes) -> str:
+    return "_".join(
+        "".join(c if c.isalnum() else "_" for c in str(p)).lower() for p in partes
+    )
+
+def texto_prometheus(estado: dict | None = None) -> str:
+    """
+    Exposición en formato de texto de Prometheus. `estado` son los resúmenes de
+    /estadisticas ({fuente: {clave: número}}); se publican como gauges.
+    """
+    lineas = []
+    por_nombre = defaultdict(list)
+    for (nombre, etiquetas), valor in _contadores.items():
+        por_nombre[nombre].append((etiquetas, valor))
+    for (nombre, etiquetas), h in _histogramas.items():
+        por_nombre[nombre].append((etiquetas, h))
+
+    for nombre in sorted(por_nombre):
+        tipo, ayuda = AYUDA.get(nombre, ("untyped", nombre))
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+        for etiquetas, valor in sorted(por_nombre[nombre], key=lambda par: par[0]):
+            if tipo != "histogram":
+                lineas.append(_formatear(nombre, etiquetas, valor))
+                continue
+            acumulado = 0
+            for limite, n in zip(BUCKETS, valor):
+                acumulado += n
+                lineas.append(_formatear(f"{nombre}_bucket", etiquetas, acumulado, (("le", str(limite)),)))
+            lineas.append(_formatear(f"{nombre}_bucket", etiquetas, valor[-1], (("le", "+Inf"),)))
+            lineas.append(_formatear(f"{nombre}_sum", etiquetas, round(valor[-2], 6)))
+            lineas.append(_formatear(f"{nombre}_count", etiquetas, valor[-1]))
+
+    for fuente, valores in (estado or {}).items():
+        for clave, valor in valores.items():
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                nombre = _nombre_estado("bot", fuente, clave)
+                lineas += [f"# TYPE {nombre} gauge", f"{nombre} {valor}"]
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,216 @@
+import re
+import unicodedata
+
+# === Parser local (atajo antes de OpenRouter) ===
+VERBOS_GASTO = {
+    "gaste", "gastamos", "gasto", "gastado", "pague", "pagamos", "pago",
+    "compre", "compramos", "compra",
+}
+VERBOS_INGRESO = {
+    "ahorre", "ahorramos", "ahorro", "guarde", "guardamos", "recibi", "recibimos",
+    "ingrese", "ingresamos", "ingreso", "deposite", "depositamos", "agregue", "agregamos",
+}
+PALABRAS_REPORTE = {"reporte", "resumen", "saldo", "saldos", "balance", "gastos", "ingresos"}
+PERIODOS = [
+    ("semana pasada", "semana_pasada"), ("semana anterior", "semana_pasada"),
+    ("mes pasado", "mes_pasado"), ("mes anterior", "mes_pasado"),
+    ("esta semana", "semana"), ("este mes", "mes"), ("hoy", "hoy"),
+]
+PALABRAS_INFO = {"info", "ayuda", "help", "/start", "/help", "/info", "?"}
+PALABRAS_ELIMINAR = {"eliminar", "elimina", "borrar", "borra", "/eliminar"}
+# Palabras que no cambian el significado de un mensaje simple
+RELLENO = {
+    "de", "del", "en", "para", "la", "el", "las", "los", "mi", "mis", "un", "una",
+    "s/", "s/.", "soles", "sol", "general", "categoria", "hoy", "por", "favor", "total",
+}
+NEGACIONES = {"no", "nunca", "tampoco"}
+# Raíces para la interpretación aproximada ("depositaron", "cobré", ...)
+RAICES_INGRESO = ("ahorr", "guard", "recib", "ingres", "deposit", "cobr", "agreg")
+
+RE_MONTO = re.compile(r"(?<![\w.,])\d+(?:[.,]\d{1,2})?(?![\d.,]*\d)")
+RE_ID = re.compile(r"\b[0-9a-f]{24}\b")
+RE_SEPARADOR = re.compile(r"\s*[,;]\s+|\s+(?:y|e)\s+")
+
+ESTADISTICAS = {"aciertos": 0, "fallos": 0}
+_alias_cache = {}
+
+def normalizar(texto: str) -> str:
+    """
+    Minúsculas, sin tildes y con espacios colapsados.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split())
+
+def _formas(palabra: str) -> set:
+    formas = {palabra, palabra + "s", palabra + "es"}
+    if palabra.endswith("es"):
+        formas.add(palabra[:-2])
+    if palabra.endswith("s"):
+        formas.add(palabra[:-1])
+    return formas
+
+def _alias_categorias(categorias) -> list:
+    """
+    Lista (alias, categoria) ordenada del alias más largo al más corto.
+    Incluye variantes con tildes omitidas, singular/plural y con "de" entre palabras.
+    """
+    clave = tuple(categorias)
+    if clave not in _alias_cache:
+        alias = {}
+        for cat in categorias:
+            variantes = [""]
+            for palabra in normalizar(cat).split():
+                variantes = [f"{v} {f}".strip() for v in variantes for f in _formas(palabra)]
+            for v in variantes:
+                alias[v] = cat
+                if " " in v:
+                    alias[v.replace(" ", " de ", 1)] = cat
+        _alias_cache[clave] = sorted(alias.items(), key=lambda a: -len(a[0]))
+    return _alias_cache[clave]
+
+def _buscar_categoria(texto: str, categorias):
+    """
+    Devuelve (categoria, texto_sin_categoria). categoria es None si no hay
+    ninguna y False si aparece más de una.
+    """
+    encontradas = set()
+    for alias, cat in _alias_categorias(categorias):
+        patron = rf"(?<!\w){re.escape(alias)}(?!\w)"
+        if re.search(patron, texto):
+            encontradas.add(cat)
+            texto = re.sub(patron, " ", texto)
+    if len(encontradas) > 1:
+        return False, texto
+    return (encontradas.pop() if encontradas else None), texto
+
+def _buscar_periodo(texto: str):
+    """
+    Devuelve (periodo, texto_sin_periodo); periodo es "" si no se menciona.
+    """
+    for frase, nombre in PERIODOS:
+        patron = rf"(?<!\w){frase}(?!\w)"
+        if re.search(patron, texto):
+            return nombre, re.sub(patron, " ", texto)
+    return "", texto
+
+def _a_numero(valor: str):
+    monto = float(valor.replace(",", "."))
+    return int(monto) if monto.is_integer() else monto
+
+def _interpretar(texto: str, categorias):
+    palabras = texto.split()
+    if not palabras:
+        return None
+    if texto in PALABRAS_INFO:
+        return {"tipo": "info", "monto": 0, "categoria": ""}
+
+    if palabras[0] in PALABRAS_ELIMINAR:
+        ids = RE_ID.findall(texto)
+        if len(ids) == 1 and len(palabras) <= 4:
+            return {"tipo": "eliminar", "monto": 0, "categoria": ""}
+        return None
+
+    if NEGACIONES & set(palabras):
+        return None
+
+    categoria, resto = _buscar_categoria(texto, categorias)
+    if categoria is False:
+        return None
+
+    if palabras[0] in PALABRAS_REPORTE:
+        periodo, resto = _buscar_periodo(resto)
+        sobrantes = [p for p in resto.split() if p not in RELLENO and p not in PALABRAS_REPORTE]
+        if sobrantes:
+            return None
+        resultado = {"tipo": "reporte", "monto": 0, "categoria": categoria or ""}
+        if periodo:
+            resultado["periodo"] = periodo
+        return resultado
+
+    montos = RE_MONTO.findall(resto)
+    if len(montos) != 1 or not categoria:
+        return None
+    monto = _a_numero(montos[0])
+    if monto <= 0:
+        return None
+
+    palabras_resto = set(RE_MONTO.sub(" ", resto).replace("s/", " ").split())
+    if palabras_resto & VERBOS_GASTO and not palabras_resto & VERBOS_INGRESO:
+        tipo = "gasto"
+    elif palabras_resto & VERBOS_INGRESO and not palabras_resto & VERBOS_GASTO:
+        tipo = "ingreso"
+    elif palabras_resto <= RELLENO:
+        # "50 transporte": gasto es el valor por defecto
+        tipo = "gasto"
+    else:
+        return None
+    if palabras_resto & (PALABRAS_REPORTE | PALABRAS_ELIMINAR):
+        return None
+    return {"tipo": tipo, "monto": monto, "categoria": categoria}
+
+def _interpretar_varios(texto: str, categorias):
+    """
+    "gaste 20 en transporte, 35 en alimentacion y 15 en salud": cada parte debe tener
+    un monto y una categoría; las partes sin verbo heredan el tipo anterior.
+    """
+    if len(RE_MONTO.findall(texto)) < 2:
+        return None
+    partes = [p for p in RE_SEPARADOR.split(texto) if p]
+    if len(partes) < 2:
+        return None
+    movimientos = []
+    tipo = None
+    for parte in partes:
+        resultado = _interpretar(parte, categorias)
+        if not resultado or resultado["tipo"] not in ("gasto", "ingreso"):
+            return None
+        if set(parte.split()) & (VERBOS_GASTO | VERBOS_INGRESO):
+            tipo = resultado["tipo"]
+        movimientos.append({**resultado, "tipo": tipo or resultado["tipo"]})
+    return {"tipo": "varios", "movimientos": movimientos}
+
+def interpretar_local(texto_usuario: str, categorias):
+    """
+    Interpreta mensajes con forma conocida sin llamar al modelo.
+    Devuelve el mismo dict que procesar_con_openrouter, o None si la
+    confianza es baja y hay que consultar a OpenRouter.
+    """
+    texto = normalizar(texto_usuario)
+    resultado = _interpretar(texto, categorias) or _interpretar_varios(texto, categorias)
+    ESTADISTICAS["aciertos" if resultado else "fallos"] += 1
+    return resultado
+
+def interpretar_aproximado(texto_usuario: str, categorias):
+    """
+    Interpretación permisiva para cuando ningún modelo está disponible: tolera
+    palabras desconocidas alrededor del monto y la categoría. Devuelve None si
+    falta alguno de los dos o hay ambigüedad. El resultado lleva "aproximado".
+    """
+    texto = normalizar(texto_usuario)
+    palabras = set(texto.split())
+    if not palabras or NEGACIONES & palabras:
+        return None
+    if palabras & PALABRAS_INFO:
+        return {"tipo": "info", "monto": 0, "categoria": "", "aproximado": True}
+    categoria, resto = _buscar_categoria(texto, categorias)
+    if categoria is False:
+        return None
+    montos = RE_MONTO.findall(resto)
+    if palabras & PALABRAS_REPORTE and not montos:
+        periodo, _ = _buscar_periodo(resto)
+        resultado = {"tipo": "reporte", "monto": 0, "categoria": categoria or "", "aproximado": True}
+        if periodo:
+            resultado["periodo"] = periodo
+        return resultado
+    if len(montos) != 1 or not categoria or palabras & (PALABRAS_REPORTE | PALABRAS_ELIMINAR):
+        return None
+    monto = _a_numero(montos[0])
+    if monto <= 0:
+        return None
+    ingreso = any(p.startswith(RAICES_INGRESO) for p in palabras) and not palabras & VERBOS_GASTO
+    return {"tipo": "ingreso" if ingreso else "gasto", "monto": monto, "categoria": categoria, "aproximado": True}
+
+def tasa_aciertos() -> float:
+    total = ESTADISTICAS["aciertos"] + ESTADISTICAS["fallos"]
+    return ESTADISTICAS["aciertos"] / total if total else 0.0
@@ -0,0 +1,253 @@
+"""
+Ingesta por long polling (getUpdates) como alternativa al webhook.
+
+Borra el webhook del bot, lee updates en bucle y los reparte en un pool de
+workers con orden por chat. Cada update pasa por `atender_update` del
+entrypoint (mismo parseo, deduplicación y persistencia que `telegram_webhook`).
+Los updates se guardan como pendientes en el registro de idempotencia antes de
+confirmarlos a Telegram; los que fallan se reintentan desde ahí.
+
+Uso:
+    python polling.py main
+    python polling.py main-multisala --workers 16
+    python polling.py main-multisala --vaciar     # procesa lo pendiente y termina
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import argparse
+import importlib.util
+from cola import ColaPorChat
+from recursos import get_http, cerrar
+
+logger = logging.getLogger("bot")
+
+# === Configuración ===
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "25"))           # s que Telegram retiene cada getUpdates
+POLLING_LIMITE = int(os.getenv("POLLING_LIMITE", "100"))            # updates por llamada (máximo de Telegram)
+POLLING_BACKOFF_MAX = float(os.getenv("POLLING_BACKOFF_MAX", "30")) # s máximos entre reintentos tras un error
+POLLING_ESPERA_MS = float(os.getenv("POLLING_ESPERA_MS", "50"))       # espera máxima con la cola llena
+POLLING_REINTENTO = float(os.getenv("POLLING_REINTENTO", "30"))     # s entre barridos de updates pendientes
+
+# === Lector de updates ===
+class LectorUpdates:
+    """
+    Lee con getUpdates y reparte en un ColaPorChat. Cada tanda se guarda como
+    pendiente en `registro` (RegistroUpdates) antes de avanzar el offset, así
+    el offset pasa siempre al último update recibido y un update lento no
+    retiene a los demás. Los que fallan antes de escribir vuelven a pendiente
+    y un barrido periódico los reencola (también los que dejó una ejecución
+    anterior), hasta agotar los intentos del registro. Un update que ya
+    escribió no se reintenta, para no duplicar movimientos.
+    """
+
+    def __init__(self, base_url: str, atender, registro, workers: int = 8, max_pendientes: int = 1000, drenaje: float = 10):
+        self.base_url = base_url
+        self.atender = atender
+        self.registro = registro
+        self.drenaje = drenaje
+        self.cola = ColaPorChat(self._procesar, workers, max_pendientes)
+        self._en_curso = set()   # update_id repartidos y sin terminar
+        self._ultimo = None      # mayor update_id recibido
+        self._parar = None
+        self._avance = None
+        self._consulta = None
+        self._barrido = 0.0
+        self.estadisticas = {"llamadas": 0, "recibidos": 0, "procesados": 0, "errores": 0, "ignorados": 0, "reintentados": 0}
+
+    def offset(self):
+        return self._ultimo + 1 if self._ultimo is not None else None
+
+    async def _llamar(self, metodo: str, espera: float, **params):
+        """
+        `espera` es el timeout HTTP; debe superar el `timeout` de long polling.
+        """
+        r = await get_http().post(f"{self.base_url}/{metodo}", json=params, timeout=espera)
+        if r.status_code == 409 and metodo == "getUpdates":
+            # Hay un webhook activo (otro despliegue lo volvió a registrar)
+            logger.warning("⚠️ getUpdates en conflicto con un webhook; se borra de nuevo.")
+            await self._borrar_webhook()
+        r.raise_for_status()
+        return r.json()["result"]
+
+    async def _borrar_webhook(self):
+        await get_http().post(f"{self.base_url}/deleteWebhook", json={"drop_pending_updates": False})
+
+    async def _procesar(self, update: dict):
+        try:
+            await self.atender(update)
+            self.estadisticas["procesados"] += 1
+        except asyncio.CancelledError:
+            # Cortado al detener: el registro lo deja pendiente para la próxima ejecución
+            raise
+        except Exception:
+            # El registro ya lo devolvió a pendiente (si no llegó a escribir); lo retoma el barrido
+            self.estadisticas["errores"] += 1
+            self._terminar(update)
+            raise
+        self._terminar(update)
+
+    def _terminar(self, update: dict):
+        self._en_curso.discard(update["update_id"])
+        self._avance.set()
+
+    def _encolar(self, update: dict) -> bool:
+        if not self.cola.encolar(update["message"]["chat"]["id"], update):
+            return False  # queda pendiente en el registro; lo retoma el barrido
+        self._en_curso.add(update["update_id"])
+        return True
+
+    async def _repartir(self, updates: list):
+        """
+        Guarda los mensajes como pendientes y recién entonces avanza el offset y
+        los encola. Si el guardado falla, el offset no se mueve y Telegram los
+        vuelve a entregar.
+        """
+        if self._ultimo is not None:
+            updates = [u for u in updates if u["update_id"] > self._ultimo]
+        if not updates:
+            return
+        mensajes = [u for u in updates if "message" in u]
+        await self.registro.guardar_pendientes(mensajes)
+        self._ultimo = max(u["update_id"] for u in updates)
+        self.estadisticas["recibidos"] += len(updates)
+        self.estadisticas["ignorados"] += len(updates) - len(mensajes)
+        for u in mensajes:
+            self._encolar(u)
+
+    async def _reintentar(self) -> int:
+        """
+        Reencola los pendientes del registro que no están en curso (fallidos o
+        de una ejecución anterior) y devuelve cuántos.
+        """
+        self._barrido = time.monotonic()
+        libres = self.cola.max_pendientes - self.cola.pendientes()
+        if libres <= 0:
+            return 0
+        pendientes = await self.registro.pendientes(self._en_curso, libres)
+        encolados = sum(self._encolar(u) for u in pendientes)
+        self.estadisticas["reintentados"] += encolados
+        return encolados
+
+    async def _esperar_avance(self):
+        self._avance.clear()
+        try:
+            await asyncio.wait_for(self._avance.wait(), POLLING_ESPERA_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+
+    async def correr(self, vaciar: bool = False):
+        """
+        Bucle principal hasta detener(); con `vaciar` termina cuando no queda
+        nada pendiente en Telegram.
+        """
+        self._parar, self._avance = asyncio.Event(), asyncio.Event()
+        self.cola.iniciar()
+        await self._borrar_webhook()
+        espera = 1.0
+        while not self._parar.is_set():
+            if time.monotonic() - self._barrido >= POLLING_REINTENTO:
+                try:
+                    await self._reintentar()
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudieron leer los updates pendientes: {e!r}")
+            libres = self.cola.max_pendientes - self.cola.pendientes()
+            if libres <= 0:
+                await self._esperar_avance()
+                continue
+            params = {
+                "timeout": 0 if vaciar else POLLING_TIMEOUT,
+                "limit": min(POLLING_LIMITE, libres),
+                "allowed_updates": ["message"],
+            }
+            if self.offset() is not None:
+                params["offset"] = self.offset()
+            self._consulta = asyncio.create_task(self._llamar("getUpdates", params["timeout"] + 10, **params))
+            try:
+                updates = await self._consulta
+                self.estadisticas["llamadas"] += 1
+                await self._repartir(updates)
+            except asyncio.CancelledError:
+                if self._parar.is_set():
+                    break
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ getUpdates falló ({e!r}); reintento en {espera:.0f} s.")
+                try:
+                    await asyncio.wait_for(self._parar.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+                espera = min(POLLING_BACKOFF_MAX, espera * 2)
+                continue
+            espera = 1.0
+            if vaciar and not updates:
+                if self._en_curso:
+                    await self._esperar_avance()
+                elif not await self._reintentar():
+                    break
+
+        await self.cola.detener(self.drenaje)
+        await self._confirmar()
+
+    async def _confirmar(self):
+        """
+        Confirma a Telegram todo lo recibido (getUpdates con el offset final);
+        lo que no terminó sigue pendiente en el registro.
+        """
+        if self.offset() is None:
+            return
+        try:
+            await self._llamar("getUpdates", 10, offset=self.offset(), limit=1, timeout=0)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo confirmar el offset {self.offset()}: {e!r}")
+
+    def detener(self):
+        if self._parar is not None:
+            self._parar.set()
+        if self._consulta is not None and not self._consulta.done():
+            self._consulta.cancel()
+
+    def resumen(self) -> dict:
+        return {**self.estadisticas, "en_curso": len(self._en_curso), "offset": self.offset(), "registro": self.registro.resumen()}
+
+# === Ejecución ===
+def cargar_entrypoint(nombre: str):
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{nombre}.py")
+    spec = importlib.util.spec_from_file_location(nombre.replace("-", "_"), ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+async def principal(lector: LectorUpdates, vaciar: bool):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lector.detener)
+    t0 = time.perf_counter()
+    try:
+        await lector.correr(vaciar)
+    finally:
+        await cerrar()
+    duracion = time.perf_counter() - t0
+    r = lector.resumen()
+    logger.info(
+        f"📥 Polling detenido: {r['procesados']} updates en {duracion:.1f} s "
+        f"({r['procesados'] / duracion:.1f}/s), {r['errores']} errores, offset {r['offset']}."
+    )
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Ingesta de updates por long polling")
+    cli.add_argument("app", nargs="?", default="main", choices=["main", "main-multisala"])
+    cli.add_argument("--workers", type=int, help="workers en paralelo (por defecto COLA_WORKERS)")
+    cli.add_argument("--vaciar", action="store_true", help="terminar cuando no queden updates pendientes")
+    args = cli.parse_args()
+
+    modulo = cargar_entrypoint(args.app)
+    lector = LectorUpdates(
+        modulo.BASE_URL, modulo.atender_update, modulo.registro_updates, args.workers or modulo.COLA_WORKERS,
+        modulo.COLA_MAX, modulo.COLA_DRAIN_SEGUNDOS,
+    )
+    asyncio.run(principal(lector, args.vaciar))
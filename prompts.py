@@ -0,0 +1,235 @@
+import os
+import json
+import hashlib
+import logging
+from collections import defaultdict
+import metricas
+from parser_local import normalizar
+
+logger = logging.getLogger("bot")
+
+# === Configuración ===
+# "json_object", "json_schema" o "" (sin response_format). OpenRouter ignora el
+# parámetro en los modelos que no lo soportan, y la respuesta se valida igual.
+OPENROUTER_JSON_MODO = os.getenv("OPENROUTER_JSON_MODO", "json_object")
+
+TIPOS = ("gasto", "ingreso", "reporte", "info", "eliminar", "varios")
+PERIODOS = ("hoy", "semana", "semana_pasada", "mes", "mes_pasado", "")
+
+def compilar_instrucciones(categorias) -> str:
+    """
+    Instrucciones del sistema. Se arman una sola vez y no llevan nada del
+    mensaje, así el prefijo es idéntico en cada llamada y el proveedor puede
+    cachearlo.
+    """
+    return "\n".join([
+        "Interpretas mensajes de un bot de finanzas personales. Responde solo un objeto JSON, sin texto extra.",
+        'Formato: {"tipo": T, "monto": número, "categoria": C}',
+        '- tipo: "gasto" (gasté, pagué, compré; también por defecto), "ingreso" (ahorré, guardé, recibí),'
+        ' "reporte" (resumen o saldo), "info" (ayuda), "eliminar" (borrar un movimiento por ID).',
+        '- monto: número positivo del texto; 0 en reporte, info y eliminar.',
+        f'- categoria: una de {", ".join(categorias)}; "" si no hay una válida.',
+        '- reporte: agrega "periodo": hoy, semana, semana_pasada, mes, mes_pasado o "" (histórico);'
+        ' con fechas concretas agrega "desde" y "hasta" (AAAA-MM-DD).',
+        '- Varios movimientos en un mensaje: {"tipo": "varios", "movimientos": [{"tipo", "monto", "categoria"}, ...]} en orden.',
+        "Ejemplos:",
+        '"gasté 25 en taxi" → {"tipo": "gasto", "monto": 25, "categoria": "transporte"}',
+        '"gasté 20 en taxi y 35 en almuerzo" → {"tipo": "varios", "movimientos": [{"tipo": "gasto", "monto": 20,'
+        ' "categoria": "transporte"}, {"tipo": "gasto", "monto": 35, "categoria": "alimentacion"}]}',
+    ])
+
+def extraer_json(texto: str):
+    """
+    Primer objeto o array JSON de la respuesta (admite texto alrededor o
+    bloques ```json). A diferencia de una regex, admite objetos anidados.
+    """
+    decoder = json.JSONDecoder()
+    for i, c in enumerate(texto):
+        if c not in "{[":
+            continue
+        try:
+            valor, _ = decoder.raw_decode(texto, i)
+        except ValueError:
+            continue
+        return valor
+    raise ValueError("❌ No se encontró JSON válido en la respuesta.")
+
+def _numero(valor):
+    if isinstance(valor, str):
+        try:
+            valor = float(valor.replace(",", "."))
+        except ValueError:
+            return 0
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        return 0
+    return int(valor) if float(valor).is_integer() else valor
+
+# === Compilador de prompts ===
+class CompiladorPrompt:
+    """
+    Prompt de OpenRouter en dos mensajes: las instrucciones fijas como mensaje
+    de sistema (el prefijo cacheable) y el texto del usuario aparte. Valida la
+    respuesta contra el esquema y cuenta los tokens de `usage` por intención.
+    """
+
+    def __init__(self, categorias, modo_json: str = OPENROUTER_JSON_MODO):
+        self.categorias = list(categorias)
+        self._por_normalizada = {normalizar(c): c for c in self.categorias}
+        self.sistema = compilar_instrucciones(self.categorias)
+        self.modo_json = modo_json
+        self.version = hashlib.sha1(f"{modo_json}|{self.sistema}".encode()).hexdigest()[:12]
+        self.tokens = defaultdict(lambda: {"llamadas": 0, "prompt": 0, "completion": 0, "cacheados": 0})
+
+    # --- Mensajes ---
+    def mensajes(self, texto_usuario: str) -> list:
+        return [
+            {"role": "system", "content": self.sistema},
+            {"role": "user", "content": f'Mensaje del usuario: "{texto_usuario}"'},
+        ]
+
+    def mensajes_lote(self, textos) -> list:
+        numerados = "\n".join(f'{i}. "{t}"' for i, t in enumerate(textos, 1))
+        return [
+            {"role": "system", "content": self.sistema},
+            {"role": "user", "content": (
+                f"Interpreta cada mensaje por separado y responde {{\"resultados\": [...]}} con {len(textos)} "
+                f"objetos, uno por mensaje y en el mismo orden.\nMensajes:\n{numerados}"
+            )},
+        ]
+
+    def _esquema(self, lote: bool) -> dict:
+        movimiento = {
+            "type": "object",
+            "properties": {
+                "tipo": {"type": "string", "enum": ["gasto", "ingreso"]},
+                "monto": {"type": "number"},
+                "categoria": {"type": "string", "enum": self.categorias + [""]},
+            },
+            "required": ["tipo", "monto", "categoria"],
+        }
+        resultado = {
+            "type": "object",
+            "properties": {
+                **movimiento["properties"],
+                "tipo": {"type": "string", "enum": list(TIPOS)},
+                "periodo": {"type": "string", "enum": list(PERIODOS)},
+                "desde": {"type": "string"},
+                "hasta": {"type": "string"},
+                "movimientos": {"type": "array", "items": movimiento},
+            },
+            "required": ["tipo"],
+        }
+        if not lote:
+            return resultado
+        return {
+            "type": "object",
+            "properties": {"resultados": {"type": "array", "items": resultado}},
+            "required": ["resultados"],
+        }
+
+    def opciones(self, lote: bool = False) -> dict:
+        """
+        Parámetros extra del cuerpo de la petición (response_format).
+        """
+        if self.modo_json == "json_object":
+            return {"response_format": {"type": "json_object"}}
+        if self.modo_json == "json_schema":
+            return {"response_format": {"type": "json_schema", "json_schema": {
+                "name": "interpretacion_lote" if lote else "interpretacion", "schema": self._esquema(lote),
+            }}}
+        return {}
+
+    # --- Validación ---
+    def _categoria(self, valor) -> str:
+        if not isinstance(valor, str):
+            return ""
+        return self._por_normalizada.get(normalizar(valor), "")
+
+    def _movimiento(self, obj) -> dict:
+        if not isinstance(obj, dict):
+            raise ValueError(f"movimiento inválido: {obj!r}")
+        tipo = obj.get("tipo")
+        if tipo not in ("gasto", "ingreso"):
+            raise ValueError(f"tipo de movimiento inválido: {tipo!r}")
+        return {"tipo": tipo, "monto": _numero(obj.get("monto")), "categoria": self._categoria(obj.get("categoria"))}
+
+    def validar(self, obj) -> dict:
+        """
+        Comprueba la forma de la respuesta y la normaliza (montos numéricos,
+        categoría válida o ""). Lanza ValueError si no cumple el esquema, para
+        que el intérprete pruebe con el siguiente modelo.
+        """
+        if isinstance(obj, list):
+            # Sin modo JSON algunos modelos devuelven los movimientos sueltos
+            obj = {"tipo": "varios", "movimientos": obj}
+        if not isinstance(obj, dict):
+            raise ValueError(f"se esperaba un objeto JSON: {obj!r}")
+        tipo = obj.get("tipo")
+        if tipo not in TIPOS:
+            raise ValueError(f"tipo inválido: {tipo!r}")
+        if tipo == "varios":
+            movimientos = obj.get("movimientos")
+            if not isinstance(movimientos, list) or not movimientos:
+                raise ValueError("\"varios\" sin movimientos")
+            return {"tipo": "varios", "movimientos": [self._movimiento(m) for m in movimientos]}
+        resultado = {"tipo": tipo, "monto": _numero(obj.get("monto")), "categoria": self._categoria(obj.get("categoria"))}
+        if tipo == "reporte":
+            if obj.get("periodo") in PERIODOS:
+                resultado["periodo"] = obj["periodo"]
+            for clave in ("desde", "hasta"):
+                if isinstance(obj.get(clave), str):
+                    resultado[clave] = obj[clave]
+        return resultado
+
+    # --- Respuestas ---
+    def _contar_tokens(self, respuesta: dict, tipo: str):
+        usage = respuesta.get("usage") or {}
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        cacheados = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        modelo = respuesta.get("model") or "desconocido"
+        t = self.tokens[tipo]
+        t["llamadas"] += 1
+        for clase, n in (("prompt", prompt), ("completion", completion), ("cacheados", cacheados)):
+            t[clase] += n
+            metricas.contar("bot_llm_tokens_total", n, clase=clase, modelo=modelo, tipo=tipo)
+        logger.info(f"🔢 Tokens {tipo} ({modelo}): {prompt} prompt ({cacheados} en cache), {completion} completion")
+
+    def _contenido(self, respuesta: dict):
+        return extraer_json(respuesta["choices"][0]["message"]["content"] or "")
+
+    def leer(self, respuesta: dict) -> dict:
+        """
+        Resultado validado de una respuesta de chat-completions.
+        """
+        resultado = self.validar(self._contenido(respuesta))
+        self._contar_tokens(respuesta, resultado["tipo"])
+        return resultado
+
+    def leer_lote(self, respuesta: dict) -> list:
+        """
+        Un resultado por mensaje del lote; None en los que no pasan la
+        validación, que el agrupador reintenta uno por uno.
+        """
+        valor = self._contenido(respuesta)
+        if isinstance(valor, dict):
+            valor = valor.get("resultados")
+        if not isinstance(valor, list):
+            raise ValueError("se esperaba la lista \"resultados\"")
+        resultados = []
+        for r in valor:
+            try:
+                resultados.append(self.validar(r))
+            except ValueError as e:
+                logger.warning(f"⚠️ Resultado de lote inválido: {e}")
+                resultados.append(None)
+        self._contar_tokens(respuesta, "lote")
+        return resultados
+
+    def resumen(self) -> dict:
+        return {
+            "version": self.version,
+            "modo_json": self.modo_json or "ninguno",
+            "caracteres_sistema": len(self.sistema),
+            "tokens": {tipo: dict(t) for tipo, t in self.tokens.items()},
+        }
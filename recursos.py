@@ -0,0 +1,104 @@
+import os
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import httpx
+import pymongo
+
+# === Configuración ===
+HTTP_MAX_CONEXIONES = int(os.getenv("HTTP_MAX_CONEXIONES", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+MONGO_HILOS = int(os.getenv("MONGO_HILOS", "16"))
+# Pool de conexiones de pymongo: por defecto una por hilo del pool, así ningún hilo espera conexión
+MONGO_POOL_MAX = int(os.getenv("MONGO_POOL_MAX", str(MONGO_HILOS)))
+MONGO_POOL_MIN = int(os.getenv("MONGO_POOL_MIN", "0"))
+MONGO_INACTIVA_MS = int(os.getenv("MONGO_INACTIVA_MS", "60000"))      # cierra conexiones ociosas
+MONGO_SELECCION_MS = int(os.getenv("MONGO_SELECCION_MS", "10000"))    # espera máxima por un servidor disponible
+
+# === Recursos compartidos por proceso ===
+_http_client: httpx.AsyncClient | None = None
+_mongo_pool: ThreadPoolExecutor | None = None
+_mongo_client = None
+_mongo_config = {}
+_mongo_lock = threading.Lock()  # get_mongo se llama desde los hilos del pool
+
+def get_http() -> httpx.AsyncClient:
+    """
+    Cliente HTTP asíncrono único del proceso (OpenRouter y Telegram comparten el pool).
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONEXIONES, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        )
+    return _http_client
+
+def configurar_mongo(uri: str, **opciones):
+    """
+    Guarda la URI y las opciones del cliente sin conectar; la conexión se abre
+    en el primer uso (get_mongo).
+    """
+    _mongo_config.update(uri=uri, opciones=opciones)
+
+def get_mongo():
+    """
+    MongoClient único del proceso, creado en la primera operación.
+    """
+    global _mongo_client
+    if _mongo_client is None:
+        with _mongo_lock:
+            if _mongo_client is None:
+                _mongo_client = pymongo.MongoClient(
+                    _mongo_config.get("uri"),
+                    maxPoolSize=MONGO_POOL_MAX,
+                    minPoolSize=MONGO_POOL_MIN,
+                    maxIdleTimeMS=MONGO_INACTIVA_MS,
+                    serverSelectionTimeoutMS=MONGO_SELECCION_MS,
+                    **_mongo_config.get("opciones", {}),
+                )
+    return _mongo_client
+
+class Coleccion:
+    """
+    Referencia perezosa a una colección: se usa como una Collection de pymongo
+    pero no crea el cliente hasta el primer método que se llama.
+    """
+
+    def __init__(self, db: str, nombre: str):
+        self.db = db
+        self.nombre = nombre
+
+    def __getattr__(self, atributo):
+        return getattr(get_mongo()[self.db][self.nombre], atributo)
+
+def _get_mongo_pool() -> ThreadPoolExecutor:
+    global _mongo_pool
+    if _mongo_pool is None:
+        _mongo_pool = ThreadPoolExecutor(max_workers=MONGO_HILOS, thread_name_prefix="mongo")
+    return _mongo_pool
+
+async def en_mongo(fn, *args, **kwargs):
+    """
+    Ejecuta una llamada bloqueante de pymongo en un pool de hilos acotado
+    para no congelar el event loop. Copia el contexto (como asyncio.to_thread)
+    para que las métricas atribuyan la operación al update en curso.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_mongo_pool(), partial(ctx.run, fn, *args, **kwargs))
+
+async def cerrar():
+    global _http_client, _mongo_pool, _mongo_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _mongo_pool is not None:
+        _mongo_pool.shutdown(wait=True)
+        _mongo_pool = None
+    if _mongo_client is not None:
+        _mongo_client.close()
+        _mongo_client = None
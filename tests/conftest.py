@@ -0,0 +1,137 @@
+"""
+Fixtures comunes: el bot contra mongomock, con Telegram falso y un contador de
+operaciones de Mongo (cada operación de pymongo es un ida y vuelta al servidor).
+"""
+import os
+import sys
+import json
+import asyncio
+import threading
+from collections import Counter
+
+import httpx
+import pymongo
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+mongomock = pytest.importorskip("mongomock")
+
+import recursos
+import enviador
+from polling import cargar_entrypoint
+
+# Métodos de Collection que emiten un comando al servidor
+OPERACIONES = (
+    "find", "find_one", "aggregate", "count_documents", "distinct",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write",
+    "find_one_and_delete", "find_one_and_update", "find_one_and_replace",
+)
+
+# === Contador de idas y vueltas ===
+class ContadorMongo:
+    """
+    Cuenta (colección, operación) como lo haría un CommandListener. mongomock
+    implementa unas operaciones con otras (find_one usa find): solo cuenta la
+    llamada exterior de cada hilo.
+    """
+
+    def __init__(self):
+        self.ops = Counter()
+        self._hilo = threading.local()
+
+    def envolver(self, operacion: str, metodo):
+        contador = self
+
+        def envuelto(coleccion, *args, **kwargs):
+            nivel = getattr(contador._hilo, "nivel", 0)
+            if nivel == 0:
+                contador.ops[(coleccion.name, operacion)] += 1
+            contador._hilo.nivel = nivel + 1
+            try:
+                return metodo(coleccion, *args, **kwargs)
+            finally:
+                contador._hilo.nivel = nivel
+
+        return envuelto
+
+    def total(self) -> int:
+        return sum(self.ops.values())
+
+    def reiniciar(self):
+        self.ops.clear()
+
+class TelegramFalso:
+    """
+    Responde la Bot API. getUpdates entrega `updates` desde el offset pedido y
+    olvida los anteriores, como Telegram.
+    """
+
+    def __init__(self):
+        self.enviados = []
+        self.updates = []
+
+    def __call__(self, req: httpx.Request) -> httpx.Response:
+        if req.url.path.endswith("/sendMessage"):
+            self.enviados.append(json.loads(req.content))
+        if req.url.path.endswith("/getUpdates"):
+            params = json.loads(req.content)
+            self.updates = [u for u in self.updates if u["update_id"] >= params.get("offset", 0)]
+            return httpx.Response(200, json={"ok": True, "result": self.updates[:params.get("limit", 100)]})
+        return httpx.Response(200, json={"ok": True, "result": {}})
+
+# === Fixtures ===
+@pytest.fixture
+def contador(monkeypatch):
+    c = ContadorMongo()
+    for operacion in OPERACIONES:
+        monkeypatch.setattr(mongomock.collection.Collection, operacion, c.envolver(operacion, getattr(mongomock.collection.Collection, operacion)))
+    return c
+
+@pytest.fixture
+def cargar(monkeypatch):
+    """
+    Carga un entrypoint ("main" o "main-multisala") con Mongo en memoria.
+    """
+    monkeypatch.setattr(pymongo, "MongoClient", mongomock.MongoClient)
+    for clave, valor in {
+        "BOT_TOKEN": "pruebas", "MONGO_URI": "mongodb://memoria", "MONGO_DB": "telegram_gastos_pruebas",
+        "MONGO_TLS": "0", "EXPORT_PASS": "pruebas",
+    }.items():
+        monkeypatch.setenv(clave, valor)
+    monkeypatch.setattr(enviador, "ENVIO_INTERVALO_CHAT", 0)  # se lee al importar enviador
+    telegram = TelegramFalso()
+    cargados = []
+
+    def cargar_app(nombre: str):
+        recursos._mongo_client = None
+        recursos._http_client = httpx.AsyncClient(transport=httpx.MockTransport(telegram))
+        m = cargar_entrypoint(nombre)
+        recursos.get_mongo().drop_database(os.environ["MONGO_DB"])
+        m.telegram = telegram
+        cargados.append(m)
+        return m
+
+    yield cargar_app
+    asyncio.run(recursos.cerrar())
+
+class Chat:
+    """
+    Envía textos de un chat como updates de Telegram (camino del webhook), con update_id crecientes.
+    """
+    siguiente_update = 1
+
+    def __init__(self, m, chat_id: int):
+        self.m = m
+        self.chat_id = chat_id
+
+    def enviar(self, texto: str) -> dict:
+        update_id, Chat.siguiente_update = Chat.siguiente_update, Chat.siguiente_update + 1
+        body = {"update_id": update_id, "message": {"chat": {"id": self.chat_id}, "text": texto}}
+        return asyncio.run(self._atender(body))
+
+    async def _atender(self, body: dict):
+        nuevo, previo = await self.m.reclamar_update(body)
+        return await self.m.manejar_update(body) if nuevo else previo
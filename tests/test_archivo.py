@@ -0,0 +1,43 @@
+"""
+Importar a un mes ya archivado: las filas quedan vivas hasta el próximo
+archivado y la verificación de resúmenes no debe verlas como diferencias.
+"""
+import json
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from archivo import mes_de, restar_meses
+from materializados import verificar_resumenes, verificar_saldos
+
+def filas(mes: datetime, montos) -> str:
+    return "\n".join(
+        json.dumps({"fecha": f"{mes:%Y-%m}-10T12:00:00", "tipo": "gasto", "monto": monto, "categoria": "salud"})
+        for monto in montos
+    )
+
+def test_importar_a_un_mes_archivado(cargar):
+    m = cargar("main")
+    mes = restar_meses(mes_de(datetime.utcnow(), m.ZONA), 3)
+
+    def importar(montos):
+        r = cliente.post("/importar", params={"clave": "pruebas", "format": "ndjson"}, content=filas(mes, montos))
+        r.raise_for_status()
+
+    def diferencias():
+        return (
+            verificar_resumenes(m.movimientos, m.resumen_diario, [], m.ZONA_HORARIA, mensuales=m.resumen_mensual)
+            + verificar_saldos(m.movimientos, m.saldos, ["categoria"], mensuales=m.resumen_mensual)
+        )
+
+    with TestClient(m.app) as cliente:  # al cerrar se descarta el Mongo en memoria
+        importar([10, 20])
+        assert m.archivador.archivar(1)["movimientos"] == 2
+        importar([5])
+        assert m.movimientos.count_documents({}) == 1
+        assert diferencias() == []
+
+        # El próximo archivado mueve la fila viva y deja los totales del mes completos
+        assert m.archivador.archivar(1)["movimientos"] == 1
+        assert diferencias() == []
+        assert sum(d["total"] for d in m.resumen_mensual.find()) == 35
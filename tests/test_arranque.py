@@ -0,0 +1,32 @@
+"""
+Chequeo de índices al arrancar: en segundo plano, sin demorar el arranque.
+"""
+import time
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+def esperar_chequeo(m, segundos: float = 5):
+    limite = time.monotonic() + segundos
+    while "indices_unicos_faltantes" not in m.ARRANQUE:
+        assert time.monotonic() < limite, "el chequeo de índices no terminó"
+        time.sleep(0.01)
+
+@pytest.mark.parametrize("app", ["main", "main-multisala"])
+def test_crea_los_indices_que_faltan(cargar, app):
+    m = cargar(app)
+    with TestClient(m.app):  # al cerrar se descarta el Mongo en memoria
+        esperar_chequeo(m)
+        assert m.ARRANQUE["indices_unicos_faltantes"] == 0
+        assert any(i.get("unique") for i in m.saldos.index_information().values())
+        if app == "main-multisala":
+            assert any(i.get("unique") for i in m.grupos.index_information().values())
+
+def test_avisa_si_faltan_unicos_y_no_debe_crearlos(cargar, monkeypatch, caplog):
+    monkeypatch.setenv("INDICES_AL_ARRANCAR", "0")
+    m = cargar("main-multisala")
+    with caplog.at_level(logging.ERROR, logger="bot"), TestClient(m.app):
+        esperar_chequeo(m)
+    assert m.ARRANQUE["indices_unicos_faltantes"] >= 4  # saldos, resumen_diario, usuarios, grupos...
+    assert any("grupos (code) faltante" in r.getMessage() for r in caplog.records)
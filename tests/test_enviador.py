@@ -0,0 +1,35 @@
+"""
+Envío a Telegram: un 429 con retry_after frena también a los demás chats.
+"""
+import time
+import asyncio
+
+import httpx
+
+import recursos
+from enviador import EnviadorTelegram
+
+def test_429_pausa_la_cubeta_global(monkeypatch):
+    pedidos = []
+
+    def telegram(req: httpx.Request) -> httpx.Response:
+        pedidos.append(time.monotonic())
+        if len(pedidos) == 1:
+            return httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 1}})
+        return httpx.Response(200, json={"ok": True, "result": {}})
+
+    monkeypatch.setattr(recursos, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(telegram)))
+    enviador = EnviadorTelegram("https://telegram.invalid/bot")
+
+    async def escenario():
+        primero = asyncio.create_task(enviador.enviar(1, "hola"))
+        while not pedidos:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        # Otro chat, sin pausa propia: espera igual a que venza el retry_after
+        return await asyncio.gather(primero, enviador.enviar(2, "hola"))
+
+    assert asyncio.run(escenario()) == [True, True]
+    assert len(pedidos) == 3
+    assert min(pedidos[1:]) - pedidos[0] >= 0.95
+    assert enviador.estadisticas["limitados_429"] == 1
@@ -0,0 +1,107 @@
+"""
+Idas y vueltas a Mongo por tipo de mensaje en main-multisala.py. Cada update
+paga dos fijas en `updates` (reclamar y completar el update_id); el contexto
+del usuario sale del cache salvo en las escrituras, que releen el grupo.
+"""
+from collections import Counter
+
+import pytest
+
+from tests.conftest import Chat
+
+UPDATE = {("updates", "insert_one"): 1, ("updates", "update_one"): 1}
+
+@pytest.fixture
+def m(cargar):
+    return cargar("main-multisala")
+
+@pytest.fixture
+def ana(m):
+    """
+    Usuario con grupo y el contexto ya en cache.
+    """
+    chat = Chat(m, 5)
+    chat.enviar("hola")
+    chat.enviar("crear Casa")
+    chat.enviar("reporte")
+    return chat
+
+def idas(contador, chat, texto: str) -> Counter:
+    contador.reiniciar()
+    chat.enviar(texto)
+    return +contador.ops
+
+def test_primer_mensaje(m, contador):
+    assert idas(contador, Chat(m, 7), "hola") == Counter({
+        **UPDATE, ("usuarios", "find_one"): 1, ("usuarios", "insert_one"): 1,
+    })
+
+def test_crear_grupo(m, contador):
+    chat = Chat(m, 7)
+    chat.enviar("hola")
+    assert idas(contador, chat, "crear Casa") == Counter({
+        **UPDATE, ("usuarios", "find_one"): 1,
+        ("grupos", "find_one"): 1,  # código libre
+        ("grupos", "insert_one"): 1, ("usuarios", "update_one"): 1,
+    })
+
+def test_unir_a_grupo(m, ana, contador):
+    code = m.usuarios.find_one({"chat_id": ana.chat_id})["group_code"]
+    bea = Chat(m, 6)
+    bea.enviar("hola")
+    assert idas(contador, bea, f"unir {code}") == Counter({
+        **UPDATE, ("usuarios", "find_one"): 1,
+        ("grupos", "find_one"): 1, ("grupos", "update_one"): 1, ("usuarios", "update_one"): 1,
+    })
+
+def test_unir_con_codigo_invalido(m, contador):
+    chat = Chat(m, 7)
+    chat.enviar("hola")
+    chat.enviar("unir ZZZZZZ")  # el contexto queda en cache
+    assert idas(contador, chat, "unir ZZZZZZ") == Counter({**UPDATE, ("grupos", "find_one"): 1})
+
+def test_gasto(ana, contador):
+    assert idas(contador, ana, "gasté 12 en salud") == Counter({
+        **UPDATE,
+        ("usuarios", "find_one"): 1,  # grupo releído para escribir
+        ("movimientos", "insert_one"): 1, ("resumen_diario", "update_one"): 1, ("saldos", "update_one"): 1,
+        ("saldos", "find_one"): 1,
+    })
+
+def test_varios(ana, contador):
+    assert idas(contador, ana, "gasté 5 en salud y 7 en ropa") == Counter({
+        **UPDATE, ("usuarios", "find_one"): 1,
+        ("movimientos", "insert_many"): 1, ("resumen_diario", "bulk_write"): 1, ("saldos", "bulk_write"): 1,
+        ("saldos", "find"): 1,
+    })
+
+def test_reportes(ana, contador):
+    assert idas(contador, ana, "reporte") == Counter({**UPDATE, ("saldos", "find"): 1})
+    assert idas(contador, ana, "reporte salud") == Counter({**UPDATE, ("saldos", "find_one"): 1})
+
+def test_info(ana, contador):
+    assert idas(contador, ana, "info") == Counter({**UPDATE, ("grupos", "find_one"): 1})
+    assert idas(contador, ana, "info") == Counter(UPDATE)  # nombre del grupo en cache
+
+def test_eliminar(m, ana, contador):
+    ana.enviar("gasté 12 en salud")
+    doc = m.movimientos.find_one({"chat_id": ana.chat_id})
+    assert idas(contador, ana, f"eliminar {doc['_id']}") == Counter({
+        **UPDATE, ("usuarios", "find_one"): 1,
+        ("movimientos", "find_one_and_delete"): 1, ("eliminados", "insert_one"): 1,
+        ("resumen_diario", "update_one"): 1, ("saldos", "update_one"): 1,
+    })
+
+def test_gasto_tras_cambio_de_grupo_en_otro_worker(m, ana):
+    """
+    Otro worker atendió `unir`: este conserva el grupo anterior en cache, pero
+    la escritura usa el grupo de usuarios.
+    """
+    bea = Chat(m, 6)
+    bea.enviar("hola")
+    bea.enviar("crear Otro")
+    nuevo = m.usuarios.find_one({"chat_id": bea.chat_id})["group_code"]
+    m.usuarios.update_one({"chat_id": ana.chat_id}, {"$set": {"group_code": nuevo}})
+    ana.enviar("gasté 9 en salud")
+    assert m.movimientos.find_one({"monto": 9})["group_code"] == nuevo
+    assert m.saldos.find_one({"group_code": nuevo, "categoria": "salud"})["gasto"] == 9
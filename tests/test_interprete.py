@@ -0,0 +1,61 @@
+"""
+Circuito de InterpreteLLM: qué fallos lo abren y cómo se suelta la prueba.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from tests.conftest import RAIZ  # noqa: F401 (pone la raíz en sys.path)
+import interprete
+from interprete import InterpreteLLM, SinModelos
+
+def respuesta(status: int):
+    async def llamar(modelo, prompt, timeout, **opciones):
+        req = httpx.Request("POST", "https://openrouter.ai/api/v1/chat/completions")
+        resp = httpx.Response(status, request=req, json={"ok": status == 200})
+        resp.raise_for_status()
+        return resp.json()
+    return llamar
+
+def ilegible(respuesta):
+    raise ValueError("no es JSON")
+
+def completar(llm: InterpreteLLM, parsear=dict):
+    try:
+        return asyncio.run(llm.completar("prompt", parsear))
+    except SinModelos:
+        return None
+
+def test_respuestas_ilegibles_no_abren_el_circuito():
+    llm = InterpreteLLM(respuesta(200), ["m"])
+    for _ in range(interprete.CIRCUITO_FALLOS + 2):
+        completar(llm, ilegible)
+    modelo = llm.modelos[0]
+    assert modelo.circuito.estado() == "cerrado"
+    assert modelo.estadisticas["invalidas"] == interprete.CIRCUITO_FALLOS + 2
+    assert modelo.estadisticas["fallos"] == 0
+
+@pytest.mark.parametrize("status, abre", [(503, True), (429, True), (400, False), (401, False)])
+def test_solo_errores_del_servicio_abren_el_circuito(status, abre):
+    llm = InterpreteLLM(respuesta(status), ["m"])
+    for _ in range(interprete.CIRCUITO_FALLOS):
+        completar(llm)
+    assert (llm.modelos[0].circuito.estado() == "abierto") is abre
+
+def test_prueba_cancelada_antes_de_arrancar_se_suelta():
+    async def lento(modelo, prompt, timeout, **opciones):
+        await asyncio.sleep(10)
+
+    async def correr():
+        llm = InterpreteLLM(lento, ["m"])
+        circuito = llm.modelos[0].circuito
+        circuito.fallos, circuito.abierto_hasta = circuito.umbral, 0  # semiabierto
+        tarea = asyncio.create_task(llm.completar("prompt", dict))
+        await asyncio.sleep(0)  # reservó la prueba; su tarea aún no corrió
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+        return circuito
+
+    assert asyncio.run(correr()).estado() == "semiabierto"
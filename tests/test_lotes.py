@@ -0,0 +1,27 @@
+"""
+Micro-lotes del modelo: la tarea de cada lote queda referenciada hasta terminar.
+"""
+import asyncio
+
+from lotes import AgrupadorLLM
+
+def test_guarda_la_tarea_del_lote_hasta_terminar():
+    async def escenario():
+        soltar = asyncio.Event()
+
+        async def procesar_lote(textos):
+            await soltar.wait()
+            return [{"tipo": "info"} for _ in textos]
+
+        agrupador = AgrupadorLLM(procesar_lote, None, ventana_ms=1000, max_items=2)
+        pedidos = asyncio.gather(agrupador.interpretar("a"), agrupador.interpretar("b"))
+        await asyncio.sleep(0.01)
+        en_vuelo = len(agrupador._tareas)
+        soltar.set()
+        resultados = await pedidos
+        await asyncio.sleep(0)
+        return en_vuelo, resultados, len(agrupador._tareas)
+
+    en_vuelo, resultados, al_final = asyncio.run(escenario())
+    assert en_vuelo == 1 and al_final == 0
+    assert resultados == [{"tipo": "info"}, {"tipo": "info"}]
@@ -0,0 +1,66 @@
+"""
+Cobertura de índices (bench/planes.py) contra un mongod de verdad: falla si
+alguna consulta del bot hace COLLSCAN, ordena en memoria o examina demasiados
+documentos por documento devuelto. Usa MONGO_URI si responde; si no, levanta
+un mongod temporal con pymongo_inmemory; sin ninguno de los dos se salta.
+"""
+import os
+import sys
+
+import pymongo
+import pytest
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+from tests.conftest import RAIZ
+
+sys.path.insert(0, os.path.join(RAIZ, "bench"))
+import planes
+
+MOVIMIENTOS = int(os.getenv("PLANES_MOVIMIENTOS", "20000"))
+GRUPOS = int(os.getenv("PLANES_GRUPOS", "200"))
+
+@pytest.fixture(scope="module")
+def mongo_uri():
+    uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+    try:
+        pymongo.MongoClient(uri, serverSelectionTimeoutMS=1000).admin.command("ping")
+        yield uri
+        return
+    except PyMongoError:
+        pass
+    try:
+        from pymongo_inmemory import Mongod
+        from pymongo_inmemory.context import Context
+        mongod = Mongod(Context())
+        mongod.start()
+    except Exception as e:
+        pytest.skip(f"sin mongod: {uri} no responde y pymongo_inmemory no pudo levantar uno ({e!r})")
+    try:
+        yield mongod.connection_string
+    finally:
+        mongod.stop()
+
+@pytest.fixture(scope="module")
+def capturador():
+    cap = planes.Capturador()
+    monitoring.register(cap)  # solo lo ven los clientes creados después
+    return cap
+
+@pytest.mark.parametrize("app", ["main", "main-multisala"])
+def test_consultas_usan_indices(app, mongo_uri, capturador, monkeypatch):
+    import recursos
+
+    for clave, valor in {
+        "MONGO_URI": mongo_uri, "MONGO_TLS": "0", "BOT_TOKEN": planes.CLAVE, "EXPORT_PASS": planes.CLAVE,
+        "INTERP_CACHE_MONGO": "1", "OPENROUTER_MODELS": "planes/modelo", "MONGO_DB": "",
+    }.items():
+        monkeypatch.setenv(clave, valor)
+    monkeypatch.setattr(recursos, "_mongo_client", None)
+    filas = planes.revisar(app, capturador, f"telegram_gastos_planes_test_{app.replace('-', '_')}", MOVIMIENTOS, GRUPOS, 365, 10)
+    assert filas, "no se capturó ninguna consulta"
+    fallidas = [
+        f"{f['coleccion']}.{f['comando']} {f['forma']} ({', '.join(f['origenes'])}): {'; '.join(f['problemas'])} · {f['plan']}"
+        for f in filas if f["problemas"]
+    ]
+    assert not fallidas, "\n".join(fallidas)
@@ -0,0 +1,90 @@
+"""
+Ingesta por polling: el offset no espera a los updates lentos y los que fallan
+se reintentan desde el registro de idempotencia en vez de perderse.
+"""
+import asyncio
+
+import pytest
+
+import polling
+
+@pytest.fixture
+def m(cargar):
+    return cargar("main")
+
+def update(update_id: int, chat_id: int, texto: str = "reporte") -> dict:
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": texto}}
+
+async def esperar(condicion, segundos: float = 5):
+    async with asyncio.timeout(segundos):
+        while not condicion():
+            await asyncio.sleep(0.01)
+
+def estados(m) -> dict:
+    return {d["_id"]: (d["estado"], d.get("intentos")) for d in m.updates.find()}
+
+def test_offset_pasa_a_los_lentos(m):
+    m.telegram.updates = [update(1, 10), update(2, 11)]  # chats en workers distintos
+
+    async def escenario():
+        soltar = asyncio.Event()
+
+        async def atender(u):
+            if u["update_id"] == 1:
+                await soltar.wait()
+            return await m.atender_update(u)
+
+        lector = polling.LectorUpdates(m.BASE_URL, atender, m.registro_updates, workers=2)
+        tarea = asyncio.create_task(lector.correr(vaciar=True))
+        await esperar(lambda: lector.estadisticas["procesados"] == 1)
+        # El 1 sigue en curso pero Telegram ya no entrega ninguno de los dos
+        await esperar(lambda: not m.telegram.updates)
+        assert lector.offset() == 3 and lector.resumen()["en_curso"] == 1
+        soltar.set()
+        await tarea
+        return lector
+
+    lector = asyncio.run(escenario())
+    assert lector.estadisticas["procesados"] == 2
+    assert estados(m) == {1: ("hecho", 0), 2: ("hecho", 0)}
+
+def test_reintenta_los_que_fallan(m, monkeypatch):
+    procesar, fallar = m.procesar_update, {1}
+
+    async def falla_una_vez(body):
+        if body["update_id"] in fallar:
+            fallar.discard(body["update_id"])
+            raise RuntimeError("caída")
+        return await procesar(body)
+
+    monkeypatch.setattr(m, "procesar_update", falla_una_vez)
+    m.telegram.updates = [update(1, 10), update(2, 20)]
+    lector = polling.LectorUpdates(m.BASE_URL, m.atender_update, m.registro_updates)
+    asyncio.run(lector.correr(vaciar=True))
+
+    assert lector.estadisticas["errores"] == 1 and lector.estadisticas["reintentados"] == 1
+    assert lector.estadisticas["procesados"] == 2
+    assert estados(m) == {1: ("hecho", 1), 2: ("hecho", 0)}
+    assert len(m.telegram.enviados) == 2
+
+def test_descarta_tras_agotar_intentos(m, monkeypatch):
+    async def siempre_falla(body):
+        raise RuntimeError("caída")
+
+    monkeypatch.setattr(m, "procesar_update", siempre_falla)
+    monkeypatch.setattr(m.registro_updates, "intentos", 3)
+    m.telegram.updates = [update(1, 10)]
+    lector = polling.LectorUpdates(m.BASE_URL, m.atender_update, m.registro_updates)
+    asyncio.run(lector.correr(vaciar=True))
+
+    assert lector.estadisticas["errores"] == 3
+    assert m.registro_updates.estadisticas["descartados"] == 1
+    assert estados(m) == {1: ("pendiente", 3)}
+
+def test_retoma_pendientes_de_otra_ejecucion(m):
+    asyncio.run(m.registro_updates.guardar_pendientes([update(7, 10)]))
+    lector = polling.LectorUpdates(m.BASE_URL, m.atender_update, m.registro_updates)
+    asyncio.run(lector.correr(vaciar=True))
+
+    assert lector.estadisticas["reintentados"] == 1 and lector.estadisticas["procesados"] == 1
+    assert estados(m) == {7: ("hecho", 0)}
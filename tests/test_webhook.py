@@ -0,0 +1,35 @@
+"""
+Reenvíos de Telegram al webhook: mientras el original sigue en proceso se
+responde sin 2xx para que Telegram reintente; cuando terminó, con su resultado.
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.mark.parametrize("app", ["main", "main-multisala"])
+def test_reenvio_en_proceso(cargar, app):
+    m = cargar(app)
+    body = {"update_id": 40, "message": {"chat": {"id": 5}, "text": "hola"}}
+    with TestClient(m.app) as cliente:  # al cerrar se descarta el Mongo en memoria
+        # Otro worker lo reclamó y sigue procesándolo
+        m.updates.insert_one({"_id": 40, "estado": "procesando", "fecha": datetime.utcnow()})
+        r = cliente.post(f"/{m.TOKEN}", json=body)
+        assert r.status_code == 503
+
+        # Terminó allí: este worker lo relee aunque en su memoria figure en proceso
+        m.updates.update_one({"_id": 40}, {"$set": {"estado": "hecho", "resultado": {"respuesta": "listo"}}})
+        r = cliente.post(f"/{m.TOKEN}", json=body)
+        assert r.status_code == 200
+        assert r.json() == {"ok": True, "duplicado": True, "resultado": {"respuesta": "listo"}}
+
+def test_reenvio_tras_fallo_se_procesa(cargar):
+    m = cargar("main")
+    body = {"update_id": 41, "message": {"chat": {"id": 5}, "text": "hola"}}
+    with TestClient(m.app) as cliente:
+        assert asyncio.run(m.reclamar_update(body)) == (True, None)
+        assert cliente.post(f"/{m.TOKEN}", json=body).status_code == 503
+        asyncio.run(m.registro_updates.liberar(41))  # falló antes de escribir
+        r = cliente.post(f"/{m.TOKEN}", json=body)
+        assert r.status_code == 200 and "duplicado" not in r.json()